@@ -0,0 +1,179 @@
+"""
+Índice de ciudades para el autocompletado.
+
+Se construye una vez (al arrancar) a partir de una fuente intercambiable: la lista
+incluida, o un archivo con el catálogo completo de localidades (CITY_SOURCE_PATH,
+p. ej. el de INEGI). Las claves se normalizan sin acentos ni mayúsculas, así
+"queretaro" encuentra "Querétaro".
+
+Búsqueda:
+  - prefijo del nombre completo o de cualquier palabra: bisect sobre claves ordenadas;
+  - infijo (desde 3 caracteres): intersección de listas de trigramas.
+Ranking: prefijo del nombre > prefijo de palabra > infijo; luego población (peso) y nombre.
+"""
+import bisect
+import csv
+import logging
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CITY_SOURCE_PATH = os.getenv("CITY_SOURCE_PATH")
+CITY_SEARCH_DEFAULT_LIMIT = 10
+
+# Ciudades principales de México (fuente por defecto)
+CIUDADES_MEXICO = [
+    "Aguascalientes", "Campeche", "Cancún", "Celaya", "Chetumal", "Chihuahua",
+    "Ciudad de México", "Ciudad Juárez", "Ciudad Victoria", "Colima", "Cuernavaca",
+    "Culiacán", "Durango", "Ensenada", "Guadalajara", "Guanajuato", "Hermosillo",
+    "Irapuato", "La Paz", "León", "Los Mochis", "Manzanillo", "Matamoros",
+    "Mazatlán", "Mérida", "Mexicali", "Monterrey", "Morelia", "Nogales",
+    "Nuevo Laredo", "Oaxaca", "Pachuca", "Playa del Carmen", "Puebla", "Puerto Vallarta",
+    "Querétaro", "Reynosa", "Saltillo", "San Luis Potosí", "San Miguel de Allende",
+    "Tampico", "Tapachula", "Tepic", "Tijuana", "Toluca", "Torreón", "Tuxtla Gutiérrez",
+    "Uruapan", "Veracruz", "Villahermosa", "Zacatecas"
+]
+
+# Una fuente devuelve pares (nombre, peso); a mayor peso, más arriba en empates
+CitySource = Callable[[], Iterable[Tuple[str, float]]]
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+RANK_NAME_PREFIX = 0
+RANK_WORD_PREFIX = 1
+RANK_INFIX = 2
+
+
+def fold(value: str) -> str:
+    """Clave normalizada: sin diacríticos, minúsculas y solo letras/dígitos separados por un espacio"""
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(" ", stripped.casefold()).strip()
+
+
+def _trigrams(key: str) -> Set[str]:
+    return {key[index:index + 3] for index in range(len(key) - 2)}
+
+
+def static_city_source(names: Iterable[str]) -> CitySource:
+    names = list(names)
+    return lambda: ((name, 0.0) for name in names)
+
+
+def file_city_source(path: str) -> CitySource:
+    """
+    Archivo de texto (una localidad por línea) o CSV con encabezado que incluya
+    nombre/name y opcionalmente poblacion/population como peso.
+    """
+    def load() -> Iterable[Tuple[str, float]]:
+        with open(path, encoding="utf-8-sig", newline="") as handle:
+            first_line = handle.readline()
+            handle.seek(0)
+            if "," not in first_line and ";" not in first_line:
+                for line in handle:
+                    if line.strip():
+                        yield line.strip(), 0.0
+                return
+
+            dialect = csv.Sniffer().sniff(first_line)
+            reader = csv.DictReader(handle, dialect=dialect)
+            fields = {name.strip().lower(): name for name in reader.fieldnames or []}
+            name_field = fields.get("nombre") or fields.get("name") or (reader.fieldnames or [None])[0]
+            weight_field = fields.get("poblacion") or fields.get("población") or fields.get("population")
+            for row in reader:
+                name = (row.get(name_field) or "").strip()
+                if not name:
+                    continue
+                try:
+                    weight = float(row.get(weight_field) or 0) if weight_field else 0.0
+                except ValueError:
+                    weight = 0.0
+                yield name, weight
+
+    return load
+
+
+class CityIndex:
+    def __init__(self, entries: Iterable[Tuple[str, float]]):
+        weights: Dict[str, float] = {}
+        for name, weight in entries:
+            name = " ".join(name.split())
+            if name:
+                weights[name] = max(weight, weights.get(name, weight))
+
+        self.names: List[str] = sorted(weights, key=lambda name: (fold(name), name))
+        self.weights: List[float] = [weights[name] for name in self.names]
+        self.folded: List[str] = [fold(name) for name in self.names]
+        self._by_key: Dict[str, int] = {key: position for position, key in enumerate(self.folded)}
+
+        # (clave desde el inicio de cada palabra, id, es inicio del nombre)
+        word_keys = []
+        for position, key in enumerate(self.folded):
+            offset = 0
+            for word in key.split(" "):
+                word_keys.append((key[offset:], position, offset == 0))
+                offset += len(word) + 1
+        word_keys.sort()
+        self._word_keys = [item[0] for item in word_keys]
+        self._word_entries = [(item[1], item[2]) for item in word_keys]
+
+        trigram_postings: Dict[str, List[int]] = {}
+        for position, key in enumerate(self.folded):
+            for trigram in _trigrams(key):
+                trigram_postings.setdefault(trigram, []).append(position)
+        self._trigrams = trigram_postings
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def canonical(self, name: str) -> Optional[str]:
+        """Nombre tal como está en el catálogo, o None si no existe"""
+        position = self._by_key.get(fold(name))
+        return self.names[position] if position is not None else None
+
+    def search(self, query: str, limit: int = CITY_SEARCH_DEFAULT_LIMIT) -> List[str]:
+        key = fold(query)
+        if not key:
+            return []
+
+        ranks: Dict[int, int] = {}
+
+        start = bisect.bisect_left(self._word_keys, key)
+        end = bisect.bisect_left(self._word_keys, key + "\uffff", lo=start)
+        for position, is_name_start in self._word_entries[start:end]:
+            rank = RANK_NAME_PREFIX if is_name_start else RANK_WORD_PREFIX
+            if rank < ranks.get(position, RANK_INFIX + 1):
+                ranks[position] = rank
+
+        # Infijos solo si los prefijos no llenan el límite
+        if len(ranks) < limit and len(key) >= 3:
+            postings = sorted((self._trigrams.get(trigram, []) for trigram in _trigrams(key)), key=len)
+            if postings and postings[0]:
+                candidates = set(postings[0])
+                for posting in postings[1:]:
+                    candidates.intersection_update(posting)
+                    if not candidates:
+                        break
+                for position in candidates:
+                    if position not in ranks and key in self.folded[position]:
+                        ranks[position] = RANK_INFIX
+
+        best = sorted(ranks.items(), key=lambda item: (item[1], -self.weights[item[0]], item[0]))[:limit]
+        return [self.names[position] for position, _ in best]
+
+
+def default_city_source() -> CitySource:
+    if CITY_SOURCE_PATH:
+        return file_city_source(CITY_SOURCE_PATH)
+    return static_city_source(CIUDADES_MEXICO)
+
+
+@lru_cache(maxsize=1)
+def get_city_index() -> CityIndex:
+    index = CityIndex(default_city_source()())
+    logger.info("Índice de ciudades cargado: %s entradas", len(index))
+    return index
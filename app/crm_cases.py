@@ -0,0 +1,387 @@
+"""
+Índice materializado de casos CRM (tabla crm_cases).
+
+Por cada reservación hay un caso de operación (OPS-xxxxx) y uno por cada ticket de
+soporte (TCK-xxxxx). Prioridad, estatus de reembolso, vencimiento de pago y SLA se
+calculan al escribir, no en cada lectura del panel:
+
+- cualquier flush que toque reservaciones, pagos, facturas, tickets o usuarios
+  recalcula los casos de esas reservaciones en la misma transacción;
+- los UPDATE masivos (ciclo de vida de reservaciones) llaman a refresh_crm_cases;
+- el barrido periódico marca el SLA vencido y los pagos que cruzan el umbral.
+"""
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, case, delete, event, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.db_models import CrmCase, Invoice, Payment, Reservation, SupportTicket, User
+from app.scheduler import LeasedJob
+from app.table_versions import bump_table_versions
+
+logger = logging.getLogger(__name__)
+
+PAID_RESERVATION_STATUS = {"confirmed", "in_progress", "completed"}
+ACCEPTED_PAYMENT_STATUS = {"accepted"}
+REFUNDED_PAYMENT_STATUS = {"refunded", "reimbursed"}
+ACTIVE_RESERVATION_STATUS = {"pending", "confirmed", "in_progress"}
+PAYMENT_ALERT_RESERVATION_STATUS = {"pending"}
+PAYMENT_ALERT_THRESHOLD_DAYS = 45
+CRM_SLA_HOURS = 48
+
+CRM_SWEEP_INTERVAL_SECONDS = float(os.getenv("CRM_SWEEP_INTERVAL_SECONDS", "300"))
+CRM_REFRESH_BATCH_SIZE = 500
+
+# Modelos cuyo cambio afecta los casos de su reservación
+_RESERVATION_CHILDREN = (Payment, Invoice, SupportTicket)
+
+
+def to_utc_datetime(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def normalize_status(status: Optional[str]) -> str:
+    return (status or "").strip().lower()
+
+
+def normalize_case_status(status: Optional[str]) -> str:
+    normalized = normalize_status(status)
+    if normalized in {"open", "abierto", "pending", "pendiente"}:
+        return "abierto"
+    if normalized in {"closed", "cerrado", "resolved", "resuelto"}:
+        return "cerrado"
+    return normalized or "abierto"
+
+
+def infer_refund_status(reservation_status: str, payment_status: str, is_paid: bool) -> str:
+    if payment_status in REFUNDED_PAYMENT_STATUS:
+        return "reembolsado"
+    if reservation_status == "cancelled" and is_paid:
+        return "pendiente"
+    return "no_aplica"
+
+
+def _sla_fields(case_status: str, last_update: Optional[datetime], now: datetime) -> dict:
+    if case_status != "abierto" or last_update is None:
+        return {"sla_due_at": None, "sla_at_risk": False}
+    due_at = last_update + timedelta(hours=CRM_SLA_HOURS)
+    return {"sla_due_at": due_at, "sla_at_risk": now >= due_at}
+
+
+def build_reservation_cases(reservation, tickets: List, now: datetime) -> List[dict]:
+    """Casos de una reservación (fila unida con usuario, pago y factura) y sus tickets"""
+    reservation_status = normalize_status(reservation.status)
+    payment_status = normalize_status(reservation.payment_status)
+    created_at = to_utc_datetime(reservation.created_at)
+    payment_alert_cutoff = now - timedelta(days=PAYMENT_ALERT_THRESHOLD_DAYS)
+    payment_due_at = created_at + timedelta(days=PAYMENT_ALERT_THRESHOLD_DAYS) if created_at else None
+    amount = reservation.total_price or 0
+    folio = reservation.folio or f"VT-{reservation.id:04d}"
+
+    common = {
+        "reservation_id": reservation.id,
+        "client": reservation.full_name or "Sin cliente",
+        "reservation_status": reservation_status or "pending",
+        "channel": reservation.pickup_location or "-",
+        "amount": amount,
+        "invoice_number": reservation.invoice_number,
+        "reservation_created_at": created_at,
+    }
+    cases = []
+
+    for ticket in tickets:
+        is_paid = payment_status in ACCEPTED_PAYMENT_STATUS or reservation_status in PAID_RESERVATION_STATUS
+        refund_status = infer_refund_status(reservation_status, payment_status, is_paid)
+        case_status = normalize_case_status(ticket.status)
+        issue_type = normalize_status(ticket.issue_type) or "general"
+        last_update = to_utc_datetime(ticket.updated_at) or to_utc_datetime(ticket.created_at)
+
+        priority = "media"
+        if issue_type in {"reembolso", "refund", "cancelacion", "cancelación"}:
+            priority = "alta"
+        if refund_status == "pendiente":
+            priority = "alta"
+
+        cases.append({
+            **common,
+            "case_key": f"TCK-{ticket.id:05d}",
+            "source": "ticket",
+            "ticket_id": ticket.id,
+            "folio": ticket.folio or folio,
+            "email": ticket.contact_email or reservation.email,
+            "phone": ticket.contact_phone or reservation.phone,
+            "case_type": f"Ticket cliente: {issue_type}",
+            "priority": priority,
+            "status": case_status,
+            "refund_status": refund_status,
+            "message": ticket.message,
+            "last_update": last_update,
+            "hidden": False,
+            "payment_alert": False,
+            "recheck_at": None,
+            **_sla_fields(case_status, last_update, now),
+        })
+
+    # Caso de operación: siempre existe para seguir la alerta de pago; se oculta del
+    # panel si la reservación ya tiene tickets o no requiere seguimiento
+    is_paid = payment_status in ACCEPTED_PAYMENT_STATUS or (
+        not reservation.payment_id and reservation_status in PAID_RESERVATION_STATUS
+    )
+    overdue = bool(created_at and created_at <= payment_alert_cutoff)
+    last_update = to_utc_datetime(reservation.updated_at) or created_at
+
+    case_type = None
+    priority = "media"
+    case_status = "abierto"
+    refund_status = infer_refund_status(reservation_status, payment_status, is_paid)
+
+    if reservation_status == "cancelled":
+        case_type = "Cancelacion o reembolso"
+        priority = "alta" if refund_status == "pendiente" else "media"
+        case_status = "abierto" if refund_status == "pendiente" else "cerrado"
+    elif overdue and not is_paid:
+        case_type = "Pago vencido"
+        priority = "alta"
+    elif reservation_status in ACTIVE_RESERVATION_STATUS:
+        case_type = "Seguimiento de reserva"
+
+    payment_alert = (
+        overdue
+        and reservation_status in PAYMENT_ALERT_RESERVATION_STATUS
+        and payment_status not in ACCEPTED_PAYMENT_STATUS
+    )
+    # El caso cambia solo con el tiempo cuando la reservación cruza el umbral de pago
+    could_become_overdue = reservation_status != "cancelled" and (
+        not is_paid
+        or (reservation_status in PAYMENT_ALERT_RESERVATION_STATUS and payment_status not in ACCEPTED_PAYMENT_STATUS)
+    )
+    recheck_at = payment_due_at if (payment_due_at and not overdue and could_become_overdue) else None
+
+    cases.append({
+        **common,
+        "case_key": f"OPS-{reservation.id:05d}",
+        "source": "operacion",
+        "ticket_id": None,
+        "folio": folio,
+        "email": reservation.email,
+        "phone": reservation.phone,
+        "case_type": case_type or "Sin seguimiento",
+        "priority": priority,
+        "status": case_status,
+        "refund_status": refund_status,
+        "message": reservation.admin_notes or reservation.notes or "Sin notas adicionales.",
+        "last_update": last_update,
+        "hidden": bool(tickets) or case_type is None,
+        "payment_alert": payment_alert,
+        "recheck_at": recheck_at,
+        **_sla_fields(case_status, last_update, now),
+    })
+    return cases
+
+
+def crm_case_to_dict(case: CrmCase) -> dict:
+    """Forma pública de un caso (la que consume el panel CRM)"""
+    return {
+        "case_id": case.case_key,
+        "ticket_id": case.ticket_id,
+        "source": case.source,
+        "reservation_id": case.reservation_id,
+        "folio": case.folio,
+        "client": case.client,
+        "email": case.email,
+        "phone": case.phone,
+        "case_type": case.case_type,
+        "priority": case.priority,
+        "status": case.status,
+        "reservation_status": case.reservation_status,
+        "refund_status": case.refund_status,
+        "channel": case.channel,
+        "amount": float(case.amount or 0),
+        "invoice_number": case.invoice_number,
+        "message": case.message,
+        "last_update": to_utc_datetime(case.last_update),
+        "sla_at_risk": case.sla_at_risk,
+    }
+
+
+def refresh_crm_cases(session: Session, reservation_ids: Iterable[int]) -> None:
+    """Recalcula (borra e inserta) los casos de las reservaciones dadas en la transacción actual"""
+    ids = sorted({reservation_id for reservation_id in reservation_ids if reservation_id is not None})
+    if not ids:
+        return
+
+    conn = session.connection()
+    now = datetime.now(timezone.utc)
+    reservations = Reservation.__table__
+    users = User.__table__
+    payments = Payment.__table__
+    invoices = Invoice.__table__
+    tickets = SupportTicket.__table__
+    cases = CrmCase.__table__
+
+    for start in range(0, len(ids), CRM_REFRESH_BATCH_SIZE):
+        chunk = ids[start:start + CRM_REFRESH_BATCH_SIZE]
+
+        rows = conn.execute(
+            select(
+                reservations.c.id,
+                reservations.c.folio,
+                reservations.c.status,
+                reservations.c.total_price,
+                reservations.c.pickup_location,
+                reservations.c.notes,
+                reservations.c.admin_notes,
+                reservations.c.created_at,
+                reservations.c.updated_at,
+                users.c.full_name,
+                users.c.email,
+                users.c.phone,
+                payments.c.id.label("payment_id"),
+                payments.c.status.label("payment_status"),
+                invoices.c.invoice_number,
+            )
+            .select_from(
+                reservations
+                .outerjoin(users, users.c.id == reservations.c.user_id)
+                .outerjoin(payments, payments.c.reservation_id == reservations.c.id)
+                .outerjoin(invoices, invoices.c.reservation_id == reservations.c.id)
+            )
+            .where(reservations.c.id.in_(chunk))
+        ).all()
+
+        tickets_by_reservation: Dict[int, List] = {}
+        for ticket in conn.execute(
+            select(tickets).where(tickets.c.reservation_id.in_(chunk)).order_by(tickets.c.id)
+        ):
+            tickets_by_reservation.setdefault(ticket.reservation_id, []).append(ticket)
+
+        new_cases = []
+        for row in rows:
+            new_cases.extend(build_reservation_cases(row, tickets_by_reservation.get(row.id, []), now))
+
+        conn.execute(delete(cases).where(cases.c.reservation_id.in_(chunk)))
+        if new_cases:
+            conn.execute(insert(cases), new_cases)
+
+    bump_table_versions(session, [CrmCase.__tablename__])
+
+
+# --- Mantenimiento automático en cada flush ---
+
+@event.listens_for(Session, "after_flush")
+def _collect_crm_reservations(session: Session, flush_context) -> None:
+    reservation_ids = session.info.setdefault("crm_reservation_ids", set())
+    user_ids = session.info.setdefault("crm_user_ids", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Reservation):
+            reservation_ids.add(obj.id)
+        elif isinstance(obj, _RESERVATION_CHILDREN):
+            reservation_ids.add(obj.reservation_id)
+        elif isinstance(obj, User) and obj in session.dirty:
+            # Nombre, email o teléfono del cliente se copian en sus casos
+            user_ids.add(obj.id)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _refresh_crm_reservations(session: Session, flush_context) -> None:
+    reservation_ids = session.info.pop("crm_reservation_ids", set())
+    user_ids = session.info.pop("crm_user_ids", set())
+    if user_ids:
+        reservation_ids.update(session.connection().execute(
+            select(Reservation.__table__.c.id).where(Reservation.__table__.c.user_id.in_(user_ids))
+        ).scalars())
+    if reservation_ids:
+        refresh_crm_cases(session, reservation_ids)
+
+
+# --- Barrido periódico y carga inicial ---
+
+def sweep_crm_cases(db: Session) -> Dict[str, int]:
+    now = datetime.now(timezone.utc)
+
+    # Casos que cambian con el tiempo: reservaciones que cruzan el umbral de pago
+    refreshed = 0
+    while True:
+        ids = db.execute(
+            select(CrmCase.reservation_id)
+            .where(CrmCase.recheck_at <= now)
+            .limit(CRM_REFRESH_BATCH_SIZE)
+        ).scalars().all()
+        if not ids:
+            break
+        refresh_crm_cases(db, ids)
+        db.commit()
+        refreshed += len(ids)
+
+    # SLA vencido en casos abiertos
+    result = db.execute(
+        update(CrmCase)
+        .where(CrmCase.status == "abierto", CrmCase.sla_at_risk == False, CrmCase.sla_due_at <= now)
+        .values(sla_at_risk=True)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        bump_table_versions(db, [CrmCase.__tablename__])
+    db.commit()
+
+    return {"refreshed": refreshed, "sla_at_risk": result.rowcount}
+
+
+crm_sweep_job = LeasedJob("crm-sweep", sweep_crm_cases, CRM_SWEEP_INTERVAL_SECONDS)
+
+
+def ensure_crm_cases() -> None:
+    """Llena crm_cases a partir de los datos existentes si la tabla está vacía"""
+    db = SessionLocal()
+    try:
+        if db.query(CrmCase.id).first() is not None:
+            return
+
+        last_id = 0
+        while True:
+            ids = db.execute(
+                select(Reservation.id)
+                .where(Reservation.id > last_id)
+                .order_by(Reservation.id)
+                .limit(CRM_REFRESH_BATCH_SIZE)
+            ).scalars().all()
+            if not ids:
+                break
+            refresh_crm_cases(db, ids)
+            db.commit()
+            last_id = ids[-1]
+    finally:
+        db.close()
+
+
+def count_crm_cases(db: Session) -> Dict[str, int]:
+    """Totales del panel CRM sobre los casos visibles (una sola consulta agregada)"""
+    is_open = CrmCase.status == "abierto"
+
+    def count_where(condition):
+        return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+    row = db.execute(
+        select(
+            func.count(),
+            count_where(is_open),
+            count_where(and_(is_open, CrmCase.priority == "alta")),
+            count_where(and_(is_open, CrmCase.refund_status == "pendiente")),
+            count_where(and_(is_open, CrmCase.sla_at_risk == True)),
+        ).where(CrmCase.hidden == False)
+    ).one()
+    return {
+        "total_cases": row[0],
+        "open_cases": row[1],
+        "high_priority": row[2],
+        "refund_pending": row[3],
+        "sla_at_risk": row[4],
+    }
@@ -0,0 +1,109 @@
+"""
+Búsqueda de texto completo sobre los casos CRM (tickets y reservaciones).
+
+El índice es una tabla FTS5 (crm_search) con el mismo rowid que crm_cases. Los
+triggers de SQLite la mantienen al día en cada INSERT/DELETE/UPDATE de crm_cases,
+así que crear un ticket (que recalcula sus casos, ver app/crm_cases.py) lo deja
+buscable en la misma transacción.
+"""
+import re
+from typing import List, Optional
+
+from sqlalchemy import column, literal_column, select, table, text
+from sqlalchemy.orm import Session
+
+from app.crm_cases import crm_case_to_dict
+from app.db import engine
+from app.db_models import CrmCase
+
+CRM_SEARCH_MAX_TERMS = 8
+SEARCH_TERM_REGEX = re.compile(r"\w+", re.UNICODE)
+
+crm_search_table = table("crm_search", column("rowid"))
+
+# Teléfono también como solo dígitos (completo y últimos 10, sin lada internacional)
+# para buscar "8112345678" contra "+52 (81) 1234-5678"
+_PHONE_DIGITS = (
+    "replace(replace(replace(replace(replace(replace(coalesce({row}.phone, ''),"
+    " ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', '')"
+)
+
+
+def _search_values(row: str) -> str:
+    return (
+        f"{row}.id, {row}.case_key, {row}.folio, {row}.client, {row}.email,"
+        f" coalesce({row}.phone, '') || ' ' || {_PHONE_DIGITS.format(row=row)}"
+        f" || ' ' || substr({_PHONE_DIGITS.format(row=row)}, -10), {row}.message"
+    )
+
+
+CRM_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS crm_search USING fts5(
+        case_key, folio, client, email, phone, message,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS crm_search_ai AFTER INSERT ON crm_cases BEGIN
+        INSERT INTO crm_search (rowid, case_key, folio, client, email, phone, message)
+        VALUES ({_search_values("new")});
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS crm_search_ad AFTER DELETE ON crm_cases BEGIN
+        DELETE FROM crm_search WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS crm_search_au
+    AFTER UPDATE OF case_key, folio, client, email, phone, message ON crm_cases BEGIN
+        DELETE FROM crm_search WHERE rowid = old.id;
+        INSERT INTO crm_search (rowid, case_key, folio, client, email, phone, message)
+        VALUES ({_search_values("new")});
+    END
+    """,
+]
+
+# Pesos bm25 por columna: identificadores y datos de contacto antes que el mensaje
+CRM_SEARCH_RANK = "bm25(crm_search, 10.0, 10.0, 5.0, 5.0, 5.0, 1.0)"
+
+
+def ensure_crm_search_index() -> None:
+    """Crea la tabla FTS5 y sus triggers; la llena desde crm_cases si está vacía"""
+    with engine.begin() as conn:
+        for statement in CRM_SEARCH_DDL:
+            conn.execute(text(statement))
+
+        if conn.execute(text("SELECT 1 FROM crm_search LIMIT 1")).first() is None:
+            conn.execute(text(
+                "INSERT INTO crm_search (rowid, case_key, folio, client, email, phone, message) "
+                f"SELECT {_search_values('crm_cases')} FROM crm_cases"
+            ))
+
+
+def build_match_query(raw: str) -> Optional[str]:
+    """Cada término como prefijo entre comillas (sin operadores FTS del usuario), unidos con AND"""
+    terms = SEARCH_TERM_REGEX.findall(raw or "")[:CRM_SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_crm_cases(db: Session, query: str, limit: int = 20, source: Optional[str] = None) -> List[dict]:
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    stmt = (
+        select(CrmCase, literal_column("snippet(crm_search, 5, '[', ']', '…', 12)").label("snippet"))
+        .join(crm_search_table, crm_search_table.c.rowid == CrmCase.id)
+        .where(text("crm_search MATCH :match").bindparams(match=match))
+        .order_by(text(CRM_SEARCH_RANK))
+        .limit(limit)
+    )
+    if source:
+        stmt = stmt.where(CrmCase.source == source)
+
+    return [{**crm_case_to_dict(case), "snippet": snippet} for case, snippet in db.execute(stmt).all()]
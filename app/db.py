@@ -28,6 +28,43 @@ def ensure_user_role_column() -> None:
             )
             conn.commit()
 
+INVOICE_DOCUMENT_COLUMNS = {
+    "document_status": "VARCHAR(20) NOT NULL DEFAULT 'pending'",
+    "pdf_path": "VARCHAR(255)",
+    "xml_path": "VARCHAR(255)",
+    "rendered_at": "DATETIME",
+    "render_attempts": "INTEGER NOT NULL DEFAULT 0",
+    "render_error": "VARCHAR(500)",
+}
+
+def ensure_invoice_document_columns() -> None:
+    """Agrega a invoices las columnas de los documentos generados; las facturas existentes quedan pendientes."""
+    with engine.connect() as conn:
+        columns = conn.execute(text("PRAGMA table_info(invoices)")).fetchall()
+        column_names = {column[1] for column in columns}
+
+        for name, definition in INVOICE_DOCUMENT_COLUMNS.items():
+            if name not in column_names:
+                conn.execute(text(f"ALTER TABLE invoices ADD COLUMN {name} {definition}"))
+        conn.commit()
+
+def ensure_reservation_folio_column() -> None:
+    """Agrega reservations.folio; las reservaciones anteriores conservan su folio VT-<id>."""
+    with engine.connect() as conn:
+        columns = conn.execute(text("PRAGMA table_info(reservations)")).fetchall()
+        column_names = {column[1] for column in columns}
+
+        if "folio" not in column_names:
+            conn.execute(text("ALTER TABLE reservations ADD COLUMN folio VARCHAR(30)"))
+        conn.execute(text("UPDATE reservations SET folio = printf('VT-%04d', id) WHERE folio IS NULL"))
+        conn.commit()
+
+def ensure_indexes() -> None:
+    """create_all no agrega índices nuevos a tablas que ya existen; se crean aquí si faltan."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, Numeric, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, String, Date, DateTime, func, Numeric, ForeignKey, Text, Enum, Index
 from sqlalchemy.orm import relationship
 from .db import Base
 from sqlalchemy import Boolean
@@ -95,6 +95,23 @@ class Vehicle(Base):
     reservations = relationship("Reservation", back_populates="vehicle")
 
 
+class VehicleFeature(Base):
+    """
+    Características de cada vehículo, una fila por clave activa de Vehicle.features.
+    Se mantiene sincronizada desde app/vehicle_features.py; sirve para filtrar
+    ("ac" Y "gps") sin leer ni parsear el JSON de toda la flota.
+    """
+    __tablename__ = "vehicle_features"
+
+    vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), primary_key=True)
+    feature = Column(String(50), primary_key=True)
+
+    __table_args__ = (
+        # Vehículos con una característica: feature = ? -> vehicle_id
+        Index("ix_vehicle_features_feature", "feature", "vehicle_id"),
+    )
+
+
 class ReservationStatus(str, enum.Enum):
     """Estados de la reservación"""
     PENDING = "pending"  # Pendiente de confirmación
@@ -109,6 +126,7 @@ class Reservation(Base):
     __tablename__ = "reservations"
 
     id = Column(Integer, primary_key=True, index=True)
+    folio = Column(String(30), nullable=True, unique=True, index=True)  # VT-0001, de la secuencia "reservation_folio"
     
     # Referencias
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
@@ -144,6 +162,11 @@ class Reservation(Base):
     invoice = relationship("Invoice", back_populates="reservation", uselist=False, cascade="all, delete-orphan")
     support_tickets = relationship("SupportTicket", back_populates="reservation", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Barrido del ciclo de vida: status IN (...) AND start_date/end_date <= ahora
+        Index("ix_reservations_status_dates", "status", "end_date", "start_date"),
+    )
+
 
 class Payment(Base):
     """Modelo de pagos registrados para reservaciones."""
@@ -179,6 +202,13 @@ class Invoice(Base):
     currency = Column(String(8), nullable=False, default="MXN")
     status = Column(String(30), nullable=False, default="generated", index=True)
     issued_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Documentos PDF/XML generados por app/invoicing.py (rutas relativas a INVOICE_STORAGE_DIR)
+    document_status = Column(String(20), nullable=False, default="pending", server_default="pending", index=True)
+    pdf_path = Column(String(255), nullable=True)
+    xml_path = Column(String(255), nullable=True)
+    rendered_at = Column(DateTime(timezone=True), nullable=True)
+    render_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    render_error = Column(String(500), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
 
@@ -204,6 +234,84 @@ class SupportTicket(Base):
     reservation = relationship("Reservation", back_populates="support_tickets")
 
 
+class Promotion(Base):
+    """Promociones con vigencia por rango de fechas"""
+    __tablename__ = "promotions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    titulo = Column(String(200), nullable=False)
+    descripcion = Column(Text, nullable=False)
+    descuento = Column(Numeric(5, 2), nullable=False)  # Porcentaje 0-100
+    imagen_url = Column(String(500), nullable=True)
+    fecha_inicio = Column(Date, nullable=False)
+    fecha_fin = Column(Date, nullable=False)
+    activa = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
+
+    __table_args__ = (
+        # Búsqueda de promociones vigentes: activa = 1 AND fecha_inicio <= hoy AND fecha_fin >= hoy
+        Index("ix_promotions_active_range", "activa", "fecha_inicio", "fecha_fin"),
+    )
+
+
+class NewsletterSubscriber(Base):
+    """Suscriptores del newsletter (email normalizado en minúsculas)"""
+    __tablename__ = "newsletter_subscribers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String(254), unique=True, index=True, nullable=False)
+    active = Column(Boolean, default=True, nullable=False, index=True)
+    subscribed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    unsubscribed_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class NewsletterCampaign(Base):
+    """Campaña del newsletter; el worker de envío la procesa por lotes (ver app/newsletter_dispatch.py)"""
+    __tablename__ = "newsletter_campaigns"
+
+    id = Column(Integer, primary_key=True, index=True)
+    subject = Column(String(200), nullable=False)
+    body_text = Column(Text, nullable=False)
+    body_html = Column(Text, nullable=True)
+
+    # queued, sending, paused, completed
+    status = Column(String(20), nullable=False, default="queued", index=True)
+    retry_failed = Column(Boolean, default=False, nullable=False)  # Reintentar entregas fallidas en la próxima corrida
+
+    # Cursor de reanudación: último id de suscriptor ya procesado
+    last_subscriber_id = Column(Integer, nullable=False, default=0)
+    sent_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)
+
+    # Lease del worker que la está enviando (evita que dos procesos la tomen a la vez)
+    lease_owner = Column(String(64), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class NewsletterDelivery(Base):
+    """Estado del envío de una campaña a cada suscriptor"""
+    __tablename__ = "newsletter_deliveries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_id = Column(Integer, ForeignKey("newsletter_campaigns.id"), nullable=False)
+    subscriber_id = Column(Integer, nullable=False)
+    email = Column(String(254), nullable=False)
+    status = Column(String(20), nullable=False)  # sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String(500), nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ux_newsletter_deliveries_campaign_subscriber", "campaign_id", "subscriber_id", unique=True),
+        Index("ix_newsletter_deliveries_campaign_status", "campaign_id", "status"),
+    )
+
+
 class SavedPaymentMethod(Base):
     """Métodos de pago guardados por el usuario"""
     __tablename__ = "saved_payment_methods"
@@ -228,3 +336,69 @@ class SavedPaymentMethod(Base):
     
     # Relación
     user = relationship("User", back_populates="saved_payment_methods")
+
+
+class CrmCase(Base):
+    """Caso CRM materializado (uno por reservación y uno por ticket); ver app/crm_cases.py"""
+    __tablename__ = "crm_cases"
+
+    id = Column(Integer, primary_key=True, index=True)
+    case_key = Column(String(20), nullable=False, unique=True)  # TCK-00001 / OPS-00001
+    source = Column(String(20), nullable=False)  # ticket, operacion
+    reservation_id = Column(Integer, nullable=False, index=True)
+    ticket_id = Column(Integer, nullable=True)
+
+    folio = Column(String(30), nullable=False)
+    client = Column(String(120), nullable=False)
+    email = Column(String(120), nullable=True)
+    phone = Column(String(30), nullable=True)
+    case_type = Column(String(120), nullable=False)
+    priority = Column(String(10), nullable=False)  # alta, media
+    status = Column(String(20), nullable=False)  # abierto, cerrado
+    reservation_status = Column(String(50), nullable=False)
+    refund_status = Column(String(20), nullable=False)
+    channel = Column(String(200), nullable=True)
+    amount = Column(Numeric(10, 2), nullable=False)
+    invoice_number = Column(String(50), nullable=True)
+    message = Column(Text, nullable=True)
+
+    last_update = Column(DateTime(timezone=True), nullable=True)
+    reservation_created_at = Column(DateTime(timezone=True), nullable=True)
+    hidden = Column(Boolean, nullable=False, default=False)  # Fuera del panel (reservación con tickets o sin seguimiento)
+    payment_alert = Column(Boolean, nullable=False, default=False)
+    sla_due_at = Column(DateTime(timezone=True), nullable=True)
+    sla_at_risk = Column(Boolean, nullable=False, default=False)
+    recheck_at = Column(DateTime(timezone=True), nullable=True)  # Próximo cambio por tiempo (umbral de pago)
+
+    __table_args__ = (
+        Index("ix_crm_cases_listing", "hidden", "last_update"),
+        Index("ix_crm_cases_status_priority", "hidden", "status", "priority", "last_update"),
+        Index("ix_crm_cases_sla", "status", "sla_at_risk", "sla_due_at"),
+        Index("ix_crm_cases_payment_alert", "payment_alert", "reservation_created_at"),
+        Index("ix_crm_cases_recheck", "recheck_at"),
+    )
+
+
+class SchedulerLease(Base):
+    """Lease de tareas periódicas: solo el proceso dueño del lease ejecuta la tarea (ver app/scheduler.py)"""
+    __tablename__ = "scheduler_leases"
+
+    name = Column(String(64), primary_key=True)
+    owner = Column(String(128), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class TableVersion(Base):
+    """Contador de versión por tabla, incrementado en cada escritura (ver app/table_versions.py)"""
+    __tablename__ = "table_versions"
+
+    name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class SequenceCounter(Base):
+    """Último número entregado de cada secuencia; los procesos toman bloques (ver app/sequences.py)"""
+    __tablename__ = "sequence_counters"
+
+    name = Column(String(64), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
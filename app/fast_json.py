@@ -0,0 +1,42 @@
+"""
+Serialización JSON rápida (orjson) para endpoints de listas
+"""
+from decimal import Decimal
+from typing import Any, Optional
+
+import orjson
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+
+def _default(value: Any) -> Any:
+    # Igual que jsonable_encoder: Decimal -> número
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse que serializa con orjson. Los endpoints la devuelven directamente
+    con dicts ya proyectados, así FastAPI no pasa el payload por jsonable_encoder
+    ni vuelve a validar el response_model.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def fast_json_response(content: Any, response: Optional[Response] = None, status_code: int = 200) -> FastJSONResponse:
+    """Construye la respuesta conservando los headers ya puestos en `response` (p. ej. ETag)"""
+    headers = dict(response.headers) if response is not None else None
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
+
+
+def decimal_str(value: Any) -> Optional[str]:
+    """Decimal como string, igual que lo serializa Pydantic en los modelos de salida"""
+    if value is None:
+        return None
+    return str(value)
@@ -0,0 +1,151 @@
+"""
+Sondas de salud (liveness / readiness) compartidas por las apps SQL y MongoDB
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi.responses import JSONResponse
+
+HEALTH_DB_TIMEOUT_SECONDS = float(os.getenv("HEALTH_DB_TIMEOUT_SECONDS", "2"))
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "2"))
+HEALTH_MAX_LOOP_LAG_MS = float(os.getenv("HEALTH_MAX_LOOP_LAG_MS", "250"))
+HEALTH_MAX_POOL_USAGE = float(os.getenv("HEALTH_MAX_POOL_USAGE", "0.9"))
+
+
+async def measure_loop_lag() -> float:
+    """Mide (en ms) cuánto tarda el event loop en atender un callback listo"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await asyncio.sleep(0)
+    return (loop.time() - started) * 1000
+
+
+def sql_pool_status(engine) -> Dict[str, Any]:
+    """Uso del pool de conexiones de SQLAlchemy (si el pool lo expone)"""
+    pool = engine.pool
+    size = pool.size() if hasattr(pool, "size") else None
+    checked_out = pool.checkedout() if hasattr(pool, "checkedout") else None
+    overflow = pool.overflow() if hasattr(pool, "overflow") else None
+    max_overflow = getattr(pool, "_max_overflow", 0) or 0
+
+    usage = None
+    if size and checked_out is not None:
+        capacity = size + max(0, max_overflow)
+        usage = round(checked_out / capacity, 3) if capacity > 0 else None
+
+    return {
+        "size": size,
+        "checked_out": checked_out,
+        "overflow": overflow,
+        "usage": usage,
+    }
+
+
+def build_sql_check(engine) -> Callable[[], Awaitable[Dict[str, Any]]]:
+    """Crea la verificación de conectividad para la base SQL"""
+    from sqlalchemy import text
+
+    def ping() -> None:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    async def check() -> Dict[str, Any]:
+        await asyncio.wait_for(asyncio.to_thread(ping), timeout=HEALTH_DB_TIMEOUT_SECONDS)
+        return {"pool": sql_pool_status(engine)}
+
+    return check
+
+
+def build_mongo_check() -> Callable[[], Awaitable[Dict[str, Any]]]:
+    """Crea la verificación de conectividad para MongoDB"""
+
+    async def check() -> Dict[str, Any]:
+        from app import mongodb
+
+        if mongodb.mongodb_client is None:
+            raise RuntimeError("Cliente de MongoDB no inicializado")
+
+        await asyncio.wait_for(
+            mongodb.mongodb_client.admin.command("ping"),
+            timeout=HEALTH_DB_TIMEOUT_SECONDS,
+        )
+        return {"pool": mongodb.pool_metrics.snapshot()}
+
+    return check
+
+
+class ReadinessProbe:
+    """Evalúa si el worker puede recibir tráfico y cachea el resultado unos segundos"""
+
+    def __init__(self, database: str, check_database: Callable[[], Awaitable[Dict[str, Any]]]):
+        self.database = database
+        self.check_database = check_database
+        self._cached: Optional[Dict[str, Any]] = None
+        self._cached_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _evaluate(self) -> Dict[str, Any]:
+        checks: Dict[str, Any] = {}
+        ready = True
+
+        started = time.perf_counter()
+        try:
+            details = await self.check_database()
+            checks["database"] = {
+                "status": "ok",
+                "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+                **details,
+            }
+        except asyncio.TimeoutError:
+            ready = False
+            checks["database"] = {"status": "timeout", "timeout_s": HEALTH_DB_TIMEOUT_SECONDS}
+        except Exception as e:
+            ready = False
+            checks["database"] = {"status": "error", "error": str(e)}
+
+        pool = (checks["database"].get("pool") or {})
+        usage = pool.get("usage")
+        if usage is not None and usage >= HEALTH_MAX_POOL_USAGE:
+            ready = False
+            checks["database"]["status"] = "saturated"
+
+        lag_ms = await measure_loop_lag()
+        loop_ok = lag_ms < HEALTH_MAX_LOOP_LAG_MS
+        ready = ready and loop_ok
+        checks["event_loop"] = {
+            "status": "ok" if loop_ok else "lagging",
+            "lag_ms": round(lag_ms, 2),
+        }
+
+        return {
+            "status": "ready" if ready else "not_ready",
+            "database": self.database,
+            "checks": checks,
+        }
+
+    async def result(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        if self._cached is not None and now - self._cached_at < HEALTH_CACHE_SECONDS:
+            return self._cached
+
+        async with self._lock:
+            # Otro request pudo refrescar el resultado mientras esperábamos el lock
+            now = time.monotonic()
+            if self._cached is not None and now - self._cached_at < HEALTH_CACHE_SECONDS:
+                return self._cached
+
+            self._cached = await self._evaluate()
+            self._cached_at = time.monotonic()
+            return self._cached
+
+    async def response(self) -> JSONResponse:
+        result = await self.result()
+        status_code = 200 if result["status"] == "ready" else 503
+        return JSONResponse(status_code=status_code, content=result)
+
+
+def liveness() -> Dict[str, str]:
+    """El proceso responde; no toca dependencias externas"""
+    return {"status": "alive"}
@@ -0,0 +1,158 @@
+"""
+Utilidades HTTP para respuestas JSON: ETag/If-None-Match y compresión gzip/brotli
+"""
+import gzip
+import hashlib
+import os
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+from app.static_assets import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él se comprime solo con gzip
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+# Las validaciones de los endpoints admin dependen también de la hora (SLA, totales del día)
+ADMIN_ETAG_WINDOW_SECONDS = 60
+
+
+# --- ETag / 304 ---
+
+def build_etag(request: Request, versions: Dict[str, int], extra: str = "") -> str:
+    """ETag débil a partir de la ruta, los query params y las versiones de las tablas leídas"""
+    parts = [request.url.path, str(sorted(request.query_params.multi_items()))]
+    parts.extend(f"{name}:{version}" for name, version in sorted(versions.items()))
+    parts.append(extra)
+    digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def conditional_response(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Agrega ETag a la respuesta; si el cliente ya tiene esa versión devuelve un 304
+    que el endpoint debe retornar sin construir el payload.
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+# --- Compresión ---
+
+def _header(headers, name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = accepted_encodings(accept_encoding)
+    wildcard = accepted.get("*", 0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    Comprime con brotli o gzip las respuestas de un solo bloque (JSON, HTML) que
+    superan COMPRESSION_MIN_BYTES. Las respuestas en streaming y las que ya traen
+    Content-Encoding (p. ej. assets precomprimidos) pasan sin tocar.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = _header(scope.get("headers", []), b"accept-encoding")
+        encoding = choose_encoding(accept.decode("latin-1")) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = start_message["headers"]
+            content_type = (_header(headers, b"content-type") or b"").decode("latin-1")
+
+            if (
+                more_body
+                or len(body) < self.minimum_size
+                or _header(headers, b"content-encoding") is not None
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            new_headers = [
+                (key, value) for key, value in headers
+                if key.lower() not in (b"content-length", b"vary")
+            ]
+            vary = _header(headers, b"vary")
+            vary_values = {v.strip().lower() for v in (vary or b"").decode("latin-1").split(",") if v.strip()}
+            vary_values.add("accept-encoding")
+            new_headers.append((b"content-encoding", encoding.encode("latin-1")))
+            new_headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+            new_headers.append((b"vary", ", ".join(sorted(vary_values)).encode("latin-1")))
+
+            await send({**start_message, "headers": new_headers})
+            await send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+        await self.app(scope, receive, send_wrapper)
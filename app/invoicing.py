@@ -0,0 +1,439 @@
+"""
+Facturas y sus documentos (PDF y XML), fuera del request.
+
+Crear la reservación solo inserta reservación y pago; al confirmar la transacción se
+encola la reservación en un pool de hilos de este proceso, que inserta la fila de
+invoices (INSERT ... ON CONFLICT DO NOTHING, así dos workers no chocan) y genera los
+documentos en INVOICE_STORAGE_DIR/AAAA/MM/<número>.pdf|.xml con escritura atómica.
+
+Una tarea periódica (con lease, un solo proceso) recupera lo que se haya quedado
+atrás: reservaciones sin factura y facturas con documentos pendientes (reinicio a
+media cola, error al escribir). Un documento que falla se reintenta hasta
+INVOICE_MAX_RENDER_ATTEMPTS veces y después queda como "failed".
+
+regenerate_invoices() vuelve a poner como pendientes las facturas de un rango de
+fechas; lo usan POST /api/admin/invoices/regenerate y scripts/regenerate_invoices.py.
+
+El PDF se arma a mano (una página, Helvetica) para no agregar dependencias; el XML
+es un resumen propio de la factura, no un CFDI timbrado.
+"""
+import logging
+import os
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import and_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, joinedload
+
+from app.crm_cases import refresh_crm_cases
+from app.db import SessionLocal
+from app.db_models import Invoice, Reservation
+from app.scheduler import LeasedJob
+from app.sequences import build_reservation_folio, invoice_numbers
+from app.table_versions import bump_table_versions
+
+logger = logging.getLogger(__name__)
+
+INVOICE_STORAGE_DIR = Path(os.getenv("INVOICE_STORAGE_DIR", "storage/invoices"))
+INVOICE_WORKERS = int(os.getenv("INVOICE_WORKERS", "2"))
+INVOICE_WORKER_ENABLED = os.getenv("INVOICE_WORKER_ENABLED", "true").lower() == "true"
+INVOICE_SWEEP_INTERVAL_SECONDS = float(os.getenv("INVOICE_SWEEP_INTERVAL_SECONDS", "60"))
+INVOICE_BATCH_SIZE = int(os.getenv("INVOICE_BATCH_SIZE", "200"))
+INVOICE_MAX_RENDER_ATTEMPTS = int(os.getenv("INVOICE_MAX_RENDER_ATTEMPTS", "3"))
+INVOICE_CACHE_MAX_AGE_SECONDS = int(os.getenv("INVOICE_CACHE_MAX_AGE_SECONDS", "86400"))
+INVOICE_ISSUER_NAME = os.getenv("INVOICE_ISSUER_NAME", "Cuidado con el pug")
+INVOICE_ISSUER_RFC = os.getenv("INVOICE_ISSUER_RFC", "")
+INVOICE_CURRENCY = "MXN"
+
+DOCUMENT_PENDING = "pending"
+DOCUMENT_RENDERED = "rendered"
+DOCUMENT_FAILED = "failed"
+
+DOCUMENT_MEDIA_TYPES = {"pdf": "application/pdf", "xml": "application/xml"}
+
+
+def build_invoice_number(number: int, issued_at: datetime) -> str:
+    return f"FAC-{issued_at.strftime('%Y%m%d')}-{number:06d}"
+
+
+# --- Filas de invoices ---
+
+def create_invoices(db: Session, reservation_ids: Iterable[int]) -> int:
+    """Inserta la factura de las reservaciones que aún no tienen; devuelve cuántas se crearon"""
+    ids = sorted({reservation_id for reservation_id in reservation_ids if reservation_id is not None})
+    if not ids:
+        return 0
+
+    conn = db.connection()
+    reservations = Reservation.__table__
+    invoices = Invoice.__table__
+    pending = []
+    for start in range(0, len(ids), INVOICE_BATCH_SIZE):
+        chunk = ids[start:start + INVOICE_BATCH_SIZE]
+        pending.extend(conn.execute(
+            select(reservations.c.id, reservations.c.folio, reservations.c.total_price)
+            .outerjoin(invoices, invoices.c.reservation_id == reservations.c.id)
+            .where(reservations.c.id.in_(chunk), invoices.c.id.is_(None))
+        ).all())
+    if not pending:
+        return 0
+
+    # Los números se piden antes de escribir (ver app/sequences.py)
+    numbers = invoice_numbers.next_many(len(pending))
+    issued_at = datetime.now(timezone.utc)
+    return insert_invoice_rows(db, [
+        invoice_row(reservation_id, folio or build_reservation_folio(reservation_id), total_price, number, issued_at)
+        for (reservation_id, folio, total_price), number in zip(pending, numbers)
+    ])
+
+
+def invoice_row(reservation_id: int, folio: str, amount, number: int, issued_at: datetime) -> dict:
+    return {
+        "reservation_id": reservation_id,
+        "folio": folio,
+        "invoice_number": build_invoice_number(number, issued_at),
+        "amount": amount,
+        "currency": INVOICE_CURRENCY,
+        "status": "generated",
+        "issued_at": issued_at,
+        "document_status": DOCUMENT_PENDING,
+        "render_attempts": 0,
+    }
+
+
+def insert_invoice_rows(db: Session, rows: List[dict]) -> int:
+    """
+    INSERT por lotes de filas armadas con invoice_row(); recalcula los casos CRM de
+    esas reservaciones. Devuelve cuántas se insertaron.
+    """
+    conn = db.connection()
+    created = 0
+    for start in range(0, len(rows), INVOICE_BATCH_SIZE):
+        chunk = rows[start:start + INVOICE_BATCH_SIZE]
+        # Otro worker pudo crearla entre el SELECT y el INSERT
+        created += conn.execute(sqlite_insert(Invoice.__table__).on_conflict_do_nothing(), chunk).rowcount
+        refresh_crm_cases(db, [row["reservation_id"] for row in chunk])
+
+    # Los INSERT de Core no pasan por los eventos de flush
+    if created:
+        bump_table_versions(db, [Invoice.__tablename__])
+    return created
+
+
+def regenerate_invoices(db: Session, start_date: date, end_date: date) -> List[int]:
+    """
+    Crea las facturas faltantes de las reservaciones hechas en el rango y marca como
+    pendientes los documentos de las facturas emitidas en él (ambos extremos incluidos).
+    Devuelve los reservation_id a procesar; la transacción la confirma quien llama.
+    """
+    start = datetime.combine(start_date, time.min)
+    end = datetime.combine(end_date + timedelta(days=1), time.min)
+
+    created_ids = db.execute(
+        select(Reservation.id).where(Reservation.created_at >= start, Reservation.created_at < end)
+    ).scalars().all()
+    create_invoices(db, created_ids)
+
+    in_range = and_(Invoice.issued_at >= start, Invoice.issued_at < end)
+    db.execute(
+        update(Invoice)
+        .where(in_range)
+        .values(document_status=DOCUMENT_PENDING, render_attempts=0, render_error=None)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(
+        select(Invoice.reservation_id).where(in_range).order_by(Invoice.reservation_id)
+    ).scalars().all()
+
+
+# --- Documentos ---
+
+def document_path(relative_path: str) -> Path:
+    return INVOICE_STORAGE_DIR / relative_path
+
+
+def _write_atomic(relative_path: str, content: bytes) -> None:
+    """Escribe a un temporal en el mismo directorio y lo renombra: nunca se sirve un archivo a medias"""
+    target = document_path(relative_path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(content)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _money(amount, currency: str) -> str:
+    return f"${Decimal(str(amount or 0)):,.2f} {currency}"
+
+
+def _fmt_date(value: Optional[datetime]) -> str:
+    return value.strftime("%d/%m/%Y %H:%M") if value else "-"
+
+
+def invoice_document_data(invoice: Invoice) -> dict:
+    """Todo lo que llevan el PDF y el XML, leído una vez de la factura y sus relaciones"""
+    reservation = invoice.reservation
+    user = reservation.user
+    vehicle = reservation.vehicle
+    payment = reservation.payment
+    vehicle_name = f"{vehicle.brand} {vehicle.model} {vehicle.year}" if vehicle else "-"
+    return {
+        "invoice_number": invoice.invoice_number,
+        "folio": invoice.folio,
+        "issued_at": invoice.issued_at,
+        "currency": invoice.currency,
+        "amount": invoice.amount,
+        "customer_name": user.full_name if user else "-",
+        "customer_email": user.email if user else "",
+        "vehicle": vehicle_name,
+        "plate": vehicle.plate if vehicle else "",
+        "start_date": reservation.start_date,
+        "end_date": reservation.end_date,
+        "pickup_location": reservation.pickup_location,
+        "total_days": reservation.total_days,
+        "price_per_day": reservation.price_per_day,
+        "payment_method": payment.method if payment else "",
+        "payment_reference": (payment.reference or "") if payment else "",
+    }
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def render_pdf(title: str, lines: List[str]) -> bytes:
+    """PDF de una página (carta) con un título y líneas de texto en Helvetica/WinAnsi"""
+    commands = ["BT", "/F2 16 Tf", "50 740 Td", f"({_pdf_escape(title)}) Tj", "/F1 11 Tf", "16 TL", "T*", "T*"]
+    commands.extend(f"({_pdf_escape(line)}) Tj T*" for line in lines[:40])
+    commands.append("ET")
+    stream = "\n".join(commands).encode("cp1252", "replace")
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+    ]
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_at = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_at)
+    return bytes(out)
+
+
+def invoice_pdf(data: dict) -> bytes:
+    currency = data["currency"]
+    lines = [
+        INVOICE_ISSUER_NAME + (f" - RFC {INVOICE_ISSUER_RFC}" if INVOICE_ISSUER_RFC else ""),
+        f"Folio de reservación: {data['folio']}",
+        f"Fecha de emisión: {_fmt_date(data['issued_at'])}",
+        "",
+        f"Cliente: {data['customer_name']}",
+        f"Correo: {data['customer_email']}",
+        "",
+        f"Vehículo: {data['vehicle']} ({data['plate']})",
+        f"Periodo: {_fmt_date(data['start_date'])} a {_fmt_date(data['end_date'])}",
+        f"Lugar de recogida: {data['pickup_location']}",
+        f"Días: {data['total_days']}  x  {_money(data['price_per_day'], currency)}",
+        "",
+        f"Total: {_money(data['amount'], currency)}",
+        f"Método de pago: {data['payment_method'] or '-'}",
+    ]
+    if data["payment_reference"]:
+        lines.append(f"Referencia: {data['payment_reference']}")
+    return render_pdf(f"Factura {data['invoice_number']}", lines)
+
+
+def invoice_xml(data: dict) -> bytes:
+    root = ET.Element("Factura", {
+        "version": "1.0",
+        "numero": data["invoice_number"],
+        "folio": data["folio"],
+        "fecha": data["issued_at"].isoformat() if data["issued_at"] else "",
+        "moneda": data["currency"],
+        "total": f"{Decimal(str(data['amount'] or 0)):.2f}",
+    })
+    ET.SubElement(root, "Emisor", {"nombre": INVOICE_ISSUER_NAME, "rfc": INVOICE_ISSUER_RFC})
+    ET.SubElement(root, "Receptor", {"nombre": data["customer_name"], "email": data["customer_email"]})
+    conceptos = ET.SubElement(root, "Conceptos")
+    ET.SubElement(conceptos, "Concepto", {
+        "cantidad": str(data["total_days"]),
+        "unidad": "día",
+        "descripcion": f"Renta de {data['vehicle']} ({data['plate']})",
+        "valorUnitario": f"{Decimal(str(data['price_per_day'] or 0)):.2f}",
+        "importe": f"{Decimal(str(data['amount'] or 0)):.2f}",
+    })
+    ET.SubElement(root, "Pago", {"metodo": data["payment_method"], "referencia": data["payment_reference"]})
+    return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+def render_invoice(db: Session, reservation_id: int, force: bool = False) -> Optional[str]:
+    """
+    Genera el PDF y el XML de la factura de la reservación y guarda las rutas.
+    Devuelve el document_status resultante (None si la reservación no tiene factura).
+    """
+    invoice = (
+        db.query(Invoice)
+        .options(
+            joinedload(Invoice.reservation).joinedload(Reservation.user),
+            joinedload(Invoice.reservation).joinedload(Reservation.vehicle),
+            joinedload(Invoice.reservation).joinedload(Reservation.payment),
+        )
+        .filter(Invoice.reservation_id == reservation_id)
+        .first()
+    )
+    if invoice is None:
+        return None
+    # Agotó sus intentos: solo /admin/invoices/regenerate (o force) la vuelve a pendiente
+    if invoice.document_status == DOCUMENT_FAILED and not force:
+        return DOCUMENT_FAILED
+    if invoice.document_status == DOCUMENT_RENDERED and not force and all(
+        path and document_path(path).is_file() for path in (invoice.pdf_path, invoice.xml_path)
+    ):
+        return DOCUMENT_RENDERED
+
+    issued_at = invoice.issued_at or datetime.now(timezone.utc)
+    base = f"{issued_at:%Y/%m}/{invoice.invoice_number}"
+    try:
+        data = invoice_document_data(invoice)
+        _write_atomic(f"{base}.pdf", invoice_pdf(data))
+        _write_atomic(f"{base}.xml", invoice_xml(data))
+    except Exception as exc:
+        attempts = (invoice.render_attempts or 0) + 1
+        document_status = DOCUMENT_FAILED if attempts >= INVOICE_MAX_RENDER_ATTEMPTS else DOCUMENT_PENDING
+        values = {"document_status": document_status, "render_attempts": attempts, "render_error": str(exc)[:500]}
+        logger.exception("No se pudo generar la factura %s", invoice.invoice_number)
+    else:
+        document_status = DOCUMENT_RENDERED
+        values = {
+            "document_status": document_status,
+            "pdf_path": f"{base}.pdf",
+            "xml_path": f"{base}.xml",
+            "rendered_at": datetime.now(timezone.utc),
+            "render_attempts": (invoice.render_attempts or 0) + 1,
+            "render_error": None,
+        }
+
+    # UPDATE directo: el estado del documento no cambia los casos CRM ni las versiones
+    db.execute(
+        update(Invoice)
+        .where(Invoice.id == invoice.id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return document_status
+
+
+def process_reservation(reservation_id: int) -> Optional[str]:
+    """Crea la factura si falta y genera sus documentos, en una sesión propia"""
+    with SessionLocal() as db:
+        create_invoices(db, [reservation_id])
+        db.commit()
+        return render_invoice(db, reservation_id)
+
+
+# --- Worker ---
+
+class InvoiceWorker:
+    """Pool de hilos del proceso; una reservación no se encola dos veces mientras está en curso"""
+
+    def __init__(self, max_workers: int = INVOICE_WORKERS):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if not INVOICE_WORKER_ENABLED or self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="invoice")
+
+    def stop(self) -> None:
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            # Lo pendiente lo retoma la tarea periódica al siguiente arranque
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, reservation_id: int) -> bool:
+        """Encola la reservación; False si el worker no corre o ya estaba en la cola"""
+        executor = self._executor
+        if executor is None:
+            return False
+        with self._lock:
+            if reservation_id in self._in_flight:
+                return False
+            self._in_flight.add(reservation_id)
+        try:
+            executor.submit(self._process, reservation_id)
+        except RuntimeError:
+            # El executor se cerró entre la lectura y el submit
+            with self._lock:
+                self._in_flight.discard(reservation_id)
+            return False
+        return True
+
+    def submit_many(self, reservation_ids: Iterable[int]) -> int:
+        return sum(1 for reservation_id in reservation_ids if self.submit(reservation_id))
+
+    def _process(self, reservation_id: int) -> None:
+        try:
+            process_reservation(reservation_id)
+        except Exception:
+            logger.exception("Error al procesar la factura de la reservación %s", reservation_id)
+        finally:
+            with self._lock:
+                self._in_flight.discard(reservation_id)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"running": self._executor is not None, "workers": self.max_workers, "in_flight": len(self._in_flight)}
+
+
+invoice_worker = InvoiceWorker()
+
+
+def sweep_invoices(db: Session) -> None:
+    """Reservaciones sin factura y documentos pendientes que no llegaron al pool"""
+    missing = db.execute(
+        select(Reservation.id)
+        .outerjoin(Invoice, Invoice.reservation_id == Reservation.id)
+        .where(Invoice.id.is_(None))
+        .order_by(Reservation.id)
+        .limit(INVOICE_BATCH_SIZE)
+    ).scalars().all()
+    created = create_invoices(db, missing)
+    db.commit()
+
+    pending = db.execute(
+        select(Invoice.reservation_id)
+        .where(Invoice.document_status == DOCUMENT_PENDING)
+        .order_by(Invoice.id)
+        .limit(INVOICE_BATCH_SIZE)
+    ).scalars().all()
+    queued = invoice_worker.submit_many(pending)
+    if created or queued:
+        logger.info("Facturas: %s creadas, %s documentos encolados", created, queued)
+
+
+invoice_sweep_job = LeasedJob("invoice-sweep", sweep_invoices, INVOICE_SWEEP_INTERVAL_SECONDS)
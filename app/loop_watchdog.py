@@ -0,0 +1,144 @@
+"""
+Watchdog del event loop: mide el lag y registra el stack de callbacks que bloquean
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LOOP_WATCHDOG_INTERVAL_MS = float(os.getenv("LOOP_WATCHDOG_INTERVAL_MS", "100"))
+LOOP_WATCHDOG_THRESHOLD_MS = float(os.getenv("LOOP_WATCHDOG_THRESHOLD_MS", "250"))
+
+# Límites superiores (ms) del histograma de lag
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class LoopWatchdog:
+    """
+    Un heartbeat dentro del loop mide cuánto se retrasa cada tick; un hilo aparte
+    detecta cuando el heartbeat deja de avanzar y captura el stack del hilo del loop
+    mientras sigue bloqueado.
+    """
+
+    def __init__(
+        self,
+        interval_ms: float = LOOP_WATCHDOG_INTERVAL_MS,
+        threshold_ms: float = LOOP_WATCHDOG_THRESHOLD_MS,
+    ):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._stall_reported = False
+        self._reset_counters()
+
+    def _reset_counters(self) -> None:
+        self.ticks = 0
+        self.slow_ticks = 0
+        self.blocked_calls = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.total_lag_ms = 0.0
+        self.lag_histogram = {str(bucket): 0 for bucket in LAG_BUCKETS_MS}
+        self.lag_histogram["+Inf"] = 0
+
+    def _record_lag(self, lag_ms: float) -> None:
+        with self._lock:
+            self.ticks += 1
+            self.last_lag_ms = lag_ms
+            self.total_lag_ms += lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms >= self.threshold * 1000:
+                self.slow_ticks += 1
+
+            for bucket in LAG_BUCKETS_MS:
+                if lag_ms <= bucket:
+                    self.lag_histogram[str(bucket)] += 1
+                    break
+            else:
+                self.lag_histogram["+Inf"] += 1
+
+            self._last_beat = time.monotonic()
+            self._stall_reported = False
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - expected) * 1000)
+            self._record_lag(lag_ms)
+
+    def _monitor(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                stalled_for = time.monotonic() - self._last_beat
+                should_report = stalled_for >= self.threshold + self.interval and not self._stall_reported
+                if should_report:
+                    self._stall_reported = True
+                    self.blocked_calls += 1
+
+            if not should_report:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<stack no disponible>"
+            logger.warning(
+                "Event loop bloqueado por %.0f ms; stack del hilo del loop:\n%s",
+                stalled_for * 1000,
+                stack,
+            )
+
+    def start(self) -> None:
+        """Arranca el watchdog; debe llamarse desde el event loop (p. ej. en startup)"""
+        if self._task is not None:
+            return
+
+        self._stop.clear()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Contadores para exponer como métricas"""
+        with self._lock:
+            return {
+                "running": self._task is not None,
+                "interval_ms": self.interval * 1000,
+                "threshold_ms": self.threshold * 1000,
+                "ticks": self.ticks,
+                "slow_ticks": self.slow_ticks,
+                "blocked_calls": self.blocked_calls,
+                "last_lag_ms": round(self.last_lag_ms, 2),
+                "max_lag_ms": round(self.max_lag_ms, 2),
+                "avg_lag_ms": round(self.total_lag_ms / self.ticks, 2) if self.ticks else 0.0,
+                "lag_histogram_ms": dict(self.lag_histogram),
+            }
+
+
+loop_watchdog = LoopWatchdog()
@@ -3,14 +3,28 @@ from pathlib import Path
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, HTMLResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 
-from app.routes import admin, newsletter, promotions, reservations, reviews, search, support, vehicles
+from app.routes import admin, newsletter, promotions, quotes, reservations, reviews, search, support, vehicles
 from app.routes.payment_methods import router as payment_methods_router
+from app.routes.promotions import ensure_default_promotions
 from app.router_auth import router as auth_router
-from app.db import Base, engine, ensure_user_role_column
+from app.db import (
+    Base, engine, ensure_indexes, ensure_invoice_document_columns, ensure_reservation_folio_column,
+    ensure_user_role_column,
+)
+from app.static_assets import PrecompressedStaticFiles, asset_url, page_path
+from app.http_cache import CompressionMiddleware
+from app.health import ReadinessProbe, build_sql_check, liveness
+from app.newsletter_dispatch import newsletter_dispatcher
+from app.reservation_lifecycle import reservation_lifecycle_job
+from app.crm_cases import crm_sweep_job, ensure_crm_cases
+from app.crm_search import ensure_crm_search_index
+from app.invoicing import invoice_sweep_job, invoice_worker
+from app.sequences import ensure_sequences
+from app.vehicle_features import ensure_vehicle_features
+from app.quote_cache import quote_cache
 
 
 # --- Paths (según tu estructura) ---
@@ -27,11 +41,38 @@ app = FastAPI(
 )
 
 Base.metadata.create_all(bind=engine)
+ensure_invoice_document_columns()
+ensure_reservation_folio_column()
+ensure_indexes()
 ensure_user_role_column()
+ensure_default_promotions()
+ensure_crm_search_index()
+ensure_crm_cases()
+ensure_vehicle_features()
+ensure_sequences()
+
+# --- Workers en segundo plano ---
+@app.on_event("startup")
+def start_background_workers():
+    newsletter_dispatcher.start()
+    reservation_lifecycle_job.start()
+    crm_sweep_job.start()
+    invoice_worker.start()
+    invoice_sweep_job.start()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    invoice_sweep_job.stop()
+    invoice_worker.stop()
+    crm_sweep_job.stop()
+    reservation_lifecycle_job.stop()
+    newsletter_dispatcher.stop()
 
 # --- Static & templates ---
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory=str(STATIC_DIR)), name="static")
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+templates.env.globals["asset_url"] = asset_url
 
 # --- Session middleware for OAuth ---
 app.add_middleware(
@@ -39,6 +80,9 @@ app.add_middleware(
     secret_key="your-secret-key-change-in-production-please-make-it-random"
 )
 
+# --- Compresión gzip/brotli de respuestas grandes ---
+app.add_middleware(CompressionMiddleware)
+
 # --- CORS ---
 app.add_middleware(
     CORSMiddleware,
@@ -56,6 +100,7 @@ app.include_router(newsletter.router, prefix="/api/newsletter", tags=["Newslette
 app.include_router(support.router)
 app.include_router(vehicles.router)  # Ya tiene el prefix en el router
 app.include_router(reservations.router)  # Ya tiene el prefix en el router
+app.include_router(quotes.router)  # Ya tiene el prefix en el router
 app.include_router(payment_methods_router)  # Ya tiene el prefix en el router
 app.include_router(admin.router)
 
@@ -65,12 +110,32 @@ app.include_router(auth_router)
 # --- Frontend ---
 @app.get("/", include_in_schema=False)
 def root():
-    return FileResponse(str(STATIC_DIR / "index.html"))
+    return FileResponse(str(page_path("index.html")))
 
 @app.get("/health", include_in_schema=False)
 def health():
     return {"status": "ok"}
 
+readiness_probe = ReadinessProbe("sqlite", build_sql_check(engine))
+
+@app.get("/health/live", include_in_schema=False)
+def health_live():
+    return liveness()
+
+@app.get("/health/ready", include_in_schema=False)
+async def health_ready():
+    return await readiness_probe.response()
+
+@app.get("/metrics/quote-cache", include_in_schema=False)
+def quote_cache_metrics():
+    """Aciertos, fallos y tamaño del cache de cotizaciones"""
+    return quote_cache.snapshot()
+
+@app.get("/metrics/invoices", include_in_schema=False)
+def invoice_worker_metrics():
+    """Estado del pool que genera las facturas"""
+    return invoice_worker.snapshot()
+
 # --- Pages (Jinja) ---
 @app.get("/register", response_class=HTMLResponse, include_in_schema=False)
 def register_page(request: Request):
@@ -95,16 +160,16 @@ def admin_dashboard_page(request: Request):
 
 @app.get("/payment", include_in_schema=False)
 def payment_page():
-    return FileResponse(str(STATIC_DIR / "payment.html"))
+    return FileResponse(str(page_path("payment.html")))
 
 @app.get("/perfil", include_in_schema=False)
 def perfil_page():
-    return FileResponse(str(STATIC_DIR / "perfil.html"))
+    return FileResponse(str(page_path("perfil.html")))
 
 @app.get("/mis-reservas", include_in_schema=False)
 def mis_reservas_page():
-    return FileResponse(str(STATIC_DIR / "mis-reservas.html"))
+    return FileResponse(str(page_path("mis-reservas.html")))
 
 @app.get("/metodos-pago", include_in_schema=False)
 def metodos_pago_page():
-    return FileResponse(str(STATIC_DIR / "metodos-pago.html"))
+    return FileResponse(str(page_path("metodos-pago.html")))
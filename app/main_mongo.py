@@ -1,16 +1,26 @@
+import logging
 from pathlib import Path
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, HTMLResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 
 # Importar configuración MongoDB
-from app.mongodb import connect_to_mongo, close_mongo_connection
+from app.mongodb import connect_to_mongo, close_mongo_connection, pool_metrics
+from app.city_index import get_city_index
+from app.vehicle_features import ensure_mongo_vehicle_features
+from app.newsletter_import import ensure_mongo_newsletter_emails
+from app.static_assets import PrecompressedStaticFiles, asset_url, page_path
+from app.http_cache import CompressionMiddleware
+from app.health import ReadinessProbe, build_mongo_check, liveness
+from app.loop_watchdog import loop_watchdog
+from app.quote_cache import quote_cache
+from app.reservation_lifecycle import reservation_lifecycle_mongo_job
+from app.newsletter_dispatch import mongo_newsletter_dispatcher
 
 # Importar routers MongoDB
 from app.routes import search_mongo as search
@@ -19,9 +29,12 @@ from app.routes import newsletter_mongo as newsletter
 from app.routes import promotions_mongo as promotions
 from app.routes import vehicles_mongo as vehicles
 from app.routes import reservations_mongo as reservations
+from app.routes import quotes_mongo as quotes
 from app.routes import admin_mongo as admin
 from app.router_auth_mongo import router as auth_router
 
+logger = logging.getLogger(__name__)
+
 # --- Paths (según tu estructura) ---
 APP_DIR = Path(__file__).resolve().parent              # .../Proyecto-DAS/app
 PROJECT_ROOT = APP_DIR.parent                          # .../Proyecto-DAS
@@ -39,8 +52,7 @@ app = FastAPI(
 # --- Manejador de errores de validación ---
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
-    print(f"❌ Error de validación: {exc.errors()}")
-    print(f"Body recibido: {exc.body}")
+    logger.info("Error de validación: %s | body: %s", exc.errors(), exc.body)
     return JSONResponse(
         status_code=422,
         content={"detail": exc.errors(), "body": str(exc.body)},
@@ -52,17 +64,30 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 async def startup_db_client():
     """Conectar a MongoDB al iniciar la aplicación"""
     await connect_to_mongo()
+    await ensure_mongo_vehicle_features()
+    await ensure_mongo_newsletter_emails()
+    # Construir el índice de ciudades antes de la primera petición de autocompletado
+    get_city_index()
+    loop_watchdog.start()
+    mongo_newsletter_dispatcher.start()
+    reservation_lifecycle_mongo_job.start()
+    reviews.review_stats_repair_job.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     """Cerrar conexión a MongoDB al apagar la aplicación"""
+    await reviews.review_stats_repair_job.stop()
+    await reservation_lifecycle_mongo_job.stop()
+    await mongo_newsletter_dispatcher.stop()
+    await loop_watchdog.stop()
     await close_mongo_connection()
 
 
 # --- Static & templates ---
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory=str(STATIC_DIR)), name="static")
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+templates.env.globals["asset_url"] = asset_url
 
 # --- Session middleware for OAuth ---
 app.add_middleware(
@@ -70,6 +95,9 @@ app.add_middleware(
     secret_key="your-secret-key-change-in-production-please-make-it-random"
 )
 
+# --- Compresión gzip/brotli de respuestas grandes ---
+app.add_middleware(CompressionMiddleware)
+
 # --- CORS ---
 app.add_middleware(
     CORSMiddleware,
@@ -86,6 +114,7 @@ app.include_router(reviews.router, prefix="/api/reviews", tags=["Calificaciones"
 app.include_router(newsletter.router, prefix="/api/newsletter", tags=["Newsletter"])
 app.include_router(vehicles.router)  # Ya tiene el prefix en el router
 app.include_router(reservations.router)  # Ya tiene el prefix en el router
+app.include_router(quotes.router)  # Ya tiene el prefix en el router
 app.include_router(admin.router)  # ✅ Router de administración con MongoDB
 
 # --- Auth router ---
@@ -94,13 +123,40 @@ app.include_router(auth_router)
 # --- Frontend ---
 @app.get("/", include_in_schema=False)
 def root():
-    return FileResponse(str(STATIC_DIR / "index.html"))
+    return FileResponse(str(page_path("index.html")))
 
 @app.get("/health", include_in_schema=False)
 async def health():
     """Health check endpoint"""
     return {"status": "ok", "database": "mongodb"}
 
+readiness_probe = ReadinessProbe("mongodb", build_mongo_check())
+
+@app.get("/health/live", include_in_schema=False)
+async def health_live():
+    """Liveness: el proceso está vivo"""
+    return liveness()
+
+@app.get("/health/ready", include_in_schema=False)
+async def health_ready():
+    """Readiness: MongoDB responde y el event loop no está bloqueado"""
+    return await readiness_probe.response()
+
+@app.get("/metrics/event-loop", include_in_schema=False)
+async def event_loop_metrics():
+    """Contadores de lag y bloqueos del event loop"""
+    return loop_watchdog.snapshot()
+
+@app.get("/metrics/quote-cache", include_in_schema=False)
+async def quote_cache_metrics():
+    """Aciertos, fallos y tamaño del cache de cotizaciones"""
+    return quote_cache.snapshot()
+
+@app.get("/metrics/mongo-pool", include_in_schema=False)
+async def mongo_pool_metrics():
+    """Conexiones abiertas y en uso, esperas y fallos del pool de MongoDB"""
+    return pool_metrics.snapshot()
+
 # --- Pages (Jinja) ---
 @app.get("/register", response_class=HTMLResponse, include_in_schema=False)
 def register_page(request: Request):
@@ -125,20 +181,20 @@ def admin_dashboard_page(request: Request):
 
 @app.get("/payment", include_in_schema=False)
 def payment_page():
-    return FileResponse(str(STATIC_DIR / "payment.html"))
+    return FileResponse(str(page_path("payment.html")))
 
 # --- User pages (added after database migration) ---
 @app.get("/perfil", include_in_schema=False)
 def perfil_page():
     """Serve the profile static page."""
-    return FileResponse(str(STATIC_DIR / "perfil.html"))
+    return FileResponse(str(page_path("perfil.html")))
 
 @app.get("/mis-reservas", include_in_schema=False)
 def mis_reservas_page():
     """Serve the reservations static page."""
-    return FileResponse(str(STATIC_DIR / "mis-reservas.html"))
+    return FileResponse(str(page_path("mis-reservas.html")))
 
 @app.get("/metodos-pago", include_in_schema=False)
 def metodos_pago_page():
     """Serve the payment methods static page."""
-    return FileResponse(str(STATIC_DIR / "metodos-pago.html"))
+    return FileResponse(str(page_path("metodos-pago.html")))
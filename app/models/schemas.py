@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field
 from datetime import date
-from typing import Optional, List
+from typing import Dict, Optional, List
 from enum import Enum
 
 # Modelos para búsqueda de transporte
@@ -60,6 +60,7 @@ class ReviewsResponse(BaseModel):
     reviews: List[Review]
     promedio_calificacion: float
     total_reviews: int
+    histograma: Optional[Dict[str, int]] = Field(None, description="Número de reviews por calificación (1-5)")
 
 # Modelos para newsletter
 class NewsletterSubscribe(BaseModel):
@@ -69,3 +70,9 @@ class NewsletterResponse(BaseModel):
     success: bool
     message: str
     email: str
+
+# Campañas del newsletter (SQL y MongoDB)
+class CampaignCreate(BaseModel):
+    subject: str = Field(..., min_length=1, max_length=200)
+    body_text: str = Field(..., min_length=1)
+    body_html: Optional[str] = None
@@ -2,8 +2,16 @@
 Configuración de MongoDB con Motor (async driver)
 """
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference, WriteConcern
+from pymongo.monitoring import ConnectionPoolListener
+from pymongo.read_concern import ReadConcern
 from beanie import init_beanie
+import asyncio
+import importlib.util
 import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,20 +20,185 @@ load_dotenv()
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("MONGODB_DATABASE", "proyecto_das_db")
 
+# Transacciones: "auto" las usa si el servidor es replica set o mongos; "off" las desactiva
+MONGODB_TRANSACTIONS = os.getenv("MONGODB_TRANSACTIONS", "auto").strip().lower()
+
+# Pool de conexiones: minPoolSize se abre al arrancar; maxConnecting limita cuántas
+# conexiones se abren a la vez para que un pico no dispare una tormenta de conexiones
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "10"))
+MONGODB_MAX_CONNECTING = int(os.getenv("MONGODB_MAX_CONNECTING", "4"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+# Cuánto espera una operación por una conexión libre antes de fallar (en vez de encolarse sin fin)
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+
+# Timeouts
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "20000"))
+
+# Compresión del protocolo, en orden de preferencia; zstd y snappy solo si su paquete está instalado
+MONGODB_COMPRESSORS = os.getenv("MONGODB_COMPRESSORS", "zstd,snappy,zlib")
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+# Lecturas del panel administrativo (conteos, ventas): pueden ir a un secundario
+MONGODB_ANALYTICS_READ_PREFERENCE = os.getenv("MONGODB_ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+ANALYTICS_READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primarypreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondarypreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
 # Cliente de MongoDB
 mongodb_client: AsyncIOMotorClient = None
+_transactions_supported: Optional[bool] = None
+
+T = TypeVar("T")
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """
+    Contadores del pool de conexiones a partir de los eventos de pymongo. Los eventos
+    llegan desde los hilos de Motor, de ahí el lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkout_started: Dict[int, List[float]] = {}
+        self.open = 0
+        self.checked_out = 0
+        self.created = 0
+        self.closed = 0
+        self.checkouts = 0
+        self.checkout_failures: Dict[str, int] = {}
+        self.pool_clears = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def _wait_finished(self) -> None:
+        started = self._checkout_started.get(threading.get_ident())
+        if started:
+            wait_ms = (time.perf_counter() - started.pop()) * 1000
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_check_out_started(self, event) -> None:
+        with self._lock:
+            self._checkout_started.setdefault(threading.get_ident(), []).append(time.perf_counter())
+
+    def connection_checked_out(self, event) -> None:
+        with self._lock:
+            self._wait_finished()
+            self.checked_out += 1
+            self.checkouts += 1
+
+    def connection_check_out_failed(self, event) -> None:
+        with self._lock:
+            self._wait_finished()
+            reason = str(event.reason)
+            self.checkout_failures[reason] = self.checkout_failures.get(reason, 0) + 1
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def connection_created(self, event) -> None:
+        with self._lock:
+            self.created += 1
+            self.open += 1
+
+    def connection_closed(self, event) -> None:
+        with self._lock:
+            self.closed += 1
+            self.open = max(0, self.open - 1)
+
+    def pool_cleared(self, event) -> None:
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_pool_size": MONGODB_MAX_POOL_SIZE,
+                "min_pool_size": MONGODB_MIN_POOL_SIZE,
+                "open": self.open,
+                "checked_out": self.checked_out,
+                "usage": round(self.checked_out / MONGODB_MAX_POOL_SIZE, 3) if MONGODB_MAX_POOL_SIZE else None,
+                "created": self.created,
+                "closed": self.closed,
+                "checkouts": self.checkouts,
+                "checkout_failures": dict(self.checkout_failures),
+                "pool_clears": self.pool_clears,
+                "avg_wait_ms": round(self.total_wait_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait_ms, 3),
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+def available_compressors() -> List[str]:
+    """Compresores pedidos cuyo paquete está instalado (el servidor elige el primero que soporte)"""
+    compressors = []
+    for name in MONGODB_COMPRESSORS.split(","):
+        name = name.strip().lower()
+        module = COMPRESSOR_MODULES.get(name)
+        if module and importlib.util.find_spec(module) is not None:
+            compressors.append(name)
+    return compressors
+
+
+def client_options() -> Dict[str, Any]:
+    options: Dict[str, Any] = {
+        "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": MONGODB_MIN_POOL_SIZE,
+        "maxConnecting": MONGODB_MAX_CONNECTING,
+        "maxIdleTimeMS": MONGODB_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGODB_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGODB_SOCKET_TIMEOUT_MS,
+        # Reintenta una vez las operaciones que fallan por elección de primario o red
+        "retryWrites": True,
+        "retryReads": True,
+        "event_listeners": [pool_metrics],
+    }
+    compressors = available_compressors()
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
+
+async def warm_up_pool() -> None:
+    """Abre minPoolSize conexiones antes de recibir tráfico; si no, el primer pico las abre todas juntas"""
+    await asyncio.gather(*(mongodb_client.admin.command("ping") for _ in range(max(1, MONGODB_MIN_POOL_SIZE))))
 
 
 async def connect_to_mongo():
     """Conectar a MongoDB"""
     global mongodb_client
-    mongodb_client = AsyncIOMotorClient(MONGODB_URL)
+    mongodb_client = AsyncIOMotorClient(MONGODB_URL, **client_options())
     
     # Importar todos los modelos
     from app.mongodb_models import (
         User, PasswordResetToken, Vehicle, Reservation,
         Review, NewsletterSubscriber, Promotion,
-        Payment, SupportTicket, Newsletter
+        Payment, SupportTicket, Newsletter,
+        NewsletterCampaign, NewsletterDelivery
     )
     
     # Inicializar Beanie con todos los modelos
@@ -41,10 +214,13 @@ async def connect_to_mongo():
             Promotion,
             Payment,
             SupportTicket,
-            Newsletter
+            Newsletter,
+            NewsletterCampaign,
+            NewsletterDelivery
         ]
     )
-    print(f"✅ Conectado a MongoDB: {DATABASE_NAME}")
+    await warm_up_pool()
+    print(f"✅ Conectado a MongoDB: {DATABASE_NAME} (pool {MONGODB_MIN_POOL_SIZE}-{MONGODB_MAX_POOL_SIZE})")
 
 
 async def close_mongo_connection():
@@ -58,3 +234,41 @@ async def close_mongo_connection():
 def get_database():
     """Obtener la base de datos de MongoDB"""
     return mongodb_client[DATABASE_NAME]
+
+
+def get_analytics_collection(name: str):
+    """Colección para lecturas de reportes, que toleran datos de un secundario con algo de retraso"""
+    read_preference = ANALYTICS_READ_PREFERENCES.get(
+        MONGODB_ANALYTICS_READ_PREFERENCE.strip().lower(), ReadPreference.SECONDARY_PREFERRED
+    )
+    return get_database().get_collection(name, read_preference=read_preference)
+
+
+async def supports_transactions() -> bool:
+    """Las transacciones requieren replica set o mongos; un standalone (pruebas locales) no las tiene"""
+    global _transactions_supported
+    if MONGODB_TRANSACTIONS == "off":
+        return False
+    if _transactions_supported is None:
+        hello = await mongodb_client.admin.command("hello")
+        _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        if not _transactions_supported:
+            print("⚠️ MongoDB sin replica set: las escrituras de reservaciones van sin transacción")
+    return _transactions_supported
+
+
+async def run_transaction(callback: Callable[[Optional[object]], Awaitable[T]]) -> T:
+    """
+    Ejecuta callback(session) dentro de una transacción. with_transaction vuelve a
+    ejecutar el callback ante TransientTransactionError (p. ej. un conflicto de
+    escritura con otra transacción) y reintenta el commit ante
+    UnknownTransactionCommitResult. Sin soporte de transacciones se llama con None.
+    """
+    if not await supports_transactions():
+        return await callback(None)
+    async with await mongodb_client.start_session() as session:
+        return await session.with_transaction(
+            callback,
+            read_concern=ReadConcern("snapshot"),
+            write_concern=WriteConcern("majority"),
+        )
@@ -1,20 +1,30 @@
 """
 Modelos de MongoDB usando Beanie ODM
 """
-from beanie import Document, Indexed
+from beanie import Delete, Document, Indexed, Insert, Replace, Save, SaveChanges, after_event, before_event
 from pydantic import Field, EmailStr
+from pymongo import ASCENDING, TEXT, IndexModel
 from datetime import datetime
 from typing import Optional, List
 from enum import Enum
 
 
+class VersionedCollection:
+    """Incrementa el contador de versión de la colección en cada escritura (ETags, caches)"""
+
+    @after_event(Insert, Replace, Save, SaveChanges, Delete)
+    async def bump_collection_version(self):
+        from app.table_versions import bump_collection_versions
+        await bump_collection_versions(self.get_collection_name())
+
+
 class UserRole(str, Enum):
     """Roles de usuario"""
     CLIENT = "cliente"
     ADMIN = "administrativo"
 
 
-class User(Document):
+class User(Document, VersionedCollection):
     """Modelo de usuario en MongoDB"""
     full_name: str = Field(..., max_length=120)
     email: Indexed(EmailStr, unique=True)
@@ -69,7 +79,7 @@ class VehicleStatus(str, Enum):
     UNAVAILABLE = "unavailable"
 
 
-class Vehicle(Document):
+class Vehicle(Document, VersionedCollection):
     """Modelo de vehículos/transportes disponibles"""
     brand: str = Field(..., max_length=100)
     model: str = Field(..., max_length=100)
@@ -86,6 +96,8 @@ class Vehicle(Document):
     # Detalles
     description: Optional[str] = None
     features: Optional[str] = None  # JSON string
+    # Claves activas de `features`, normalizadas (índice multikey para filtrar)
+    feature_keys: List[str] = Field(default_factory=list)
     image_url: Optional[str] = Field(None, max_length=500)
     
     # Estado
@@ -96,13 +108,19 @@ class Vehicle(Document):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = None
     
+    @before_event(Insert, Replace, Save, SaveChanges)
+    def sync_feature_keys(self):
+        from app.vehicle_features import parse_features
+        self.feature_keys = parse_features(self.features)
+    
     class Settings:
         name = "vehicles"
         indexes = [
             "plate",
             "vehicle_type",
             "status",
-            "is_active"
+            "is_active",
+            IndexModel([("feature_keys", ASCENDING)], name="feature_keys"),
         ]
 
 
@@ -115,8 +133,9 @@ class ReservationStatus(str, Enum):
     CANCELLED = "cancelled"
 
 
-class Reservation(Document):
+class Reservation(Document, VersionedCollection):
     """Modelo de reservaciones"""
+    folio: Optional[str] = None  # VT-0001, de la secuencia "reservation_folio" (app/sequences.py)
     user_id: str  # ObjectId como string
     vehicle_id: str  # ObjectId como string
     
@@ -147,10 +166,31 @@ class Reservation(Document):
         name = "reservations"
         indexes = [
             "user_id",
-            "vehicle_id",
             "status",
             "start_date",
-            "end_date"
+            "end_date",
+            # Disponibilidad (check_vehicle_availability); también sirve a las consultas por vehicle_id
+            IndexModel(
+                [
+                    ("vehicle_id", ASCENDING),
+                    ("status", ASCENDING),
+                    ("start_date", ASCENDING),
+                    ("end_date", ASCENDING),
+                ],
+                name="vehicle_id_status_start_date_end_date",
+            ),
+            # Barrido del ciclo de vida (app/reservation_lifecycle.py)
+            IndexModel(
+                [("status", ASCENDING), ("end_date", ASCENDING), ("start_date", ASCENDING)],
+                name="status_end_date_start_date",
+            ),
+            # Solo las reservaciones con folio (las anteriores no lo tienen)
+            IndexModel(
+                [("folio", ASCENDING)],
+                name="folio",
+                unique=True,
+                partialFilterExpression={"folio": {"$type": "string"}},
+            ),
         ]
 
 
@@ -185,7 +225,59 @@ class NewsletterSubscriber(Document):
         ]
 
 
-class Promotion(Document):
+class NewsletterCampaign(Document):
+    """Campaña del newsletter; la envía MongoNewsletterDispatcher (app/newsletter_dispatch.py)"""
+    subject: str = Field(..., max_length=200)
+    body_text: str
+    body_html: Optional[str] = None
+
+    # queued, sending, paused, completed
+    status: str = Field(default="queued")
+    retry_failed: bool = False  # Reintentar entregas fallidas en la próxima corrida
+
+    # Cursor de reanudación: _id (como string) del último suscriptor ya procesado
+    last_subscriber_id: Optional[str] = None
+    sent_count: int = 0
+    failed_count: int = 0
+
+    # Lease del worker que la está enviando (evita que dos procesos la tomen a la vez)
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Settings:
+        name = "newsletter_campaigns"
+        indexes = [
+            "status",
+        ]
+
+
+class NewsletterDelivery(Document):
+    """Estado del envío de una campaña a cada suscriptor"""
+    campaign_id: str  # ObjectId como string
+    subscriber_id: str  # ObjectId como string
+    email: str
+    status: str  # sent, failed
+    attempts: int = 0
+    last_error: Optional[str] = None
+    sent_at: Optional[datetime] = None
+
+    class Settings:
+        name = "newsletter_deliveries"
+        indexes = [
+            IndexModel(
+                [("campaign_id", ASCENDING), ("subscriber_id", ASCENDING)],
+                name="campaign_id_subscriber_id",
+                unique=True,
+            ),
+            IndexModel([("campaign_id", ASCENDING), ("status", ASCENDING)], name="campaign_id_status"),
+        ]
+
+
+class Promotion(Document, VersionedCollection):
     """Promociones activas"""
     titulo: str = Field(..., max_length=200)
     descripcion: str
@@ -201,7 +293,12 @@ class Promotion(Document):
         indexes = [
             "activa",
             "fecha_inicio",
-            "fecha_fin"
+            "fecha_fin",
+            # Promociones vigentes: activa + rango de fechas
+            IndexModel(
+                [("activa", ASCENDING), ("fecha_inicio", ASCENDING), ("fecha_fin", ASCENDING)],
+                name="activa_fecha_inicio_fecha_fin",
+            ),
         ]
 
 
@@ -214,7 +311,7 @@ class PaymentStatus(str, Enum):
     REIMBURSED = "reimbursed"
 
 
-class Payment(Document):
+class Payment(Document, VersionedCollection):
     """Modelo de pagos"""
     reservation_id: Optional[str] = None  # ObjectId como string
     user_id: Optional[str] = None  # ObjectId como string
@@ -242,7 +339,7 @@ class Payment(Document):
         ]
 
 
-class SupportTicket(Document):
+class SupportTicket(Document, VersionedCollection):
     """Modelo de tickets de soporte"""
     user_id: Optional[str] = None  # ObjectId como string
     reservation_id: Optional[str] = None  # ObjectId como string
@@ -270,7 +367,14 @@ class SupportTicket(Document):
             "reservation_id",
             "status",
             "priority",
-            "created_at"
+            "created_at",
+            # Búsqueda de texto completo del panel admin (GET /api/admin/search)
+            IndexModel(
+                [("subject", TEXT), ("message", TEXT)],
+                weights={"subject": 5, "message": 1},
+                default_language="spanish",
+                name="subject_message_text",
+            ),
         ]
 
 
@@ -0,0 +1,842 @@
+"""
+Envío de campañas del newsletter.
+
+Las campañas se encolan en la tabla newsletter_campaigns y un worker en segundo plano
+las procesa: recorre los suscriptores activos por lotes (cursor por id), envía por un
+pool de conexiones SMTP reutilizadas con un límite de mensajes por segundo y registra
+el estado de cada destinatario con un solo INSERT ... ON CONFLICT por lote.
+
+El cursor se guarda en la misma transacción que las entregas, así una campaña
+interrumpida (reinicio, SMTP caído, pausa) se reanuda desde el último lote registrado.
+
+El backend MongoDB usa el mismo envío (MongoNewsletterDispatcher, al final del
+módulo) sobre las colecciones newsletter_campaigns y newsletter_deliveries.
+
+Para desarrollo: `python -m scripts.smtp_sink` levanta un SMTP local en el puerto 1025.
+"""
+import asyncio
+import logging
+import os
+import smtplib
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid, parseaddr
+from queue import Queue
+from typing import Any, List, NamedTuple, Optional, Tuple, Union
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.db_models import NewsletterCampaign, NewsletterDelivery, NewsletterSubscriber
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() == "true"
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+
+NEWSLETTER_FROM = os.getenv("NEWSLETTER_FROM", "Cuidado con el pug <newsletter@localhost>")
+NEWSLETTER_WORKER_ENABLED = os.getenv("NEWSLETTER_WORKER_ENABLED", "true").lower() == "true"
+NEWSLETTER_BATCH_SIZE = int(os.getenv("NEWSLETTER_BATCH_SIZE", "500"))
+NEWSLETTER_SMTP_CONNECTIONS = int(os.getenv("NEWSLETTER_SMTP_CONNECTIONS", "4"))
+# Muchos MTA cortan la sesión tras cierto número de mensajes; se reconecta antes
+NEWSLETTER_MESSAGES_PER_CONNECTION = int(os.getenv("NEWSLETTER_MESSAGES_PER_CONNECTION", "100"))
+NEWSLETTER_RATE_PER_SECOND = float(os.getenv("NEWSLETTER_RATE_PER_SECOND", "20"))
+NEWSLETTER_MAX_ATTEMPTS = int(os.getenv("NEWSLETTER_MAX_ATTEMPTS", "3"))
+NEWSLETTER_RETRY_BACKOFF_SECONDS = float(os.getenv("NEWSLETTER_RETRY_BACKOFF_SECONDS", "2"))
+NEWSLETTER_POLL_SECONDS = float(os.getenv("NEWSLETTER_POLL_SECONDS", "5"))
+NEWSLETTER_LEASE_SECONDS = int(os.getenv("NEWSLETTER_LEASE_SECONDS", "120"))
+# Espera antes de volver a intentar una campaña cuando el servidor SMTP no responde
+NEWSLETTER_SMTP_DOWN_BACKOFF_SECONDS = int(os.getenv("NEWSLETTER_SMTP_DOWN_BACKOFF_SECONDS", "60"))
+
+SENT = "sent"
+FAILED = "failed"
+DEFERRED = "deferred"  # No se pudo intentar (SMTP caído); no se registra y el lote se reanuda después
+
+
+class Recipient(NamedTuple):
+    subscriber_id: Union[int, str]  # id SQL u ObjectId como string
+    email: str
+
+
+class DeliveryResult(NamedTuple):
+    subscriber_id: Union[int, str]
+    email: str
+    status: str
+    attempts: int
+    error: Optional[str]
+
+
+class SMTPUnavailable(Exception):
+    """El servidor SMTP rechazó la conexión o la cortó"""
+
+
+class RateLimiter:
+    """Token bucket compartido por los hilos de envío"""
+
+    def __init__(self, rate_per_second: float, burst: Optional[float] = None):
+        self.rate = rate_per_second
+        self.capacity = burst or max(1.0, rate_per_second)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SMTPConnectionPool:
+    """
+    Conexiones SMTP reutilizadas entre mensajes (una por hilo de envío). Se abren
+    bajo demanda y se renuevan tras NEWSLETTER_MESSAGES_PER_CONNECTION mensajes o
+    cuando el servidor corta la sesión.
+    """
+
+    def __init__(self, size: int = NEWSLETTER_SMTP_CONNECTIONS, host: str = SMTP_HOST, port: int = SMTP_PORT):
+        self.host = host
+        self.port = port
+        self._slots: Queue = Queue()
+        for _ in range(size):
+            self._slots.put((None, 0))
+
+    def _connect(self) -> smtplib.SMTP:
+        try:
+            conn = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT_SECONDS)
+            conn.ehlo()
+            if SMTP_STARTTLS:
+                conn.starttls()
+                conn.ehlo()
+            if SMTP_USER:
+                conn.login(SMTP_USER, SMTP_PASSWORD or "")
+            return conn
+        except (OSError, smtplib.SMTPConnectError, smtplib.SMTPServerDisconnected) as exc:
+            raise SMTPUnavailable(f"No se pudo conectar a {self.host}:{self.port}: {exc}") from exc
+
+    @staticmethod
+    def _discard(conn: Optional[smtplib.SMTP]) -> None:
+        if conn is None:
+            return
+        try:
+            conn.quit()
+        except Exception:
+            conn.close()
+
+    def send(self, message: EmailMessage) -> None:
+        conn, sent = self._slots.get()
+        try:
+            if conn is None or sent >= NEWSLETTER_MESSAGES_PER_CONNECTION:
+                self._discard(conn)
+                conn, sent = None, 0
+                conn = self._connect()
+            try:
+                conn.send_message(message)
+            except smtplib.SMTPServerDisconnected as exc:
+                conn = None
+                raise SMTPUnavailable(str(exc)) from exc
+            except smtplib.SMTPException:
+                # Rechazo del servidor (4xx/5xx): la sesión sigue utilizable
+                raise
+            except OSError as exc:
+                self._discard(conn)
+                conn = None
+                raise SMTPUnavailable(str(exc)) from exc
+            sent += 1
+        finally:
+            self._slots.put((conn, sent))
+
+    def close(self) -> None:
+        while not self._slots.empty():
+            conn, _ = self._slots.get()
+            self._discard(conn)
+
+
+def _is_permanent(exc: Exception) -> bool:
+    """Respuestas 5xx: reintentar no cambia el resultado"""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return exc.smtp_code >= 500
+    return False
+
+
+class CampaignMessage:
+    """Plantilla de la campaña; solo cambia el destinatario por mensaje"""
+
+    def __init__(self, campaign: NewsletterCampaign):
+        self.subject = campaign.subject
+        self.body_text = campaign.body_text
+        self.body_html = campaign.body_html
+        # make_msgid() sin dominio resuelve el FQDN del host en cada llamada
+        self.domain = parseaddr(NEWSLETTER_FROM)[1].rpartition("@")[2] or "localhost"
+
+    def build(self, email: str) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = NEWSLETTER_FROM
+        message["To"] = email
+        message["Subject"] = self.subject
+        message["Date"] = formatdate(localtime=True)
+        message["Message-ID"] = make_msgid(domain=self.domain)
+        message.set_content(self.body_text)
+        if self.body_html:
+            message.add_alternative(self.body_html, subtype="html")
+        return message
+
+
+class CampaignSender:
+    """Envío de un lote por el pool SMTP; común a los workers SQL y MongoDB"""
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+
+    def _deliver(
+        self,
+        pool: SMTPConnectionPool,
+        limiter: RateLimiter,
+        message: CampaignMessage,
+        recipient: Recipient,
+        smtp_down: threading.Event,
+    ) -> DeliveryResult:
+        error = None
+        for attempt in range(1, NEWSLETTER_MAX_ATTEMPTS + 1):
+            if smtp_down.is_set() or self._stop.is_set():
+                return DeliveryResult(recipient.subscriber_id, recipient.email, DEFERRED, 0, None)
+
+            limiter.acquire()
+            try:
+                pool.send(message.build(recipient.email))
+                return DeliveryResult(recipient.subscriber_id, recipient.email, SENT, attempt, None)
+            except SMTPUnavailable as exc:
+                error = str(exc)
+                if attempt == NEWSLETTER_MAX_ATTEMPTS:
+                    smtp_down.set()
+                    return DeliveryResult(recipient.subscriber_id, recipient.email, DEFERRED, 0, None)
+            except (smtplib.SMTPException, ValueError) as exc:
+                error = str(exc)[:500]
+                if _is_permanent(exc) or isinstance(exc, ValueError):
+                    return DeliveryResult(recipient.subscriber_id, recipient.email, FAILED, attempt, error)
+
+            time.sleep(NEWSLETTER_RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1)))
+
+        return DeliveryResult(recipient.subscriber_id, recipient.email, FAILED, NEWSLETTER_MAX_ATTEMPTS, error)
+
+    def _send_batch(
+        self,
+        executor: ThreadPoolExecutor,
+        pool: SMTPConnectionPool,
+        limiter: RateLimiter,
+        message: CampaignMessage,
+        recipients: List[Recipient],
+    ) -> Tuple[List[DeliveryResult], bool]:
+        smtp_down = threading.Event()
+        results = list(executor.map(
+            lambda recipient: self._deliver(pool, limiter, message, recipient, smtp_down),
+            recipients,
+        ))
+        interrupted = any(result.status == DEFERRED for result in results)
+        return results, interrupted
+
+
+class NewsletterDispatcher(CampaignSender):
+    """
+    Worker de envío. Toma una campaña con un lease en la fila (varios procesos
+    pueden correr el worker sin enviar dos veces la misma campaña), la procesa
+    por lotes y la marca como completada al terminar.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- ciclo de vida ---
+
+    def start(self) -> None:
+        if not NEWSLETTER_WORKER_ENABLED or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="newsletter-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def notify(self) -> None:
+        """Despierta al worker (p. ej. al encolar una campaña en este proceso)"""
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                campaign_id = self._claim_campaign()
+                if campaign_id is not None:
+                    self.run_campaign(campaign_id)
+                    continue
+            except Exception:
+                logger.exception("Error en el worker del newsletter")
+            self._wake.wait(NEWSLETTER_POLL_SECONDS)
+            self._wake.clear()
+
+    # --- lease ---
+
+    @staticmethod
+    def _claimable(now: datetime):
+        # Una campaña reanudada vuelve a "queued" aunque el worker anterior siga a mitad
+        # de lote: no se toma hasta que ese worker suelte el lease (o le venza)
+        lease_free = or_(NewsletterCampaign.lease_owner.is_(None), NewsletterCampaign.lease_expires_at < now)
+        return or_(
+            and_(NewsletterCampaign.status == "queued", lease_free),
+            and_(NewsletterCampaign.status == "sending", NewsletterCampaign.lease_expires_at < now),
+        )
+
+    def _claim_campaign(self) -> Optional[int]:
+        now = datetime.utcnow()
+        with SessionLocal() as db:
+            candidate = db.execute(
+                select(NewsletterCampaign.id)
+                .where(self._claimable(now))
+                .order_by(NewsletterCampaign.id.asc())
+                .limit(1)
+            ).scalar()
+            if candidate is None:
+                return None
+
+            result = db.execute(
+                update(NewsletterCampaign)
+                .where(NewsletterCampaign.id == candidate, self._claimable(now))
+                .values(
+                    status="sending",
+                    lease_owner=self.owner,
+                    lease_expires_at=now + timedelta(seconds=NEWSLETTER_LEASE_SECONDS),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            return candidate if result.rowcount == 1 else None
+
+    def _release(self, db: Session, campaign_id: int, retry_in_seconds: int = 0, **values) -> None:
+        db.execute(
+            update(NewsletterCampaign)
+            .where(NewsletterCampaign.id == campaign_id, NewsletterCampaign.lease_owner == self.owner)
+            .values(
+                lease_owner=None,
+                lease_expires_at=datetime.utcnow() + timedelta(seconds=retry_in_seconds),
+                **values,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+    # --- envío ---
+
+    @staticmethod
+    def _record(db: Session, campaign_id: int, results: List[DeliveryResult]) -> None:
+        """Upsert por lote del estado de cada destinatario"""
+        rows = [
+            {
+                "campaign_id": campaign_id,
+                "subscriber_id": result.subscriber_id,
+                "email": result.email,
+                "status": result.status,
+                "attempts": result.attempts,
+                "last_error": result.error,
+                "sent_at": datetime.utcnow() if result.status == SENT else None,
+            }
+            for result in results
+            if result.status != DEFERRED
+        ]
+        if not rows:
+            return
+
+        table = NewsletterDelivery.__table__
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.campaign_id, table.c.subscriber_id],
+            set_={
+                "status": stmt.excluded.status,
+                "attempts": table.c.attempts + stmt.excluded.attempts,
+                "last_error": stmt.excluded.last_error,
+                "sent_at": stmt.excluded.sent_at,
+            },
+        )
+        db.connection().execute(stmt, rows)
+
+    def _checkpoint(self, db: Session, campaign_id: int, **values) -> Optional[str]:
+        """
+        Guarda el avance del lote y renueva el lease en la misma transacción que las
+        entregas. Devuelve el estado actual de la campaña, o None si se perdió el lease;
+        en ese caso se descartan las entregas del lote (las registra quien tiene el lease).
+        """
+        result = db.execute(
+            update(NewsletterCampaign)
+            .where(NewsletterCampaign.id == campaign_id, NewsletterCampaign.lease_owner == self.owner)
+            .values(
+                lease_expires_at=datetime.utcnow() + timedelta(seconds=NEWSLETTER_LEASE_SECONDS),
+                **values,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            db.rollback()
+            return None
+        status = db.execute(
+            select(NewsletterCampaign.status).where(NewsletterCampaign.id == campaign_id)
+        ).scalar()
+        db.commit()
+        return status
+
+    def run_campaign(self, campaign_id: int) -> None:
+        pool = SMTPConnectionPool()
+        limiter = RateLimiter(NEWSLETTER_RATE_PER_SECOND)
+        db = SessionLocal()
+        try:
+            with ThreadPoolExecutor(
+                max_workers=NEWSLETTER_SMTP_CONNECTIONS, thread_name_prefix="newsletter-smtp"
+            ) as executor:
+                self._run_campaign(db, campaign_id, executor, pool, limiter)
+        finally:
+            pool.close()
+            db.close()
+
+    def _run_campaign(
+        self,
+        db: Session,
+        campaign_id: int,
+        executor: ThreadPoolExecutor,
+        pool: SMTPConnectionPool,
+        limiter: RateLimiter,
+    ) -> None:
+        campaign = db.get(NewsletterCampaign, campaign_id)
+        if campaign.started_at is None:
+            campaign.started_at = datetime.utcnow()
+            db.commit()
+        message = CampaignMessage(campaign)
+        cursor = campaign.last_subscriber_id
+        retry_failed = campaign.retry_failed
+        logger.info("Enviando campaña %s desde el suscriptor %s", campaign_id, cursor)
+
+        # 1) Suscriptores activos aún no procesados, por id
+        while True:
+            if self._stop.is_set():
+                self._release(db, campaign_id)
+                return
+
+            rows = db.execute(
+                select(NewsletterSubscriber.id, NewsletterSubscriber.email)
+                .where(NewsletterSubscriber.active == True, NewsletterSubscriber.id > cursor)
+                .order_by(NewsletterSubscriber.id.asc())
+                .limit(NEWSLETTER_BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+
+            # Entregas ya registradas por una corrida interrumpida a mitad del lote
+            recorded = set(db.scalars(
+                select(NewsletterDelivery.subscriber_id).where(
+                    NewsletterDelivery.campaign_id == campaign_id,
+                    NewsletterDelivery.subscriber_id.in_([row.id for row in rows]),
+                )
+            ))
+            recipients = [Recipient(row.id, row.email) for row in rows if row.id not in recorded]
+
+            results, interrupted = self._send_batch(executor, pool, limiter, message, recipients)
+            self._record(db, campaign_id, results)
+            sent = sum(1 for result in results if result.status == SENT)
+            failed = sum(1 for result in results if result.status == FAILED)
+            progress = {
+                "sent_count": NewsletterCampaign.sent_count + sent,
+                "failed_count": NewsletterCampaign.failed_count + failed,
+            }
+            if not interrupted:
+                cursor = rows[-1].id
+                progress["last_subscriber_id"] = cursor
+
+            status = self._checkpoint(db, campaign_id, **progress)
+            if status is None:
+                logger.warning("Campaña %s: se perdió el lease, otro worker la continúa", campaign_id)
+                return
+            if interrupted:
+                logger.warning("Campaña %s: SMTP no disponible, se reanuda más tarde", campaign_id)
+                self._release(db, campaign_id, retry_in_seconds=NEWSLETTER_SMTP_DOWN_BACKOFF_SECONDS)
+                return
+            if status == "paused":
+                self._release(db, campaign_id)
+                return
+
+        # 2) Reintento de entregas fallidas (solicitado desde el endpoint /retry); se relee
+        # por si lo pidieron mientras esta corrida seguía con el lease
+        retry_failed = retry_failed or db.execute(
+            select(NewsletterCampaign.retry_failed).where(NewsletterCampaign.id == campaign_id)
+        ).scalar()
+        if retry_failed:
+            delivery_cursor = 0
+            while True:
+                if self._stop.is_set():
+                    self._release(db, campaign_id)
+                    return
+
+                rows = db.execute(
+                    select(NewsletterDelivery.id, NewsletterDelivery.subscriber_id, NewsletterDelivery.email)
+                    .where(
+                        NewsletterDelivery.campaign_id == campaign_id,
+                        NewsletterDelivery.status == FAILED,
+                        NewsletterDelivery.id > delivery_cursor,
+                    )
+                    .order_by(NewsletterDelivery.id.asc())
+                    .limit(NEWSLETTER_BATCH_SIZE)
+                ).all()
+                if not rows:
+                    break
+
+                recipients = [Recipient(row.subscriber_id, row.email) for row in rows]
+                results, interrupted = self._send_batch(executor, pool, limiter, message, recipients)
+                self._record(db, campaign_id, results)
+                recovered = sum(1 for result in results if result.status == SENT)
+                status = self._checkpoint(
+                    db,
+                    campaign_id,
+                    sent_count=NewsletterCampaign.sent_count + recovered,
+                    failed_count=NewsletterCampaign.failed_count - recovered,
+                )
+                if status is None:
+                    return
+                if interrupted:
+                    self._release(db, campaign_id, retry_in_seconds=NEWSLETTER_SMTP_DOWN_BACKOFF_SECONDS)
+                    return
+                if status == "paused":
+                    self._release(db, campaign_id)
+                    return
+                delivery_cursor = rows[-1].id
+
+        self._release(
+            db,
+            campaign_id,
+            status="completed",
+            retry_failed=False,
+            finished_at=datetime.utcnow(),
+        )
+        logger.info("Campaña %s completada", campaign_id)
+
+
+newsletter_dispatcher = NewsletterDispatcher()
+
+
+# --- MongoDB ---
+
+class MongoNewsletterDispatcher(CampaignSender):
+    """
+    Mismo worker sobre MongoDB: una tarea asyncio en el loop de la app (Motor no se
+    comparte entre loops) y el SMTP en hilos. El lease y el cursor viven en el
+    documento de la campaña; las entregas, en newsletter_deliveries.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # --- ciclo de vida ---
+
+    def start(self) -> None:
+        if not NEWSLETTER_WORKER_ENABLED or (self._task and not self._task.done()):
+            return
+        self._stop.clear()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="newsletter-dispatcher")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._wake:
+            self._wake.set()
+        if self._task:
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                logger.warning("El worker del newsletter no terminó su lote a tiempo")
+                self._task.cancel()
+            self._task = None
+
+    def notify(self) -> None:
+        """Despierta al worker (p. ej. al encolar una campaña en este proceso)"""
+        if self._wake:
+            self._wake.set()
+
+    async def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                campaign_id = await self._claim_campaign()
+                if campaign_id is not None:
+                    await self.run_campaign(campaign_id)
+                    continue
+            except Exception:
+                logger.exception("Error en el worker del newsletter")
+            try:
+                await asyncio.wait_for(self._wake.wait(), NEWSLETTER_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    # --- lease ---
+
+    @staticmethod
+    def _campaigns():
+        from app.mongodb_models import NewsletterCampaign as CampaignDocument
+
+        return CampaignDocument.get_motor_collection()
+
+    @staticmethod
+    def _deliveries():
+        from app.mongodb_models import NewsletterDelivery as DeliveryDocument
+
+        return DeliveryDocument.get_motor_collection()
+
+    async def _claim_campaign(self) -> Optional[Any]:
+        from pymongo import ReturnDocument
+
+        now = datetime.utcnow()
+        # Igual que en SQL: una campaña reanudada no se toma mientras otro worker tenga el lease
+        claimable = {"$or": [
+            {"status": "queued", "$or": [{"lease_owner": None}, {"lease_expires_at": {"$lt": now}}]},
+            {"status": "sending", "lease_expires_at": {"$lt": now}},
+        ]}
+        campaign = await self._campaigns().find_one_and_update(
+            claimable,
+            {"$set": {
+                "status": "sending",
+                "lease_owner": self.owner,
+                "lease_expires_at": now + timedelta(seconds=NEWSLETTER_LEASE_SECONDS),
+            }},
+            projection={"_id": 1},
+            sort=[("_id", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        return campaign["_id"] if campaign else None
+
+    async def _release(self, campaign_id, retry_in_seconds: int = 0, **values) -> None:
+        await self._campaigns().update_one(
+            {"_id": campaign_id, "lease_owner": self.owner},
+            {"$set": {
+                "lease_owner": None,
+                "lease_expires_at": datetime.utcnow() + timedelta(seconds=retry_in_seconds),
+                **values,
+            }},
+        )
+
+    # --- envío ---
+
+    async def _record(self, campaign_id, results: List[DeliveryResult], session=None) -> None:
+        """Upsert por lote del estado de cada destinatario con bulk_write"""
+        from pymongo import UpdateOne
+
+        operations = [
+            UpdateOne(
+                {"campaign_id": str(campaign_id), "subscriber_id": str(result.subscriber_id)},
+                {
+                    "$set": {
+                        "email": result.email,
+                        "status": result.status,
+                        "last_error": result.error,
+                        "sent_at": datetime.utcnow() if result.status == SENT else None,
+                    },
+                    "$inc": {"attempts": result.attempts},
+                },
+                upsert=True,
+            )
+            for result in results
+            if result.status != DEFERRED
+        ]
+        if operations:
+            await self._deliveries().bulk_write(operations, ordered=False, session=session)
+
+    async def _checkpoint(
+        self,
+        campaign_id,
+        results: List[DeliveryResult],
+        inc: dict,
+        values: Optional[dict] = None,
+    ) -> Optional[str]:
+        """
+        Renueva el lease, guarda el avance y registra las entregas del lote (en una
+        transacción si el servidor la soporta). Devuelve el estado actual de la
+        campaña, o None si se perdió el lease; en ese caso no se registra nada.
+        """
+        from pymongo import ReturnDocument
+        from app.mongodb import run_transaction
+
+        async def write(session) -> Optional[str]:
+            campaign = await self._campaigns().find_one_and_update(
+                {"_id": campaign_id, "lease_owner": self.owner},
+                {
+                    "$set": {
+                        "lease_expires_at": datetime.utcnow() + timedelta(seconds=NEWSLETTER_LEASE_SECONDS),
+                        **(values or {}),
+                    },
+                    "$inc": inc,
+                },
+                projection={"status": 1},
+                return_document=ReturnDocument.AFTER,
+                session=session,
+            )
+            if campaign is None:
+                return None
+            await self._record(campaign_id, results, session)
+            return campaign["status"]
+
+        return await run_transaction(write)
+
+    async def run_campaign(self, campaign_id) -> None:
+        pool = SMTPConnectionPool()
+        limiter = RateLimiter(NEWSLETTER_RATE_PER_SECOND)
+        try:
+            with ThreadPoolExecutor(
+                max_workers=NEWSLETTER_SMTP_CONNECTIONS, thread_name_prefix="newsletter-smtp"
+            ) as executor:
+                await self._run_campaign(campaign_id, executor, pool, limiter)
+        finally:
+            pool.close()
+
+    async def _send(self, executor, pool, limiter, message, recipients) -> Tuple[List[DeliveryResult], bool]:
+        """El envío bloquea (SMTP y rate limit): corre fuera del event loop"""
+        return await asyncio.to_thread(self._send_batch, executor, pool, limiter, message, recipients)
+
+    async def _run_campaign(
+        self,
+        campaign_id,
+        executor: ThreadPoolExecutor,
+        pool: SMTPConnectionPool,
+        limiter: RateLimiter,
+    ) -> None:
+        from bson import ObjectId
+        from app.mongodb_models import NewsletterCampaign as CampaignDocument
+        from app.mongodb_models import NewsletterSubscriber as SubscriberDocument
+
+        campaign = await CampaignDocument.get(campaign_id)
+        if campaign.started_at is None:
+            await self._campaigns().update_one(
+                {"_id": campaign_id}, {"$set": {"started_at": datetime.utcnow()}}
+            )
+        message = CampaignMessage(campaign)
+        retry_failed = campaign.retry_failed
+        logger.info("Enviando campaña %s desde el suscriptor %s", campaign_id, campaign.last_subscriber_id)
+
+        # 1) Suscriptores activos aún no procesados, en un solo cursor ordenado por _id
+        filters = {"active": True}
+        if campaign.last_subscriber_id:
+            filters["_id"] = {"$gt": ObjectId(campaign.last_subscriber_id)}
+        cursor = (
+            SubscriberDocument.get_motor_collection()
+            .find(filters, {"email": 1})
+            .sort("_id", 1)
+            .batch_size(NEWSLETTER_BATCH_SIZE)
+        )
+        try:
+            while True:
+                if self._stop.is_set():
+                    await self._release(campaign_id)
+                    return
+
+                rows = await cursor.to_list(NEWSLETTER_BATCH_SIZE)
+                if not rows:
+                    break
+
+                # Entregas ya registradas por una corrida interrumpida a mitad del lote
+                recorded = set(await self._deliveries().distinct(
+                    "subscriber_id",
+                    {"campaign_id": str(campaign_id), "subscriber_id": {"$in": [str(row["_id"]) for row in rows]}},
+                ))
+                recipients = [
+                    Recipient(str(row["_id"]), row["email"]) for row in rows if str(row["_id"]) not in recorded
+                ]
+
+                results, interrupted = await self._send(executor, pool, limiter, message, recipients)
+                sent = sum(1 for result in results if result.status == SENT)
+                failed = sum(1 for result in results if result.status == FAILED)
+                values = None if interrupted else {"last_subscriber_id": str(rows[-1]["_id"])}
+
+                status = await self._checkpoint(
+                    campaign_id, results, {"sent_count": sent, "failed_count": failed}, values
+                )
+                if status is None:
+                    logger.warning("Campaña %s: se perdió el lease, otro worker la continúa", campaign_id)
+                    return
+                if interrupted:
+                    logger.warning("Campaña %s: SMTP no disponible, se reanuda más tarde", campaign_id)
+                    await self._release(campaign_id, retry_in_seconds=NEWSLETTER_SMTP_DOWN_BACKOFF_SECONDS)
+                    return
+                if status == "paused":
+                    await self._release(campaign_id)
+                    return
+        finally:
+            await cursor.close()
+
+        # 2) Reintento de entregas fallidas; se relee por si lo pidieron durante el envío
+        if not retry_failed:
+            current = await self._campaigns().find_one({"_id": campaign_id}, {"retry_failed": 1})
+            retry_failed = bool(current and current.get("retry_failed"))
+        if retry_failed:
+            delivery_cursor = None
+            while True:
+                if self._stop.is_set():
+                    await self._release(campaign_id)
+                    return
+
+                filters = {"campaign_id": str(campaign_id), "status": FAILED}
+                if delivery_cursor is not None:
+                    filters["_id"] = {"$gt": delivery_cursor}
+                rows = await self._deliveries().find(
+                    filters, {"subscriber_id": 1, "email": 1}
+                ).sort("_id", 1).limit(NEWSLETTER_BATCH_SIZE).to_list(NEWSLETTER_BATCH_SIZE)
+                if not rows:
+                    break
+
+                recipients = [Recipient(row["subscriber_id"], row["email"]) for row in rows]
+                results, interrupted = await self._send(executor, pool, limiter, message, recipients)
+                recovered = sum(1 for result in results if result.status == SENT)
+                status = await self._checkpoint(
+                    campaign_id, results, {"sent_count": recovered, "failed_count": -recovered}
+                )
+                if status is None:
+                    return
+                if interrupted:
+                    await self._release(campaign_id, retry_in_seconds=NEWSLETTER_SMTP_DOWN_BACKOFF_SECONDS)
+                    return
+                if status == "paused":
+                    await self._release(campaign_id)
+                    return
+                delivery_cursor = rows[-1]["_id"]
+
+        await self._release(
+            campaign_id,
+            status="completed",
+            retry_failed=False,
+            finished_at=datetime.utcnow(),
+        )
+        logger.info("Campaña %s completada", campaign_id)
+
+
+mongo_newsletter_dispatcher = MongoNewsletterDispatcher()
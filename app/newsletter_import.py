@@ -0,0 +1,107 @@
+"""
+Lectura de listas de suscriptores en CSV para importaciones masivas del newsletter
+"""
+import codecs
+import csv
+import re
+from typing import BinaryIO, Dict, Iterator, List
+
+IMPORT_BATCH_SIZE = 1000
+EMAIL_REGEX = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+EMAIL_COLUMNS = {"email", "correo", "e-mail", "mail"}
+
+
+def normalize_email(email: str) -> str:
+    """Forma canónica usada en el índice único (sin espacios y en minúsculas)"""
+    return (email or "").strip().lower()
+
+
+def iter_email_batches(
+    stream: BinaryIO,
+    stats: Dict[str, int],
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> Iterator[List[str]]:
+    """
+    Recorre el CSV sin cargarlo completo en memoria y entrega lotes de emails
+    normalizados y únicos dentro del archivo. Usa la columna email/correo si el
+    archivo trae encabezado; si no, la primera columna.
+
+    `stats` se actualiza con las filas leídas, inválidas y duplicadas en el archivo.
+    """
+    reader = csv.reader(codecs.iterdecode(stream, "utf-8-sig"))
+    seen = set()
+    batch: List[str] = []
+    column = 0
+
+    for line_number, row in enumerate(reader):
+        if not row:
+            continue
+
+        if line_number == 0:
+            header = [cell.strip().lower() for cell in row]
+            matches = [index for index, name in enumerate(header) if name in EMAIL_COLUMNS]
+            if matches:
+                column = matches[0]
+                continue
+
+        stats["rows"] += 1
+        email = normalize_email(row[column] if column < len(row) else "")
+        if not EMAIL_REGEX.match(email):
+            stats["invalid"] += 1
+            continue
+        if email in seen:
+            stats["duplicated_in_file"] += 1
+            continue
+
+        seen.add(email)
+        batch.append(email)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def new_import_stats() -> Dict[str, int]:
+    return {"rows": 0, "invalid": 0, "duplicated_in_file": 0, "inserted": 0, "already_subscribed": 0}
+
+
+async def ensure_mongo_newsletter_emails() -> int:
+    """
+    Normaliza los correos de suscriptores guardados antes del índice sobre el email
+    normalizado. Los que solo difieren en mayúsculas o espacios se fusionan en uno
+    (activo si alguno lo estaba, con la fecha de suscripción más antigua).
+    Devuelve cuántos grupos se corrigieron.
+    """
+    from app.mongodb_models import NewsletterSubscriber
+
+    collection = NewsletterSubscriber.get_motor_collection()
+    pipeline = [
+        {"$group": {
+            "_id": {"$toLower": {"$trim": {"input": "$email"}}},
+            "ids": {"$push": "$_id"},
+            "emails": {"$push": "$email"},
+            "active": {"$max": "$active"},
+            "subscribed_at": {"$min": "$subscribed_at"},
+        }},
+        # Solo los grupos con duplicados o con algún correo sin normalizar
+        {"$match": {"$expr": {"$or": [
+            {"$gt": [{"$size": "$ids"}, 1]},
+            {"$ne": [{"$arrayElemAt": ["$emails", 0]}, "$_id"]},
+        ]}}},
+    ]
+    fixed = 0
+    async for group in collection.aggregate(pipeline):
+        email = group["_id"]
+        # Se conserva el documento que ya tenía el correo normalizado, si existe
+        keep = group["ids"][group["emails"].index(email)] if email in group["emails"] else group["ids"][0]
+        duplicates = [doc_id for doc_id in group["ids"] if doc_id != keep]
+        if duplicates:
+            await collection.delete_many({"_id": {"$in": duplicates}})
+        changes = {"email": email, "active": bool(group["active"])}
+        if group.get("subscribed_at"):
+            changes["subscribed_at"] = group["subscribed_at"]
+        await collection.update_one({"_id": keep}, {"$set": changes})
+        fixed += 1
+    return fixed
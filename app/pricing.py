@@ -0,0 +1,185 @@
+"""
+Motor de cotización.
+
+Cotiza un conjunto de vehículos para un mismo rango de fechas en una sola pasada:
+el periodo (días completos y horas sueltas) y las reglas de descuento que aplican
+se calculan una vez por lote, y por vehículo solo queda la aritmética con sus
+tarifas. Lo usan POST /api/quotes, los listados con fechas y la creación/edición de
+reservaciones, así que el precio cotizado es el mismo que se cobra.
+
+Tarifa base:
+  - sin price_per_hour: días completos, mínimo 1 (como antes);
+  - con price_per_hour: días completos + horas sueltas a tarifa por hora, sin pasar
+    del precio de un día; una renta de menos de un día se cobra solo por horas.
+Descuentos, acumulados en orden y cada uno sobre el subtotal anterior:
+  1. por duración: PRICING_DURATION_DISCOUNTS="7:10,30:20" (10% desde 7 días, 20%
+     desde 30); aplica el escalón más alto alcanzado;
+  2. la promoción elegida por el cliente.
+El descuento total no pasa de PRICING_MAX_DISCOUNT_PERCENT del precio base.
+"""
+import math
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Any, Iterable, List, Optional, Tuple
+
+CENT = Decimal("0.01")
+HOUR = timedelta(hours=1)
+
+
+def parse_duration_discounts(raw: Optional[str]) -> List[Tuple[int, Decimal]]:
+    """'7:10,30:20' -> [(7, 10), (30, 20)]; ignora entradas mal formadas"""
+    tiers = []
+    for part in (raw or "").split(","):
+        min_days, _, percent = part.partition(":")
+        try:
+            tiers.append((int(min_days), Decimal(percent.strip())))
+        except (ValueError, InvalidOperation):
+            continue
+    return sorted(tier for tier in tiers if tier[0] > 0 and tier[1] > 0)
+
+
+DURATION_DISCOUNTS = parse_duration_discounts(os.getenv("PRICING_DURATION_DISCOUNTS", ""))
+MAX_DISCOUNT_PERCENT = Decimal(os.getenv("PRICING_MAX_DISCOUNT_PERCENT", "100"))
+
+
+def _money(value: Decimal) -> Decimal:
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _decimal(value) -> Optional[Decimal]:
+    if value is None or value == "":
+        return None
+    return Decimal(str(value))
+
+
+@dataclass(frozen=True)
+class RentalPeriod:
+    full_days: int
+    extra_hours: int  # horas sueltas, redondeadas hacia arriba
+    billed_days: int  # días cobrados con tarifa diaria (mínimo 1): total_days de la reservación
+
+    @classmethod
+    def between(cls, start_date: datetime, end_date: datetime) -> "RentalPeriod":
+        delta = max(end_date - start_date, timedelta(0))
+        full_days = delta.days
+        extra_hours = math.ceil((delta - timedelta(days=full_days)) / HOUR)
+        if extra_hours >= 24:
+            full_days, extra_hours = full_days + 1, 0
+        return cls(full_days=full_days, extra_hours=extra_hours, billed_days=max(1, delta.days))
+
+
+@dataclass(frozen=True)
+class DiscountRule:
+    code: str
+    label: str
+    percent: Decimal
+
+
+@dataclass
+class Quote:
+    vehicle_id: Any
+    total_days: int
+    hours: int
+    price_per_day: Decimal
+    price_per_hour: Optional[Decimal]
+    base_price: Decimal
+    total_price: Decimal
+    discounts: List[dict] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "vehicle_id": self.vehicle_id,
+            "total_days": self.total_days,
+            "hours": self.hours,
+            "price_per_day": self.price_per_day,
+            "price_per_hour": self.price_per_hour,
+            "base_price": self.base_price,
+            "discounts": self.discounts,
+            "discount_total": sum((item["amount"] for item in self.discounts), Decimal("0.00")),
+            "total_price": self.total_price,
+        }
+
+
+def _rates(vehicle) -> Tuple[Any, Decimal, Optional[Decimal]]:
+    """Acepta un dict del catálogo o un modelo (SQL/Beanie)"""
+    if isinstance(vehicle, dict):
+        vehicle_id, daily, hourly = vehicle.get("id"), vehicle.get("price_per_day"), vehicle.get("price_per_hour")
+    else:
+        vehicle_id, daily, hourly = vehicle.id, vehicle.price_per_day, vehicle.price_per_hour
+    hourly = _decimal(hourly)
+    return vehicle_id, _decimal(daily) or Decimal("0"), hourly if hourly and hourly > 0 else None
+
+
+class PricingEngine:
+    def __init__(
+        self,
+        duration_discounts: Optional[List[Tuple[int, Decimal]]] = None,
+        max_discount_percent: Optional[Decimal] = None,
+    ):
+        self.duration_discounts = DURATION_DISCOUNTS if duration_discounts is None else duration_discounts
+        self.max_discount_percent = MAX_DISCOUNT_PERCENT if max_discount_percent is None else max_discount_percent
+
+    def rules_for(self, period: RentalPeriod, promotion: Optional[dict] = None) -> List[DiscountRule]:
+        rules = []
+        reached = [tier for tier in self.duration_discounts if period.billed_days >= tier[0]]
+        if reached:
+            min_days, percent = reached[-1]
+            rules.append(DiscountRule("duration", f"Renta de {min_days} días o más", percent))
+        if promotion:
+            percent = Decimal(str(promotion.get("descuento", 0)))
+            if percent > 0:
+                rules.append(DiscountRule("promotion", promotion.get("titulo") or "Promoción", percent))
+        return rules
+
+    def quote_many(
+        self,
+        vehicles: Iterable,
+        start_date: datetime,
+        end_date: datetime,
+        promotion: Optional[dict] = None,
+    ) -> List[Quote]:
+        period = RentalPeriod.between(start_date, end_date)
+        rules = [(rule, rule.percent / 100) for rule in self.rules_for(period, promotion)]
+        max_ratio = min(max(self.max_discount_percent, Decimal("0")), Decimal("100")) / 100
+        return [self._price(vehicle, period, rules, max_ratio) for vehicle in vehicles]
+
+    def quote(self, vehicle, start_date: datetime, end_date: datetime, promotion: Optional[dict] = None) -> Quote:
+        return self.quote_many([vehicle], start_date, end_date, promotion)[0]
+
+    @staticmethod
+    def _price(vehicle, period: RentalPeriod, rules: list, max_ratio: Decimal) -> Quote:
+        vehicle_id, daily, hourly = _rates(vehicle)
+
+        if hourly is not None:
+            hours = period.extra_hours
+            base = _money(daily * period.full_days + min(hourly * hours, daily))
+        else:
+            hours = 0
+            base = _money(daily * period.billed_days)
+
+        floor = base - _money(base * max_ratio)
+        total = base
+        discounts = []
+        for rule, ratio in rules:
+            amount = min(_money(total * ratio), total - floor)
+            if amount <= 0:
+                continue
+            total -= amount
+            discounts.append({"code": rule.code, "label": rule.label, "percent": rule.percent, "amount": amount})
+
+        return Quote(
+            vehicle_id=vehicle_id,
+            total_days=period.billed_days,
+            hours=hours,
+            price_per_day=daily,
+            price_per_hour=hourly,
+            base_price=base,
+            total_price=max(total, Decimal("0.00")),
+            discounts=discounts,
+        )
+
+
+pricing_engine = PricingEngine()
+
@@ -0,0 +1,156 @@
+"""
+Cache de cotizaciones por proceso.
+
+Clave: (vehicle_id, inicio, fin, promotion_id, versión de precios). La versión de
+precios junta los contadores de "vehicles" y "promotions" (app/table_versions.py) y
+el día actual, así que un cambio de tarifa o de promoción en cualquier worker deja
+inalcanzables las entradas viejas, y una promoción que vence a medianoche no se
+sigue aplicando. Las escrituras del propio proceso además borran lo afectado
+(invalidate_vehicle / invalidate_promotions).
+
+Las promociones validadas se guardan en la misma estructura, para que una cotización
+repetida no vuelva a consultarlas. Tamaño acotado (LRU) y TTL por entrada.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from app.pricing import pricing_engine
+
+QUOTE_CACHE_MAX_ENTRIES = int(os.getenv("QUOTE_CACHE_MAX_ENTRIES", "20000"))
+QUOTE_CACHE_TTL_SECONDS = float(os.getenv("QUOTE_CACHE_TTL_SECONDS", "300"))
+
+_PROMOTION = "promotion"
+
+
+def price_version(vehicles_version: int, promotions_version: int) -> Tuple[int, int, str]:
+    return vehicles_version, promotions_version, date.today().isoformat()
+
+
+class QuoteCache:
+    def __init__(self, max_entries: int = QUOTE_CACHE_MAX_ENTRIES, ttl_seconds: float = QUOTE_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _get(self, key: Hashable, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _put(self, key: Hashable, value: Any, now: float) -> None:
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # --- Promociones validadas ---
+
+    def get_promotion(self, promotion_id, version: Hashable) -> Optional[dict]:
+        with self._lock:
+            return self._get((_PROMOTION, promotion_id, version), time.monotonic())
+
+    def put_promotion(self, promotion_id, version: Hashable, promotion: dict) -> None:
+        with self._lock:
+            self._put((_PROMOTION, promotion_id, version), promotion, time.monotonic())
+
+    # --- Cotizaciones ---
+
+    def quote_many(
+        self,
+        vehicles: List[dict],
+        start_date: datetime,
+        end_date: datetime,
+        promotion: Optional[dict],
+        version: Hashable,
+    ) -> List[dict]:
+        """Cotizaciones (dicts) en el orden de `vehicles`; las faltantes se calculan en un solo lote"""
+        promotion_id = promotion["id"] if promotion else None
+        keys = [(vehicle["id"], start_date, end_date, promotion_id, version) for vehicle in vehicles]
+
+        now = time.monotonic()
+        with self._lock:
+            results = [self._get(key, now) for key in keys]
+
+        missing = [position for position, result in enumerate(results) if result is None]
+        if missing:
+            quotes = pricing_engine.quote_many([vehicles[position] for position in missing], start_date, end_date, promotion)
+            with self._lock:
+                for position, quote in zip(missing, quotes):
+                    results[position] = quote.to_dict()
+                    self._put(keys[position], results[position], now)
+        return results
+
+    # --- Invalidación y métricas ---
+
+    def invalidate_vehicle(self, vehicle_id) -> None:
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == vehicle_id]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def invalidate_promotions(self) -> None:
+        """Las promociones afectan cualquier cotización con promoción: se descartan esas y las validadas"""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == _PROMOTION or key[3] is not None]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Contadores para exponer como métricas"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+quote_cache = QuoteCache()
+
+
+def with_quotes(
+    vehicles: List[dict],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    version: Hashable,
+) -> List[dict]:
+    """Copias de los dicts del catálogo con su cotización para el rango (sin tocar el catálogo)"""
+    if not start_date or not end_date or end_date <= start_date:
+        return vehicles
+    quotes = quote_cache.quote_many(vehicles, start_date, end_date, None, version)
+    return [{**vehicle, "quote": quote} for vehicle, quote in zip(vehicles, quotes)]
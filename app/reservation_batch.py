@@ -0,0 +1,64 @@
+"""
+Utilidades de POST /api/reservations/batch, compartidas por los dos backends.
+
+El lote se valida completo antes de escribir: vehículos en una consulta,
+disponibilidad en otra y, aquí, los choques entre solicitudes del mismo lote (el
+mismo vehículo dos veces en fechas traslapadas). Cada solicitud es una tupla
+(índice en el lote, vehicle_id, inicio, fin).
+"""
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+BatchRequest = Tuple[int, object, datetime, datetime]
+
+ALL_OR_NOTHING = "all_or_nothing"
+BEST_EFFORT = "best_effort"
+
+
+def as_utc(value: datetime) -> datetime:
+    """Las fechas sin zona (MongoDB, SQLite) se toman como UTC para poder compararlas"""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def overlaps(start_a: datetime, end_a: datetime, start_b: datetime, end_b: datetime) -> bool:
+    return as_utc(start_a) < as_utc(end_b) and as_utc(end_a) > as_utc(start_b)
+
+
+def find_overlapping_requests(requests: Iterable[BatchRequest]) -> Dict[int, int]:
+    """
+    Solicitudes que piden un vehículo ya pedido antes en el lote para fechas
+    traslapadas: {índice rechazado: índice de la solicitud con la que choca}.
+    Gana la que aparece primero en el lote, sin importar la duración.
+    """
+    accepted: Dict[object, List[Tuple[datetime, datetime, int]]] = {}
+    overlapping: Dict[int, int] = {}
+    for index, vehicle_id, start_date, end_date in sorted(requests, key=lambda request: request[0]):
+        ranges = accepted.setdefault(vehicle_id, [])
+        conflict = next(
+            (other for other_start, other_end, other in ranges if overlaps(start_date, end_date, other_start, other_end)),
+            None,
+        )
+        if conflict is None:
+            ranges.append((start_date, end_date, index))
+        else:
+            overlapping[index] = conflict
+    return overlapping
+
+
+def group_by_range(requests: Iterable[BatchRequest]) -> Dict[Tuple[datetime, datetime], List[BatchRequest]]:
+    """Solicitudes agrupadas por rango de fechas: el motor de precios cotiza cada rango en un lote"""
+    groups: Dict[Tuple[datetime, datetime], List[BatchRequest]] = {}
+    for request in requests:
+        groups.setdefault((request[2], request[3]), []).append(request)
+    return groups
+
+
+def batch_failures(errors: Dict[int, str], vehicle_ids: List) -> List[dict]:
+    return [
+        {"index": index, "vehicle_id": vehicle_ids[index], "detail": detail}
+        for index, detail in sorted(errors.items())
+    ]
+
+
+def should_reject(mode: str, accepted: List[int], errors: Dict[int, str]) -> bool:
+    return not accepted or (bool(errors) and mode == ALL_OR_NOTHING)
@@ -0,0 +1,211 @@
+"""
+Transiciones automáticas del ciclo de vida de las reservaciones.
+
+Cada corrida avanza por fechas, con UPDATEs por lotes (sin cargar objetos):
+  confirmed -> in_progress   cuando start_date <= ahora < end_date
+  confirmed/in_progress -> completed   cuando end_date <= ahora
+y actualiza los vehículos afectados: in_use mientras la reservación está en curso,
+reserved si todavía tienen otra confirmada y available cuando ya no tienen ninguna.
+
+Los UPDATE masivos no pasan por los eventos de flush de la sesión, así que los
+contadores de table_versions y los casos CRM se actualizan aquí explícitamente.
+"""
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Set
+
+from sqlalchemy import exists, select, update
+from sqlalchemy.orm import Session
+
+from app.crm_cases import refresh_crm_cases
+from app.db_models import Reservation, Vehicle
+from app.scheduler import AsyncLeasedJob, LeasedJob
+from app.table_versions import bump_collection_versions, bump_table_versions
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_LIFECYCLE_INTERVAL_SECONDS = float(os.getenv("RESERVATION_LIFECYCLE_INTERVAL_SECONDS", "60"))
+RESERVATION_LIFECYCLE_BATCH_SIZE = int(os.getenv("RESERVATION_LIFECYCLE_BATCH_SIZE", "500"))
+
+BOOKED_STATUS = ("confirmed", "in_progress")
+
+
+def _transition(db: Session, criteria: list, new_status: str, now: datetime) -> List[int]:
+    """Cambia el estado por lotes de ids; devuelve los vehicle_id afectados"""
+    vehicle_ids: List[int] = []
+    while True:
+        batch = (
+            select(Reservation.id)
+            .where(*criteria)
+            .limit(RESERVATION_LIFECYCLE_BATCH_SIZE)
+        )
+        rows = db.execute(
+            update(Reservation)
+            .where(Reservation.id.in_(batch))
+            .values(status=new_status, updated_at=now)
+            .returning(Reservation.id, Reservation.vehicle_id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        if rows:
+            vehicle_ids.extend(row.vehicle_id for row in rows)
+            bump_table_versions(db, ["reservations"])
+            refresh_crm_cases(db, [row.id for row in rows])
+            db.commit()
+        if len(rows) < RESERVATION_LIFECYCLE_BATCH_SIZE:
+            return vehicle_ids
+
+
+def _update_vehicles(db: Session, vehicle_ids: Set[int], from_status: tuple, new_status: str, *criteria) -> int:
+    updated = 0
+    ids = sorted(vehicle_ids)
+    for start in range(0, len(ids), RESERVATION_LIFECYCLE_BATCH_SIZE):
+        chunk = ids[start:start + RESERVATION_LIFECYCLE_BATCH_SIZE]
+        result = db.execute(
+            update(Vehicle)
+            .where(Vehicle.id.in_(chunk), Vehicle.status.in_(from_status), *criteria)
+            .values(status=new_status, updated_at=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+        updated += result.rowcount
+    if updated:
+        bump_table_versions(db, ["vehicles"])
+        db.commit()
+    return updated
+
+
+def advance_reservation_lifecycle(db: Session) -> Dict[str, int]:
+    now = datetime.now(timezone.utc)
+
+    finished = _transition(
+        db,
+        [Reservation.status.in_(BOOKED_STATUS), Reservation.end_date <= now],
+        "completed",
+        now,
+    )
+    started = _transition(
+        db,
+        [Reservation.status == "confirmed", Reservation.start_date <= now, Reservation.end_date > now],
+        "in_progress",
+        now,
+    )
+
+    def has_reservation(*statuses):
+        return exists().where(Reservation.vehicle_id == Vehicle.id, Reservation.status.in_(statuses))
+
+    in_use = _update_vehicles(db, set(started), ("available", "reserved"), "in_use")
+    # Al terminar: reserved si el vehículo tiene otra reservación confirmada, si no available
+    still_reserved = _update_vehicles(
+        db, set(finished), ("in_use",), "reserved",
+        ~has_reservation("in_progress"), has_reservation("confirmed"),
+    )
+    released = _update_vehicles(
+        db, set(finished), ("reserved", "in_use"), "available",
+        ~has_reservation(*BOOKED_STATUS),
+    )
+
+    counts = {
+        "completed": len(finished),
+        "in_progress": len(started),
+        "vehicles_in_use": in_use,
+        "vehicles_reserved": still_reserved,
+        "vehicles_released": released,
+    }
+    if finished or started:
+        logger.info("Ciclo de vida de reservaciones: %s", counts)
+    return counts
+
+
+reservation_lifecycle_job = LeasedJob(
+    "reservation-lifecycle",
+    advance_reservation_lifecycle,
+    RESERVATION_LIFECYCLE_INTERVAL_SECONDS,
+)
+
+
+# --- MongoDB ---
+
+async def _mongo_transition(collection, criteria: dict, new_status: str, now: datetime) -> List[str]:
+    vehicle_ids: List[str] = []
+    while True:
+        docs = await collection.find(criteria, {"vehicle_id": 1}).limit(
+            RESERVATION_LIFECYCLE_BATCH_SIZE
+        ).to_list(length=RESERVATION_LIFECYCLE_BATCH_SIZE)
+        if not docs:
+            return vehicle_ids
+
+        # Se repite el criterio por si un admin cambió el estado entre el find y el update
+        await collection.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in docs]}, **criteria},
+            {"$set": {"status": new_status, "updated_at": now}},
+        )
+        vehicle_ids.extend(doc["vehicle_id"] for doc in docs)
+        await bump_collection_versions("reservations")
+        if len(docs) < RESERVATION_LIFECYCLE_BATCH_SIZE:
+            return vehicle_ids
+
+
+async def advance_reservation_lifecycle_mongo() -> Dict[str, int]:
+    from bson import ObjectId
+    from app.mongodb_models import Reservation as ReservationDocument, Vehicle as VehicleDocument
+
+    now = datetime.utcnow()
+    reservations = ReservationDocument.get_motor_collection()
+    vehicles = VehicleDocument.get_motor_collection()
+
+    finished = await _mongo_transition(
+        reservations,
+        {"status": {"$in": list(BOOKED_STATUS)}, "end_date": {"$lte": now}},
+        "completed",
+        now,
+    )
+    started = await _mongo_transition(
+        reservations,
+        {"status": "confirmed", "start_date": {"$lte": now}, "end_date": {"$gt": now}},
+        "in_progress",
+        now,
+    )
+
+    async def vehicles_with(vehicle_ids, statuses) -> Set[str]:
+        return set(await reservations.distinct(
+            "vehicle_id", {"vehicle_id": {"$in": list(vehicle_ids)}, "status": {"$in": list(statuses)}}
+        ))
+
+    async def set_status(vehicle_ids, from_status, new_status) -> int:
+        object_ids = [ObjectId(vehicle_id) for vehicle_id in vehicle_ids if ObjectId.is_valid(vehicle_id)]
+        if not object_ids:
+            return 0
+        result = await vehicles.update_many(
+            {"_id": {"$in": object_ids}, "status": {"$in": list(from_status)}},
+            {"$set": {"status": new_status, "updated_at": now}},
+        )
+        return result.modified_count
+
+    in_use = await set_status(set(started), ("available", "reserved"), "in_use")
+
+    finished_ids = set(finished)
+    in_progress = await vehicles_with(finished_ids, ("in_progress",))
+    confirmed = await vehicles_with(finished_ids - in_progress, ("confirmed",))
+    still_reserved = await set_status(confirmed, ("in_use",), "reserved")
+    released = await set_status(finished_ids - in_progress - confirmed, ("reserved", "in_use"), "available")
+
+    if in_use or still_reserved or released:
+        await bump_collection_versions("vehicles")
+
+    counts = {
+        "completed": len(finished),
+        "in_progress": len(started),
+        "vehicles_in_use": in_use,
+        "vehicles_reserved": still_reserved,
+        "vehicles_released": released,
+    }
+    if finished or started:
+        logger.info("Ciclo de vida de reservaciones: %s", counts)
+    return counts
+
+
+reservation_lifecycle_mongo_job = AsyncLeasedJob(
+    "reservation-lifecycle",
+    advance_reservation_lifecycle_mongo,
+    RESERVATION_LIFECYCLE_INTERVAL_SECONDS,
+)
@@ -1,3 +1,4 @@
+import asyncio
 import re
 from datetime import datetime, timezone
 from typing import Optional
@@ -105,7 +106,7 @@ async def register(payload: RegisterRequest):
             full_name=payload.full_name.strip(),
             email=email,
             phone=phone,
-            password_hash=hash_password(payload.password),
+            password_hash=await asyncio.to_thread(hash_password, payload.password),
             role=UserRole.CLIENT,
         )
 
@@ -135,7 +136,11 @@ async def login(payload: LoginRequest):
     email = payload.email.lower().strip()
     user = await User.find_one(User.email == email)
 
-    if not user or not user.password_hash or not verify_password(payload.password, user.password_hash):
+    # bcrypt es CPU-bound: se ejecuta fuera del event loop
+    password_ok = bool(user and user.password_hash) and await asyncio.to_thread(
+        verify_password, payload.password, user.password_hash
+    )
+    if not password_ok:
         raise HTTPException(status_code=401, detail="Credenciales invalidas.")
 
     user_role = normalize_role(user.role.value)
@@ -227,7 +232,7 @@ async def reset_password(payload: ResetPasswordRequest):
         raise HTTPException(status_code=400, detail="Token invalido.")
 
     # Actualizar contraseña
-    user.password_hash = hash_password(payload.password)
+    user.password_hash = await asyncio.to_thread(hash_password, payload.password)
     await user.save()
     
     # Marcar token como usado
@@ -1,27 +1,39 @@
-from datetime import datetime, timedelta, timezone
+import time
+from datetime import date, datetime, timezone
 from decimal import Decimal
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session, joinedload
 
+from app.crm_cases import (
+    ACCEPTED_PAYMENT_STATUS,
+    PAID_RESERVATION_STATUS,
+    PAYMENT_ALERT_THRESHOLD_DAYS,
+    count_crm_cases,
+    crm_case_to_dict,
+    infer_refund_status,
+    normalize_case_status,
+    normalize_status,
+    to_utc_datetime,
+)
+from app.crm_search import search_crm_cases
 from app.db import get_db
-from app.db_models import Invoice, Payment, Reservation, SupportTicket, User, UserRole, Vehicle
+from app.db_models import CrmCase, Invoice, Payment, Reservation, User, UserRole, Vehicle
+from app.fast_json import fast_json_response
+from app.http_cache import ADMIN_ETAG_WINDOW_SECONDS, build_etag, conditional_response
+from app.invoicing import invoice_worker, regenerate_invoices
 from app.security import decode_access_token
+from app.table_versions import get_table_versions
+from app.quote_cache import quote_cache
+from app.vehicle_catalog import vehicle_catalog
 
 router = APIRouter(prefix="/api/admin", tags=["Admin"])
 
 ALLOWED_RESERVATION_STATUS = {"pending", "confirmed", "in_progress", "completed", "cancelled"}
 ALLOWED_VEHICLE_STATUS = {"available", "reserved", "in_use", "maintenance", "unavailable"}
 VALID_ROLES = {UserRole.CLIENT.value, UserRole.ADMIN.value}
-PAID_RESERVATION_STATUS = {"confirmed", "in_progress", "completed"}
-ACCEPTED_PAYMENT_STATUS = {"accepted"}
-REFUNDED_PAYMENT_STATUS = {"refunded", "reimbursed"}
-ACTIVE_RESERVATION_STATUS = {"pending", "confirmed", "in_progress"}
-PAYMENT_ALERT_RESERVATION_STATUS = {"pending"}
-PAYMENT_ALERT_THRESHOLD_DAYS = 45
-CRM_SLA_HOURS = 48
 
 
 class AdminReservationUpdate(BaseModel):
@@ -40,6 +52,11 @@ class AdminUserRoleUpdate(BaseModel):
     role: str
 
 
+class AdminInvoiceRegenerate(BaseModel):
+    start_date: date
+    end_date: date
+
+
 def to_decimal(value) -> Decimal:
     if value is None:
         return Decimal("0")
@@ -48,47 +65,6 @@ def to_decimal(value) -> Decimal:
     return Decimal(str(value))
 
 
-def to_utc_datetime(value: Optional[datetime]) -> Optional[datetime]:
-    if value is None:
-        return None
-    if value.tzinfo is None:
-        return value.replace(tzinfo=timezone.utc)
-    return value.astimezone(timezone.utc)
-
-
-def normalize_status(status: Optional[str]) -> str:
-    return (status or "").strip().lower()
-
-
-def normalize_case_status(status: Optional[str]) -> str:
-    normalized = normalize_status(status)
-    if normalized in {"open", "abierto", "pending", "pendiente"}:
-        return "abierto"
-    if normalized in {"closed", "cerrado", "resolved", "resuelto"}:
-        return "cerrado"
-    return normalized or "abierto"
-
-
-def infer_refund_status(reservation_status: str, payment_status: str, is_paid: bool) -> str:
-    if payment_status in REFUNDED_PAYMENT_STATUS:
-        return "reembolsado"
-    if reservation_status == "cancelled" and is_paid:
-        return "pendiente"
-    return "no_aplica"
-
-
-def build_payment_alert_query(db: Session, cutoff: datetime):
-    return (
-        db.query(Reservation)
-        .options(joinedload(Reservation.user), joinedload(Reservation.payment))
-        .filter(
-            Reservation.status.in_(PAYMENT_ALERT_RESERVATION_STATUS),
-            Reservation.created_at <= cutoff,
-            ~Reservation.payment.has(Payment.status.in_(ACCEPTED_PAYMENT_STATUS)),
-        )
-    )
-
-
 def normalize_role(role: Optional[str]) -> str:
     role_value = (role or UserRole.CLIENT.value).strip().lower()
     if role_value not in VALID_ROLES:
@@ -119,6 +95,13 @@ def get_current_user_from_token(request: Request, db: Session) -> User:
     return user
 
 
+def admin_conditional_response(request: Request, response: Response, db: Session, tables):
+    """304 para polls del dashboard si las tablas leídas no cambiaron en la ventana actual"""
+    window = str(int(time.time() // ADMIN_ETAG_WINDOW_SECONDS))
+    etag = build_etag(request, get_table_versions(db, tables), extra=window)
+    return conditional_response(request, response, etag)
+
+
 def require_admin(request: Request, db: Session = Depends(get_db)) -> User:
     current_user = get_current_user_from_token(request, db)
     if normalize_role(current_user.role) != UserRole.ADMIN.value:
@@ -131,9 +114,6 @@ def get_admin_summary(
     db: Session = Depends(get_db),
     _: User = Depends(require_admin),
 ):
-    now_utc = datetime.now(timezone.utc)
-    alert_cutoff = now_utc - timedelta(days=PAYMENT_ALERT_THRESHOLD_DAYS)
-
     total_users = db.query(User).count()
     total_admins = db.query(User).filter(User.role == UserRole.ADMIN.value).count()
     total_clients = total_users - total_admins
@@ -146,7 +126,7 @@ def get_admin_summary(
 
     total_vehicles = db.query(Vehicle).count()
     active_vehicles = db.query(Vehicle).filter(Vehicle.is_active == True).count()
-    payment_alerts_count = build_payment_alert_query(db, alert_cutoff).count()
+    payment_alerts_count = db.query(CrmCase.id).filter(CrmCase.payment_alert == True).count()
 
     return {
         "users": {
@@ -171,10 +151,18 @@ def get_admin_summary(
 
 @router.get("/sales")
 def get_admin_sales(
+    request: Request,
+    response: Response,
     limit: int = Query(default=50, ge=1, le=200),
     db: Session = Depends(get_db),
     _: User = Depends(require_admin),
 ):
+    not_modified = admin_conditional_response(
+        request, response, db, ["payments", "reservations", "users"]
+    )
+    if not_modified:
+        return not_modified
+
     now_utc = datetime.now(timezone.utc)
     day_start = now_utc.replace(hour=0, minute=0, second=0, microsecond=0)
     month_start = day_start.replace(day=1)
@@ -266,7 +254,7 @@ def get_admin_sales(
         transactions.append(
             {
                 "id": reservation.id,
-                "folio": f"VT-{reservation.id:04d}",
+                "folio": reservation.folio or f"VT-{reservation.id:04d}",
                 "client": reservation.user.full_name if reservation.user else "Sin cliente",
                 "channel": reservation.pickup_location or "-",
                 "payment_method": normalize_status(payment.method) or "efectivo",
@@ -284,7 +272,7 @@ def get_admin_sales(
         transactions.append(
             {
                 "id": reservation.id,
-                "folio": f"VT-{reservation.id:04d}",
+                "folio": reservation.folio or f"VT-{reservation.id:04d}",
                 "client": reservation.user.full_name if reservation.user else "Sin cliente",
                 "channel": reservation.pickup_location or "-",
                 "payment_method": "sin_registro",
@@ -307,7 +295,7 @@ def get_admin_sales(
     )
     transactions = transactions[:limit]
 
-    return {
+    return fast_json_response({
         "totals": {
             "day": float(day_total),
             "month": float(month_total),
@@ -318,228 +306,95 @@ def get_admin_sales(
             "refund_pending": refund_pending,
         },
         "transactions": transactions,
-    }
+    }, response)
 
 
 @router.get("/payment-alerts")
 def get_payment_alerts(
+    request: Request,
+    response: Response,
     limit: int = Query(default=50, ge=1, le=200),
     db: Session = Depends(get_db),
     _: User = Depends(require_admin),
 ):
+    not_modified = admin_conditional_response(request, response, db, ["crm_cases"])
+    if not_modified:
+        return not_modified
+
     now_utc = datetime.now(timezone.utc)
-    cutoff = now_utc - timedelta(days=PAYMENT_ALERT_THRESHOLD_DAYS)
 
-    query = build_payment_alert_query(db, cutoff)
+    # Alertas precalculadas en crm_cases (ver app/crm_cases.py)
+    query = db.query(CrmCase).filter(CrmCase.payment_alert == True)
     total = query.count()
-    reservations = query.order_by(Reservation.created_at.asc()).limit(limit).all()
+    cases = query.order_by(CrmCase.reservation_created_at.asc()).limit(limit).all()
 
     alerts = []
-    for reservation in reservations:
-        created_at = to_utc_datetime(reservation.created_at)
+    for case in cases:
+        created_at = to_utc_datetime(case.reservation_created_at)
         days_without_payment = 0
         if created_at:
             days_without_payment = max(0, (now_utc - created_at).days)
 
         alerts.append(
             {
-                "reservation_id": reservation.id,
-                "folio": f"VT-{reservation.id:04d}",
-                "client": reservation.user.full_name if reservation.user else "Sin cliente",
-                "email": reservation.user.email if reservation.user else None,
-                "status": normalize_status(reservation.status) or "pending",
-                "amount_due": float(to_decimal(reservation.total_price)),
+                "reservation_id": case.reservation_id,
+                "folio": case.folio,
+                "client": case.client,
+                "email": case.email,
+                "status": case.reservation_status,
+                "amount_due": float(to_decimal(case.amount)),
                 "days_without_payment": days_without_payment,
-                "created_at": reservation.created_at,
+                "created_at": created_at,
             }
         )
 
-    return {
+    return fast_json_response({
         "total": total,
         "threshold_days": PAYMENT_ALERT_THRESHOLD_DAYS,
         "alerts": alerts,
-    }
+    }, response)
 
 
 @router.get("/crm")
 def get_crm_cases(
+    request: Request,
+    response: Response,
     limit: int = Query(default=80, ge=1, le=200),
+    skip: int = Query(default=0, ge=0),
+    status: Optional[str] = Query(default=None, description="abierto o cerrado"),
+    priority: Optional[str] = Query(default=None, description="alta o media"),
     db: Session = Depends(get_db),
     _: User = Depends(require_admin),
 ):
-    now_utc = datetime.now(timezone.utc)
-    payment_alert_cutoff = now_utc - timedelta(days=PAYMENT_ALERT_THRESHOLD_DAYS)
-
-    tickets = (
-        db.query(SupportTicket)
-        .options(
-            joinedload(SupportTicket.reservation).joinedload(Reservation.user),
-            joinedload(SupportTicket.reservation).joinedload(Reservation.payment),
-            joinedload(SupportTicket.reservation).joinedload(Reservation.invoice),
-        )
-        .order_by(SupportTicket.created_at.desc())
-        .limit(limit * 2)
-        .all()
-    )
-
-    reservations = (
-        db.query(Reservation)
-        .options(
-            joinedload(Reservation.user),
-            joinedload(Reservation.payment),
-            joinedload(Reservation.invoice),
-        )
-        .order_by(Reservation.created_at.desc())
-        .limit(limit * 2)
-        .all()
-    )
-
-    cases = []
-    ticketed_reservation_ids = set()
-
-    for ticket in tickets:
-        reservation = ticket.reservation
-        if not reservation:
-            continue
-
-        ticketed_reservation_ids.add(reservation.id)
-
-        reservation_status = normalize_status(reservation.status)
-        payment = reservation.payment
-        payment_status = normalize_status(payment.status if payment else "")
-        is_paid = payment_status in ACCEPTED_PAYMENT_STATUS or reservation_status in PAID_RESERVATION_STATUS
-        updated_at = to_utc_datetime(ticket.updated_at) or to_utc_datetime(ticket.created_at)
-        refund_status = infer_refund_status(reservation_status, payment_status, is_paid)
-        case_status = normalize_case_status(ticket.status)
-        issue_type = normalize_status(ticket.issue_type) or "general"
-
-        priority = "media"
-        if issue_type in {"reembolso", "refund", "cancelacion", "cancelación"}:
-            priority = "alta"
-        if refund_status == "pendiente":
-            priority = "alta"
-
-        sla_at_risk = False
-        if case_status == "abierto" and updated_at:
-            sla_at_risk = (now_utc - updated_at) >= timedelta(hours=CRM_SLA_HOURS)
-
-        invoice = reservation.invoice
-        invoice_number = invoice.invoice_number if invoice else None
-
-        cases.append(
-            {
-                "case_id": f"TCK-{ticket.id:05d}",
-                "ticket_id": ticket.id,
-                "source": "ticket",
-                "reservation_id": reservation.id,
-                "folio": ticket.folio or f"VT-{reservation.id:04d}",
-                "client": reservation.user.full_name if reservation.user else "Sin cliente",
-                "email": ticket.contact_email or (reservation.user.email if reservation.user else None),
-                "phone": ticket.contact_phone or (reservation.user.phone if reservation.user else None),
-                "case_type": f"Ticket cliente: {issue_type}",
-                "priority": priority,
-                "status": case_status,
-                "reservation_status": reservation_status or "pending",
-                "refund_status": refund_status,
-                "channel": reservation.pickup_location or "-",
-                "amount": float(to_decimal(reservation.total_price)),
-                "invoice_number": invoice_number,
-                "message": ticket.message,
-                "last_update": updated_at,
-                "sla_at_risk": sla_at_risk,
-            }
-        )
-
-        if len(cases) >= limit:
-            break
-
-    for reservation in reservations:
-        if reservation.id in ticketed_reservation_ids:
-            continue
-
-        reservation_status = normalize_status(reservation.status)
-        payment = reservation.payment
-        payment_status = normalize_status(payment.status if payment else "")
-        is_paid = payment_status in ACCEPTED_PAYMENT_STATUS or (
-            not payment and reservation_status in PAID_RESERVATION_STATUS
-        )
-        created_at = to_utc_datetime(reservation.created_at)
-        updated_at = to_utc_datetime(reservation.updated_at) or created_at
-
-        case_type = None
-        priority = "media"
-        case_status = "abierto"
-        refund_status = infer_refund_status(reservation_status, payment_status, is_paid)
-
-        if reservation_status == "cancelled":
-            case_type = "Cancelacion o reembolso"
-            priority = "alta" if refund_status == "pendiente" else "media"
-            case_status = "abierto" if refund_status == "pendiente" else "cerrado"
-        elif created_at and created_at <= payment_alert_cutoff and not is_paid:
-            case_type = "Pago vencido"
-            priority = "alta"
-        elif reservation_status in ACTIVE_RESERVATION_STATUS:
-            case_type = "Seguimiento de reserva"
-            priority = "media"
-
-        if not case_type:
-            continue
-
-        sla_at_risk = False
-        if case_status == "abierto" and updated_at:
-            sla_at_risk = (now_utc - updated_at) >= timedelta(hours=CRM_SLA_HOURS)
-
-        invoice = reservation.invoice
-        invoice_number = invoice.invoice_number if invoice else None
-
-        cases.append(
-            {
-                "case_id": f"OPS-{reservation.id:05d}",
-                "ticket_id": None,
-                "source": "operacion",
-                "reservation_id": reservation.id,
-                "folio": f"VT-{reservation.id:04d}",
-                "client": reservation.user.full_name if reservation.user else "Sin cliente",
-                "email": reservation.user.email if reservation.user else None,
-                "phone": reservation.user.phone if reservation.user else None,
-                "case_type": case_type,
-                "priority": priority,
-                "status": case_status,
-                "reservation_status": reservation_status or "pending",
-                "refund_status": refund_status,
-                "channel": reservation.pickup_location or "-",
-                "amount": float(to_decimal(reservation.total_price)),
-                "invoice_number": invoice_number,
-                "message": reservation.admin_notes or reservation.notes or "Sin notas adicionales.",
-                "last_update": updated_at,
-                "sla_at_risk": sla_at_risk,
-            }
-        )
-
-        if len(cases) >= limit:
-            break
-
-    cases = sorted(
-        cases,
-        key=lambda case: to_utc_datetime(case.get("last_update")) or datetime.min.replace(tzinfo=timezone.utc),
-        reverse=True,
-    )[:limit]
-
-    open_cases = [case for case in cases if normalize_case_status(case["status"]) == "abierto"]
-    high_priority = [case for case in open_cases if case["priority"] == "alta"]
-    refunds_pending = [case for case in open_cases if case["refund_status"] == "pendiente"]
-    sla_at_risk = [case for case in open_cases if case["sla_at_risk"]]
-
-    return {
-        "totals": {
-            "total_cases": len(cases),
-            "open_cases": len(open_cases),
-            "high_priority": len(high_priority),
-            "refund_pending": len(refunds_pending),
-            "sla_at_risk": len(sla_at_risk),
-        },
-        "cases": cases,
-    }
+    not_modified = admin_conditional_response(request, response, db, ["crm_cases"])
+    if not_modified:
+        return not_modified
+
+    # Lectura paginada del índice crm_cases (ver app/crm_cases.py)
+    query = db.query(CrmCase).filter(CrmCase.hidden == False)
+    if status:
+        query = query.filter(CrmCase.status == normalize_case_status(status))
+    if priority:
+        query = query.filter(CrmCase.priority == normalize_status(priority))
+    cases = query.order_by(CrmCase.last_update.desc(), CrmCase.id.desc()).offset(skip).limit(limit).all()
+
+    return fast_json_response({
+        "totals": count_crm_cases(db),
+        "cases": [crm_case_to_dict(case) for case in cases],
+    }, response)
+
+
+@router.get("/search")
+def search_cases(
+    q: str = Query(..., min_length=1, max_length=200, description="Folio, cliente, email, teléfono o texto del mensaje"),
+    limit: int = Query(default=20, ge=1, le=100),
+    source: Optional[str] = Query(default=None, description="ticket u operacion"),
+    db: Session = Depends(get_db),
+    _: User = Depends(require_admin),
+):
+    """Búsqueda de texto completo sobre tickets y reservaciones (índice FTS5 de crm_cases)"""
+    results = search_crm_cases(db, q, limit=limit, source=normalize_status(source) or None)
+    return fast_json_response({"query": q, "total": len(results), "results": results})
 
 
 @router.get("/users")
@@ -552,7 +407,7 @@ def list_users(
     users = db.query(User).order_by(User.created_at.desc()).offset(skip).limit(limit).all()
     total = db.query(User).count()
 
-    return {
+    return fast_json_response({
         "total": total,
         "users": [
             {
@@ -565,7 +420,7 @@ def list_users(
             }
             for user in users
         ],
-    }
+    })
 
 
 @router.patch("/users/{user_id}/role")
@@ -607,7 +462,7 @@ def list_reservations(
     total = query.count()
     reservations = query.order_by(Reservation.created_at.desc()).offset(skip).limit(limit).all()
 
-    return {
+    return fast_json_response({
         "total": total,
         "reservations": [
             {
@@ -632,7 +487,7 @@ def list_reservations(
             }
             for reservation in reservations
         ],
-    }
+    })
 
 
 @router.patch("/reservations/{reservation_id}")
@@ -683,7 +538,7 @@ def list_vehicles(
     total = query.count()
     vehicles = query.order_by(Vehicle.created_at.desc()).offset(skip).limit(limit).all()
 
-    return {
+    return fast_json_response({
         "total": total,
         "vehicles": [
             {
@@ -701,7 +556,7 @@ def list_vehicles(
             }
             for vehicle in vehicles
         ],
-    }
+    })
 
 
 @router.patch("/vehicles/{vehicle_id}")
@@ -732,6 +587,9 @@ def update_vehicle(
 
     vehicle.updated_at = datetime.now(timezone.utc)
     db.commit()
+    vehicle_catalog.invalidate()
+    if payload.price_per_day is not None or payload.price_per_hour is not None:
+        quote_cache.invalidate_vehicle(vehicle.id)
     db.refresh(vehicle)
 
     return {
@@ -740,3 +598,26 @@ def update_vehicle(
         "status": vehicle.status,
         "is_active": vehicle.is_active,
     }
+
+
+@router.post("/invoices/regenerate", status_code=202)
+def regenerate_invoice_documents(
+    payload: AdminInvoiceRegenerate,
+    db: Session = Depends(get_db),
+    _: User = Depends(require_admin),
+):
+    """Vuelve a generar (en segundo plano) las facturas del rango de fechas"""
+    if payload.end_date < payload.start_date:
+        raise HTTPException(status_code=400, detail="La fecha final debe ser posterior a la inicial")
+
+    reservation_ids = regenerate_invoices(db, payload.start_date, payload.end_date)
+    db.commit()
+    queued = invoice_worker.submit_many(reservation_ids)
+
+    return {
+        "message": "Regeneracion de facturas en proceso",
+        "start_date": payload.start_date,
+        "end_date": payload.end_date,
+        "invoices": len(reservation_ids),
+        "queued": queued,
+    }
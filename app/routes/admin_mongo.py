@@ -1,16 +1,26 @@
 """
 Router de administración para MongoDB
 """
+import re
+import time
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from typing import Optional, List
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel, Field
 from beanie import PydanticObjectId
 
 from app.mongodb_models import User, UserRole, Vehicle, VehicleStatus, Reservation, ReservationStatus, Payment, PaymentStatus, SupportTicket, Newsletter
+from app.fast_json import fast_json_response
+from app.mongodb import get_analytics_collection
+from app.reservation_batch import as_utc
+from app.http_cache import ADMIN_ETAG_WINDOW_SECONDS, build_etag, conditional_response
 from app.security import decode_access_token
+from app.sequences import build_reservation_folio
+from app.table_versions import get_collection_versions
+from app.quote_cache import quote_cache
+from app.vehicle_catalog import mongo_vehicle_catalog
 
 router = APIRouter(prefix="/api/admin", tags=["Admin"])
 
@@ -21,6 +31,9 @@ PAID_RESERVATION_STATUS = {"confirmed", "in_progress", "completed"}
 ACCEPTED_PAYMENT_STATUS = {"accepted"}
 REFUNDED_PAYMENT_STATUS = {"refunded", "reimbursed"}
 ACTIVE_RESERVATION_STATUS = {"pending", "confirmed", "in_progress"}
+# Folios que acepta la búsqueda de tickets: reservación (VT-0001) y caso (CRM-<6 hex del _id>)
+RESERVATION_FOLIO_REGEX = re.compile(r"^VT-?(\d{1,10})$", re.IGNORECASE)
+CASE_FOLIO_REGEX = re.compile(r"^CRM-?([0-9A-F]{6})$", re.IGNORECASE)
 PAYMENT_ALERT_RESERVATION_STATUS = {"pending"}
 PAYMENT_ALERT_THRESHOLD_DAYS = 45
 CRM_SLA_HOURS = 48
@@ -98,6 +111,13 @@ async def get_current_user_from_token(request: Request) -> User:
     return user
 
 
+async def admin_conditional_response(request: Request, response: Response, collections):
+    """304 para polls del dashboard si las colecciones leídas no cambiaron en la ventana actual"""
+    window = str(int(time.time() // ADMIN_ETAG_WINDOW_SECONDS))
+    etag = build_etag(request, await get_collection_versions(collections), extra=window)
+    return conditional_response(request, response, etag)
+
+
 async def require_admin(request: Request) -> User:
     user = await get_current_user_from_token(request)
     if user.role != UserRole.ADMIN:
@@ -113,26 +133,31 @@ async def get_admin_summary(
     now_utc = datetime.now(timezone.utc)
     alert_cutoff = now_utc - timedelta(days=PAYMENT_ALERT_THRESHOLD_DAYS)
 
-    total_users = await User.count()
-    total_admins = await User.find(User.role == UserRole.ADMIN).count()
+    # Conteos de reporte: pueden leerse de un secundario
+    users = get_analytics_collection(User.get_collection_name())
+    reservations = get_analytics_collection(Reservation.get_collection_name())
+    vehicles = get_analytics_collection(Vehicle.get_collection_name())
+
+    total_users = await users.count_documents({})
+    total_admins = await users.count_documents({"role": UserRole.ADMIN.value})
     total_clients = total_users - total_admins
 
-    total_reservations = await Reservation.count()
-    pending_reservations = await Reservation.find(Reservation.status == ReservationStatus.PENDING).count()
-    active_reservations = await Reservation.find(
+    total_reservations = await reservations.count_documents({})
+    pending_reservations = await reservations.count_documents({"status": ReservationStatus.PENDING.value})
+    active_reservations = await reservations.count_documents(
         {"status": {"$in": ["pending", "confirmed", "in_progress"]}}
-    ).count()
+    )
 
-    total_vehicles = await Vehicle.count()
-    active_vehicles = await Vehicle.find(Vehicle.is_active == True).count()
+    total_vehicles = await vehicles.count_documents({})
+    active_vehicles = await vehicles.count_documents({"is_active": True})
     
     # Alertas de pago
-    payment_alerts_count = await Reservation.find(
+    payment_alerts_count = await reservations.count_documents(
         {
             "status": "pending",
             "created_at": {"$lte": alert_cutoff}
         }
-    ).count()
+    )
 
     return {
         "users": {
@@ -157,15 +182,48 @@ async def get_admin_summary(
 
 @router.get("/sales")
 async def get_admin_sales(
+    request: Request,
+    response: Response,
     limit: int = Query(default=50, ge=1, le=200),
     _: User = Depends(require_admin),
 ):
     """Obtener información de ventas y transacciones"""
+    not_modified = await admin_conditional_response(request, response, ["payments", "reservations", "users"])
+    if not_modified:
+        return not_modified
+
     now_utc = datetime.now(timezone.utc)
     day_start = now_utc.replace(hour=0, minute=0, second=0, microsecond=0)
     month_start = day_start.replace(day=1)
 
-    all_payments = await Payment.find_all().to_list()
+    # Reporte: pagos, reservaciones y clientes se leen (de un secundario si hay) en tres consultas
+    reservations_collection = get_analytics_collection(Reservation.get_collection_name())
+    all_payments = await get_analytics_collection(Payment.get_collection_name()).find({}).to_list(None)
+    reservation_oids = set()
+    for payment in all_payments:
+        try:
+            reservation_oids.add(PydanticObjectId(payment.get("reservation_id")))
+        except Exception:
+            continue
+    reservations_by_id = {
+        str(doc["_id"]): doc
+        for doc in await reservations_collection.find(
+            {"_id": {"$in": list(reservation_oids)}},
+            {"folio": 1, "user_id": 1, "pickup_location": 1, "status": 1},
+        ).to_list(None)
+    }
+    user_oids = set()
+    for doc in reservations_by_id.values():
+        try:
+            user_oids.add(PydanticObjectId(doc.get("user_id")))
+        except Exception:
+            continue
+    users_by_id = {
+        str(doc["_id"]): doc
+        for doc in await get_analytics_collection(User.get_collection_name()).find(
+            {"_id": {"$in": list(user_oids)}}, {"full_name": 1}
+        ).to_list(None)
+    }
     
     day_total = Decimal("0")
     month_total = Decimal("0")
@@ -176,46 +234,48 @@ async def get_admin_sales(
     transactions = []
 
     for payment in all_payments:
-        reservation = await Reservation.get(payment.reservation_id) if payment.reservation_id else None
-        user = await User.get(reservation.user_id) if reservation and reservation.user_id else None
+        reservation = reservations_by_id.get(str(payment.get("reservation_id")))
+        user = users_by_id.get(str(reservation.get("user_id"))) if reservation else None
+        created_at = as_utc(payment["created_at"]) if payment.get("created_at") else None
         
-        amount = to_decimal(payment.amount)
-        payment_status = normalize_status(payment.status)
-        reservation_status = normalize_status(reservation.status) if reservation else ""
+        amount = to_decimal(payment.get("amount"))
+        payment_status = normalize_status(payment.get("status"))
+        reservation_status = normalize_status(reservation.get("status")) if reservation else ""
         is_paid = payment_status in ACCEPTED_PAYMENT_STATUS
 
         if is_paid:
             paid_total += amount
             paid_count += 1
 
-            if payment.created_at and payment.created_at >= month_start:
+            if created_at and created_at >= month_start:
                 month_total += amount
-            if payment.created_at and payment.created_at >= day_start:
+            if created_at and created_at >= day_start:
                 day_total += amount
 
         if reservation_status == "cancelled" and is_paid:
             refund_pending += 1
 
+        payment_id = str(payment["_id"])
         transactions.append({
-            "id": str(payment.id),
-            "folio": f"VT-{str(payment.id)[-6:].upper()}",
-            "client": user.full_name if user else "Sin cliente",
-            "channel": reservation.pickup_location if reservation else "-",
-            "payment_method": normalize_status(payment.method) or "efectivo",
+            "id": payment_id,
+            "folio": (reservation.get("folio") if reservation else None) or f"VT-{payment_id[-6:].upper()}",
+            "client": user.get("full_name") if user else "Sin cliente",
+            "channel": reservation.get("pickup_location") if reservation else "-",
+            "payment_method": normalize_status(payment.get("method")) or "efectivo",
             "amount": float(amount),
             "status": payment_status,
             "reservation_status": reservation_status or "pending",
             "refund_status": infer_refund_status(reservation_status, payment_status, is_paid),
             "is_paid": is_paid,
-            "created_at": payment.created_at.isoformat() if payment.created_at else None,
+            "created_at": payment["created_at"].isoformat() if payment.get("created_at") else None,
         })
 
-    closed_reservations = await Reservation.find(Reservation.status == ReservationStatus.COMPLETED).count()
-    cancelled_reservations = await Reservation.find(Reservation.status == ReservationStatus.CANCELLED).count()
+    closed_reservations = await reservations_collection.count_documents({"status": ReservationStatus.COMPLETED.value})
+    cancelled_reservations = await reservations_collection.count_documents({"status": ReservationStatus.CANCELLED.value})
 
     average_ticket = (paid_total / paid_count) if paid_count else Decimal("0")
 
-    return {
+    return fast_json_response({
         "totals": {
             "day_total": float(day_total),
             "month_total": float(month_total),
@@ -225,15 +285,21 @@ async def get_admin_sales(
             "average_ticket": float(average_ticket),
         },
         "transactions": transactions[:limit],
-    }
+    }, response)
 
 
 @router.get("/payment-alerts")
 async def get_payment_alerts(
+    request: Request,
+    response: Response,
     limit: int = Query(default=20, ge=1, le=100),
     _: User = Depends(require_admin),
 ):
     """Obtener alertas de pagos pendientes"""
+    not_modified = await admin_conditional_response(request, response, ["reservations", "users", "vehicles"])
+    if not_modified:
+        return not_modified
+
     now_utc = datetime.now(timezone.utc)
     cutoff = now_utc - timedelta(days=PAYMENT_ALERT_THRESHOLD_DAYS)
 
@@ -260,15 +326,23 @@ async def get_payment_alerts(
             "created_at": reservation.created_at.isoformat() if reservation.created_at else None,
         })
 
-    return {"alerts": alerts}
+    return fast_json_response({"alerts": alerts}, response)
 
 
 @router.get("/crm")
 async def get_crm_cases(
+    request: Request,
+    response: Response,
     limit: int = Query(default=50, ge=1, le=200),
     _: User = Depends(require_admin),
 ):
     """Obtener casos de CRM (tickets de soporte)"""
+    not_modified = await admin_conditional_response(
+        request, response, ["support_tickets", "reservations", "users"]
+    )
+    if not_modified:
+        return not_modified
+
     now_utc = datetime.now(timezone.utc)
     sla_threshold = now_utc - timedelta(hours=CRM_SLA_HOURS)
 
@@ -306,7 +380,7 @@ async def get_crm_cases(
             "message": ticket.message or "",
         })
 
-    return {
+    return fast_json_response({
         "totals": {
             "total_cases": total_cases,
             "open_cases": open_cases,
@@ -314,7 +388,105 @@ async def get_crm_cases(
             "refund_pending": refund_pending,
         },
         "cases": cases,
+    }, response)
+
+
+@router.get("/search")
+async def search_tickets(
+    q: str = Query(..., min_length=1, max_length=200, description="Folio, texto del ticket, cliente, email o teléfono"),
+    limit: int = Query(default=20, ge=1, le=100),
+    _: User = Depends(require_admin),
+):
+    """Búsqueda de tickets: por folio, índice de texto sobre asunto/mensaje y clientes por nombre, email o teléfono"""
+    query = q.strip()
+    tickets_collection = SupportTicket.get_motor_collection()
+
+    # 1) Folio exacto: de la reservación (VT-0001) o del caso (CRM-xxxxxx, fin del _id del ticket)
+    found = []
+    reservation_folio = RESERVATION_FOLIO_REGEX.match(query)
+    case_folio = CASE_FOLIO_REGEX.match(query)
+    if reservation_folio:
+        reservation = await Reservation.get_motor_collection().find_one(
+            {"folio": build_reservation_folio(int(reservation_folio.group(1)))}, {"_id": 1}
+        )
+        if reservation:
+            found = await tickets_collection.find(
+                {"reservation_id": str(reservation["_id"])}
+            ).sort("created_at", -1).limit(limit).to_list(length=limit)
+    elif case_folio:
+        found = await tickets_collection.find(
+            {"$expr": {"$eq": [
+                {"$toUpper": {"$substrCP": [{"$toString": "$_id"}, 18, 6]}},
+                case_folio.group(1).upper(),
+            ]}}
+        ).limit(limit).to_list(length=limit)
+
+    # 2) Índice de texto (subject_message_text), ordenado por relevancia
+    if len(found) < limit:
+        seen = {doc["_id"] for doc in found}
+        by_text = await tickets_collection.find(
+            {"$text": {"$search": query}, "_id": {"$nin": list(seen)}},
+            {"score": {"$meta": "textScore"}},
+        ).sort([("score", {"$meta": "textScore"})]).limit(limit - len(found)).to_list(length=limit)
+        found.extend(by_text)
+
+    # 3) Tickets de clientes que coinciden por email, teléfono o inicio del nombre
+    prefix = re.escape(query)
+    matching_users = await User.get_motor_collection().find(
+        {"$or": [
+            {"email": query.lower()},
+            {"phone": query},
+            {"full_name": {"$regex": f"^{prefix}", "$options": "i"}},
+        ]},
+        {"_id": 1},
+    ).limit(50).to_list(length=50)
+    if matching_users and len(found) < limit:
+        seen = {doc["_id"] for doc in found}
+        by_user = await tickets_collection.find(
+            {"user_id": {"$in": [str(user["_id"]) for user in matching_users]}, "_id": {"$nin": list(seen)}}
+        ).sort("created_at", -1).limit(limit - len(found)).to_list(length=limit)
+        found.extend(by_user)
+
+    # Clientes y reservaciones en una consulta cada uno
+    user_ids = {doc["user_id"] for doc in found if doc.get("user_id") and PydanticObjectId.is_valid(doc["user_id"])}
+    reservation_ids = {
+        doc["reservation_id"] for doc in found
+        if doc.get("reservation_id") and PydanticObjectId.is_valid(doc["reservation_id"])
     }
+    users = {
+        str(user.id): user
+        for user in await User.find({"_id": {"$in": [PydanticObjectId(uid) for uid in user_ids]}}).to_list()
+    } if user_ids else {}
+    reservations = {
+        str(reservation.id): reservation
+        for reservation in await Reservation.find(
+            {"_id": {"$in": [PydanticObjectId(rid) for rid in reservation_ids]}}
+        ).to_list()
+    } if reservation_ids else {}
+
+    results = []
+    for doc in found:
+        user = users.get(doc.get("user_id") or "")
+        reservation = reservations.get(doc.get("reservation_id") or "")
+        last_update = doc.get("updated_at") or doc.get("created_at")
+        results.append({
+            "id": str(doc["_id"]),
+            "folio": f"CRM-{str(doc['_id'])[-6:].upper()}",
+            "subject": doc.get("subject"),
+            "client": user.full_name if user else "Sin cliente",
+            "contact": user.email if user else "-",
+            "phone": user.phone if user else None,
+            "type": doc.get("category") or "general",
+            "priority": doc.get("priority") or "medium",
+            "status": normalize_case_status(doc.get("status")),
+            "reservation_status": normalize_status(reservation.status) if reservation else "no_aplica",
+            "amount": float(reservation.total_price) if reservation else 0,
+            "last_update": last_update.isoformat() if last_update else None,
+            "message": doc.get("message") or "",
+            "score": doc.get("score"),
+        })
+
+    return fast_json_response({"query": q, "total": len(results), "results": results})
 
 
 @router.get("/users")
@@ -387,7 +559,7 @@ async def get_reservations(
             "created_at": reservation.created_at.isoformat() if reservation.created_at else None,
         })
     
-    return {"reservations": result}
+    return fast_json_response({"reservations": result})
 
 
 @router.patch("/reservations/{reservation_id}")
@@ -479,5 +651,8 @@ async def update_vehicle(
     
     vehicle.updated_at = datetime.now(timezone.utc)
     await vehicle.save()
+    mongo_vehicle_catalog.invalidate()
+    if update.price_per_day is not None or update.price_per_hour is not None:
+        quote_cache.invalidate_vehicle(vehicle_id)
     
     return {"message": "Vehículo actualizado correctamente", "vehicle_id": vehicle_id}
@@ -1,63 +1,259 @@
-from fastapi import APIRouter, HTTPException
-from app.models.schemas import NewsletterSubscribe, NewsletterResponse
-from typing import List
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from app.db import get_db
+from app.db_models import NewsletterCampaign, NewsletterSubscriber, User
+from app.models.schemas import CampaignCreate, NewsletterSubscribe, NewsletterResponse
+from app.newsletter_dispatch import newsletter_dispatcher
+from app.newsletter_import import iter_email_batches, new_import_stats, normalize_email
+from app.routes.admin import require_admin
+from typing import List, Optional
 
 router = APIRouter()
 
-# Base de datos simulada de suscriptores
-newsletter_subscribers = []
+SUBSCRIBERS_PAGE_SIZE = 1000
+
+
+def campaign_to_dict(campaign: NewsletterCampaign) -> dict:
+    return {
+        "id": campaign.id,
+        "subject": campaign.subject,
+        "status": campaign.status,
+        "retry_failed": campaign.retry_failed,
+        "last_subscriber_id": campaign.last_subscriber_id,
+        "sent_count": campaign.sent_count,
+        "failed_count": campaign.failed_count,
+        "created_at": campaign.created_at,
+        "started_at": campaign.started_at,
+        "finished_at": campaign.finished_at,
+    }
+
+
+def get_campaign_or_404(campaign_id: int, db: Session) -> NewsletterCampaign:
+    campaign = db.query(NewsletterCampaign).filter(NewsletterCampaign.id == campaign_id).first()
+    if not campaign:
+        raise HTTPException(status_code=404, detail=f"Campaña con ID {campaign_id} no encontrada")
+    return campaign
+
 
 @router.post("/subscribe", response_model=NewsletterResponse)
-async def subscribe_newsletter(subscription: NewsletterSubscribe):
+def subscribe_newsletter(subscription: NewsletterSubscribe, db: Session = Depends(get_db)):
     """
     Endpoint para suscribirse al boletín de ofertas especiales
-    
+
     - **email**: Correo electrónico del suscriptor
     """
     try:
-        # Verificar si el email ya está suscrito
-        if subscription.email in newsletter_subscribers:
+        email = normalize_email(subscription.email)
+
+        # Búsqueda por índice único (email normalizado)
+        existing = db.query(NewsletterSubscriber).filter(NewsletterSubscriber.email == email).first()
+        if existing and existing.active:
             return NewsletterResponse(
                 success=False,
                 message="Este correo ya está suscrito a nuestro boletín",
-                email=subscription.email
+                email=email
             )
-        
-        # Agregar nuevo suscriptor
-        newsletter_subscribers.append(subscription.email)
-        
+
+        if existing:
+            # Reactivar suscripción
+            existing.active = True
+            existing.unsubscribed_at = None
+        else:
+            # Agregar nuevo suscriptor
+            db.add(NewsletterSubscriber(email=email))
+        db.commit()
+
         return NewsletterResponse(
             success=True,
             message="¡Gracias por suscribirte! Recibirás nuestras ofertas especiales en tu correo.",
-            email=subscription.email
+            email=email
         )
     except Exception as e:
+        db.rollback()
         raise HTTPException(status_code=500, detail=f"Error al suscribir: {str(e)}")
 
 @router.get("/subscribers")
-async def get_subscribers():
+def get_subscribers(
+    after_id: Optional[int] = Query(None, ge=0, description="Cursor: id del último suscriptor de la página anterior"),
+    limit: int = Query(SUBSCRIBERS_PAGE_SIZE, ge=1, le=5000),
+    db: Session = Depends(get_db),
+):
     """
-    Endpoint para obtener la lista de suscriptores (uso administrativo)
+    Endpoint para obtener la lista de suscriptores (uso administrativo), paginada por cursor
+
+    - **after_id**: `next_cursor` de la página anterior
+    - **limit**: Tamaño de página
     """
+    query = db.query(NewsletterSubscriber.id, NewsletterSubscriber.email).filter(
+        NewsletterSubscriber.active == True
+    )
+    if after_id is not None:
+        query = query.filter(NewsletterSubscriber.id > after_id)
+    rows = query.order_by(NewsletterSubscriber.id.asc()).limit(limit).all()
+
+    total = db.query(NewsletterSubscriber.id).filter(NewsletterSubscriber.active == True).count()
+
     return {
-        "suscriptores": newsletter_subscribers,
-        "total": len(newsletter_subscribers)
+        "suscriptores": [row.email for row in rows],
+        "total": total,
+        "next_cursor": rows[-1].id if len(rows) == limit else None,
     }
 
+@router.post("/import")
+def import_subscribers(
+    file: UploadFile = File(..., description="CSV con una columna email (o correo)"),
+    db: Session = Depends(get_db),
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para importar suscriptores desde un CSV (uso administrativo)
+
+    Inserta por lotes; los correos ya registrados no se modifican
+    (no reactiva a quien se dio de baja).
+    """
+    stats = new_import_stats()
+    try:
+        for batch in iter_email_batches(file.file, stats):
+            # INSERT ... ON CONFLICT DO NOTHING en un executemany por lote
+            stmt = sqlite_insert(NewsletterSubscriber.__table__).on_conflict_do_nothing(
+                index_elements=["email"]
+            )
+            result = db.connection().execute(stmt, [{"email": email, "active": True} for email in batch])
+            inserted = max(result.rowcount, 0)
+            stats["inserted"] += inserted
+            stats["already_subscribed"] += len(batch) - inserted
+            db.commit()
+    except UnicodeDecodeError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="El archivo debe estar codificado en UTF-8")
+
+    return {"success": True, **stats}
+
 @router.delete("/unsubscribe/{email}")
-async def unsubscribe_newsletter(email: str):
+def unsubscribe_newsletter(email: str, db: Session = Depends(get_db)):
     """
     Endpoint para darse de baja del boletín
-    
+
     - **email**: Correo electrónico a dar de baja
     """
-    if email not in newsletter_subscribers:
+    normalized = normalize_email(email)
+    subscriber = db.query(NewsletterSubscriber).filter(NewsletterSubscriber.email == normalized).first()
+    if not subscriber or not subscriber.active:
         raise HTTPException(status_code=404, detail="Email no encontrado en la lista de suscriptores")
-    
-    newsletter_subscribers.remove(email)
-    
+
+    subscriber.active = False
+    subscriber.unsubscribed_at = datetime.now(timezone.utc)
+    db.commit()
+
     return {
         "success": True,
         "message": f"El correo {email} ha sido dado de baja del boletín",
         "email": email
     }
+
+@router.post("/campaigns", status_code=202)
+def create_campaign(
+    payload: CampaignCreate,
+    db: Session = Depends(get_db),
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para encolar una campaña (uso administrativo)
+
+    El envío lo hace el worker en segundo plano; el avance se consulta en
+    GET /campaigns/{campaign_id}.
+    """
+    campaign = NewsletterCampaign(
+        subject=payload.subject,
+        body_text=payload.body_text,
+        body_html=payload.body_html,
+        status="queued",
+    )
+    db.add(campaign)
+    db.commit()
+    db.refresh(campaign)
+    newsletter_dispatcher.notify()
+
+    return campaign_to_dict(campaign)
+
+@router.get("/campaigns")
+def list_campaigns(
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para listar las campañas más recientes (uso administrativo)
+    """
+    campaigns = db.query(NewsletterCampaign).order_by(NewsletterCampaign.id.desc()).limit(limit).all()
+    return [campaign_to_dict(campaign) for campaign in campaigns]
+
+@router.get("/campaigns/{campaign_id}")
+def get_campaign(
+    campaign_id: int,
+    db: Session = Depends(get_db),
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para consultar el avance de una campaña (uso administrativo)
+    """
+    return campaign_to_dict(get_campaign_or_404(campaign_id, db))
+
+@router.post("/campaigns/{campaign_id}/pause")
+def pause_campaign(
+    campaign_id: int,
+    db: Session = Depends(get_db),
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para pausar una campaña; el worker se detiene al terminar el lote en curso
+    """
+    campaign = get_campaign_or_404(campaign_id, db)
+    if campaign.status not in ("queued", "sending"):
+        raise HTTPException(status_code=400, detail=f"No se puede pausar una campaña en estado {campaign.status}")
+
+    campaign.status = "paused"
+    db.commit()
+    return campaign_to_dict(campaign)
+
+@router.post("/campaigns/{campaign_id}/resume")
+def resume_campaign(
+    campaign_id: int,
+    db: Session = Depends(get_db),
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para reanudar una campaña pausada desde el último lote registrado
+    """
+    campaign = get_campaign_or_404(campaign_id, db)
+    if campaign.status != "paused":
+        raise HTTPException(status_code=400, detail="Solo se pueden reanudar campañas pausadas")
+
+    campaign.status = "queued"
+    db.commit()
+    newsletter_dispatcher.notify()
+    return campaign_to_dict(campaign)
+
+@router.post("/campaigns/{campaign_id}/retry")
+def retry_campaign(
+    campaign_id: int,
+    db: Session = Depends(get_db),
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para reintentar las entregas fallidas de una campaña
+    """
+    campaign = get_campaign_or_404(campaign_id, db)
+    if campaign.status not in ("completed", "paused"):
+        raise HTTPException(status_code=400, detail="La campaña todavía se está enviando")
+    if campaign.failed_count == 0:
+        raise HTTPException(status_code=400, detail="La campaña no tiene entregas fallidas")
+
+    campaign.retry_failed = True
+    campaign.status = "queued"
+    campaign.finished_at = None
+    db.commit()
+    newsletter_dispatcher.notify()
+    return campaign_to_dict(campaign)
@@ -1,10 +1,58 @@
-from fastapi import APIRouter, HTTPException
-from app.models.schemas import NewsletterSubscribe, NewsletterResponse
-from app.mongodb_models import NewsletterSubscriber
-from typing import List
+from datetime import datetime
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from beanie import PydanticObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.models.schemas import CampaignCreate, NewsletterSubscribe, NewsletterResponse
+from app.mongodb_models import NewsletterCampaign, NewsletterSubscriber, User
+from app.newsletter_dispatch import mongo_newsletter_dispatcher
+from app.newsletter_import import iter_email_batches, new_import_stats, normalize_email
+from app.routes.admin_mongo import require_admin
+from typing import List, Optional
 
 router = APIRouter()
 
+SUBSCRIBERS_PAGE_SIZE = 1000
+
+
+def campaign_to_dict(campaign: NewsletterCampaign) -> dict:
+    return {
+        "id": str(campaign.id),
+        "subject": campaign.subject,
+        "status": campaign.status,
+        "retry_failed": campaign.retry_failed,
+        "last_subscriber_id": campaign.last_subscriber_id,
+        "sent_count": campaign.sent_count,
+        "failed_count": campaign.failed_count,
+        "created_at": campaign.created_at,
+        "started_at": campaign.started_at,
+        "finished_at": campaign.finished_at,
+    }
+
+
+async def get_campaign_or_404(campaign_id: str) -> NewsletterCampaign:
+    try:
+        campaign = await NewsletterCampaign.get(PydanticObjectId(campaign_id))
+    except Exception:
+        campaign = None
+    if not campaign:
+        raise HTTPException(status_code=404, detail=f"Campaña con ID {campaign_id} no encontrada")
+    return campaign
+
+
+async def transition_campaign(campaign_id: str, allowed: List[str], changes: dict) -> Optional[NewsletterCampaign]:
+    """
+    Cambia el estado solo si la campaña sigue en uno de `allowed` (un solo update atómico;
+    el worker puede estar modificándola). No toca el lease: el worker que lo tenga lo suelta.
+    """
+    campaign = await get_campaign_or_404(campaign_id)
+    result = await NewsletterCampaign.get_motor_collection().update_one(
+        {"_id": campaign.id, "status": {"$in": allowed}}, {"$set": changes}
+    )
+    if result.modified_count != 1:
+        return None
+    return await NewsletterCampaign.get(campaign.id)
+
 
 @router.post("/subscribe", response_model=NewsletterResponse)
 async def subscribe_newsletter(subscription: NewsletterSubscribe):
@@ -14,16 +62,18 @@ async def subscribe_newsletter(subscription: NewsletterSubscribe):
     - **email**: Correo electrónico del suscriptor
     """
     try:
-        # Verificar si el email ya está suscrito
+        email = normalize_email(subscription.email)
+        
+        # Verificar si el email ya está suscrito (índice único sobre el email normalizado)
         existing = await NewsletterSubscriber.find_one(
-            NewsletterSubscriber.email == subscription.email
+            NewsletterSubscriber.email == email
         )
         
         if existing and existing.active:
             return NewsletterResponse(
                 success=False,
                 message="Este correo ya está suscrito a nuestro boletín",
-                email=subscription.email
+                email=email
             )
         
         if existing and not existing.active:
@@ -32,36 +82,91 @@ async def subscribe_newsletter(subscription: NewsletterSubscribe):
             await existing.save()
         else:
             # Agregar nuevo suscriptor
-            new_subscriber = NewsletterSubscriber(email=subscription.email)
+            new_subscriber = NewsletterSubscriber(email=email)
             await new_subscriber.insert()
         
         return NewsletterResponse(
             success=True,
             message="¡Gracias por suscribirte! Recibirás nuestras ofertas especiales en tu correo.",
-            email=subscription.email
+            email=email
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al suscribir: {str(e)}")
 
 
 @router.get("/subscribers")
-async def get_subscribers():
+async def get_subscribers(
+    after_id: Optional[str] = Query(None, description="Cursor: next_cursor de la página anterior"),
+    limit: int = Query(SUBSCRIBERS_PAGE_SIZE, ge=1, le=5000),
+):
     """
-    Endpoint para obtener la lista de suscriptores (uso administrativo)
+    Endpoint para obtener la lista de suscriptores (uso administrativo), paginada por cursor
+    
+    - **after_id**: `next_cursor` de la página anterior
+    - **limit**: Tamaño de página
     """
+    filters = {"active": True}
+    if after_id:
+        try:
+            filters["_id"] = {"$gt": PydanticObjectId(after_id)}
+        except Exception:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    
     try:
-        subscribers = await NewsletterSubscriber.find(
-            NewsletterSubscriber.active == True
-        ).to_list()
+        collection = NewsletterSubscriber.get_motor_collection()
+        rows = await collection.find(filters, {"email": 1}).sort("_id", 1).limit(limit).to_list(length=limit)
+        total = await collection.count_documents({"active": True})
         
         return {
-            "suscriptores": [s.email for s in subscribers],
-            "total": len(subscribers)
+            "suscriptores": [row["email"] for row in rows],
+            "total": total,
+            "next_cursor": str(rows[-1]["_id"]) if len(rows) == limit else None,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener suscriptores: {str(e)}")
 
 
+@router.post("/import")
+async def import_subscribers(
+    file: UploadFile = File(..., description="CSV con una columna email (o correo)"),
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para importar suscriptores desde un CSV (uso administrativo)
+    
+    Upserts por lotes con bulk_write; los correos ya registrados no se modifican
+    (no reactiva a quien se dio de baja).
+    """
+    stats = new_import_stats()
+    collection = NewsletterSubscriber.get_motor_collection()
+    try:
+        for batch in iter_email_batches(file.file, stats):
+            now = datetime.utcnow()
+            operations = [
+                UpdateOne(
+                    {"email": email},
+                    {"$setOnInsert": {"email": email, "subscribed_at": now, "active": True}},
+                    upsert=True,
+                )
+                for email in batch
+            ]
+            try:
+                result = await collection.bulk_write(operations, ordered=False)
+                upserted = result.upserted_count
+            except BulkWriteError as exc:
+                # Una suscripción simultánea insertó el mismo correo entre el filtro y el upsert (E11000)
+                details = exc.details or {}
+                if any(error.get("code") != 11000 for error in details.get("writeErrors", [])):
+                    raise
+                upserted = details.get("nUpserted", 0)
+            stats["inserted"] += upserted
+            stats["already_subscribed"] += len(batch) - upserted
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El archivo debe estar codificado en UTF-8")
+    
+    return {"success": True, **stats}
+
+
 @router.delete("/unsubscribe/{email}")
 async def unsubscribe_newsletter(email: str):
     """
@@ -71,7 +176,7 @@ async def unsubscribe_newsletter(email: str):
     """
     try:
         subscriber = await NewsletterSubscriber.find_one(
-            NewsletterSubscriber.email == email
+            NewsletterSubscriber.email == normalize_email(email)
         )
         
         if not subscriber or not subscriber.active:
@@ -90,3 +195,102 @@ async def unsubscribe_newsletter(email: str):
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al dar de baja: {str(e)}")
+
+
+@router.post("/campaigns", status_code=202)
+async def create_campaign(
+    payload: CampaignCreate,
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para encolar una campaña (uso administrativo)
+
+    El envío lo hace el worker en segundo plano; el avance se consulta en
+    GET /campaigns/{campaign_id}.
+    """
+    campaign = NewsletterCampaign(
+        subject=payload.subject,
+        body_text=payload.body_text,
+        body_html=payload.body_html,
+        status="queued",
+    )
+    await campaign.insert()
+    mongo_newsletter_dispatcher.notify()
+
+    return campaign_to_dict(campaign)
+
+
+@router.get("/campaigns")
+async def list_campaigns(
+    limit: int = Query(50, ge=1, le=200),
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para listar las campañas más recientes (uso administrativo)
+    """
+    campaigns = await NewsletterCampaign.find_all().sort("-_id").limit(limit).to_list()
+    return [campaign_to_dict(campaign) for campaign in campaigns]
+
+
+@router.get("/campaigns/{campaign_id}")
+async def get_campaign(
+    campaign_id: str,
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para consultar el avance de una campaña (uso administrativo)
+    """
+    return campaign_to_dict(await get_campaign_or_404(campaign_id))
+
+
+@router.post("/campaigns/{campaign_id}/pause")
+async def pause_campaign(
+    campaign_id: str,
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para pausar una campaña; el worker se detiene al terminar el lote en curso
+    """
+    campaign = await transition_campaign(campaign_id, ["queued", "sending"], {"status": "paused"})
+    if campaign is None:
+        current = await get_campaign_or_404(campaign_id)
+        raise HTTPException(status_code=400, detail=f"No se puede pausar una campaña en estado {current.status}")
+    return campaign_to_dict(campaign)
+
+
+@router.post("/campaigns/{campaign_id}/resume")
+async def resume_campaign(
+    campaign_id: str,
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para reanudar una campaña pausada desde el último lote registrado
+    """
+    campaign = await transition_campaign(campaign_id, ["paused"], {"status": "queued"})
+    if campaign is None:
+        raise HTTPException(status_code=400, detail="Solo se pueden reanudar campañas pausadas")
+    mongo_newsletter_dispatcher.notify()
+    return campaign_to_dict(campaign)
+
+
+@router.post("/campaigns/{campaign_id}/retry")
+async def retry_campaign(
+    campaign_id: str,
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para reintentar las entregas fallidas de una campaña
+    """
+    current = await get_campaign_or_404(campaign_id)
+    if current.failed_count == 0:
+        raise HTTPException(status_code=400, detail="La campaña no tiene entregas fallidas")
+
+    campaign = await transition_campaign(
+        campaign_id,
+        ["completed", "paused"],
+        {"retry_failed": True, "status": "queued", "finished_at": None},
+    )
+    if campaign is None:
+        raise HTTPException(status_code=400, detail="La campaña todavía se está enviando")
+    mongo_newsletter_dispatcher.notify()
+    return campaign_to_dict(campaign)
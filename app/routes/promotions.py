@@ -1,14 +1,26 @@
-from fastapi import APIRouter, HTTPException
+import threading
+import time
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+from app.db import SessionLocal, get_db
+from app.db_models import Promotion as PromotionRow, User
 from app.models.schemas import Promotion
+from app.quote_cache import quote_cache
+from app.routes.admin import require_admin
+from app.table_versions import get_table_versions
 from datetime import date
-from typing import List
+from typing import Dict, List, Optional
 
 router = APIRouter()
 
-# Base de datos simulada de promociones
-promotions_db = [
+# Cada cuánto se consulta el contador de versión de la tabla para detectar
+# cambios hechos por otros workers (los cambios locales invalidan de inmediato)
+PROMOTIONS_CACHE_CHECK_SECONDS = 2.0
+
+# Promociones iniciales, se insertan si la tabla está vacía
+DEFAULT_PROMOTIONS = [
     {
-        "id": 1,
         "titulo": "Promocion 1",
         "descripcion": "Descuento especial para viajes en febrero. ¡Aprovecha esta increíble oferta!",
         "descuento": 15.0,
@@ -18,7 +30,6 @@ promotions_db = [
         "activa": True
     },
     {
-        "id": 2,
         "titulo": "Promocion 2",
         "descripcion": "Viajes de fin de semana con 20% de descuento. ¡No te lo pierdas!",
         "descuento": 20.0,
@@ -28,7 +39,6 @@ promotions_db = [
         "activa": True
     },
     {
-        "id": 3,
         "titulo": "Promocion 3",
         "descripcion": "Reserva anticipada y ahorra hasta 25%. ¡Planifica tu viaje con tiempo!",
         "descuento": 25.0,
@@ -39,38 +49,189 @@ promotions_db = [
     }
 ]
 
+
+class PromotionCreate(BaseModel):
+    titulo: str = Field(..., min_length=1, max_length=200)
+    descripcion: str = Field(..., min_length=1)
+    descuento: float = Field(..., ge=0, le=100)
+    imagen_url: Optional[str] = Field(None, max_length=500)
+    fecha_inicio: date
+    fecha_fin: date
+    activa: bool = True
+
+
+class PromotionUpdate(BaseModel):
+    titulo: Optional[str] = Field(None, min_length=1, max_length=200)
+    descripcion: Optional[str] = None
+    descuento: Optional[float] = Field(None, ge=0, le=100)
+    imagen_url: Optional[str] = Field(None, max_length=500)
+    fecha_inicio: Optional[date] = None
+    fecha_fin: Optional[date] = None
+    activa: Optional[bool] = None
+
+
+def promotion_to_dict(row: PromotionRow) -> dict:
+    return {
+        "id": row.id,
+        "titulo": row.titulo,
+        "descripcion": row.descripcion,
+        "descuento": float(row.descuento),
+        "imagen_url": row.imagen_url,
+        "fecha_inicio": row.fecha_inicio,
+        "fecha_fin": row.fecha_fin,
+        "activa": bool(row.activa),
+    }
+
+
+class PromotionCache:
+    """
+    Cache por proceso de la tabla promotions: índice por id y lista de vigentes
+    del día. Se recarga cuando cambia el contador de versión de la tabla.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._by_id: Dict[int, dict] = {}
+        self._ordered: List[dict] = []
+        self._active_day: Optional[date] = None
+        self._active: List[dict] = []
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version = None
+
+    def _refresh(self, db: Session) -> None:
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < PROMOTIONS_CACHE_CHECK_SECONDS:
+            return
+
+        version = get_table_versions(db, ["promotions"])["promotions"]
+        if version == self._version:
+            self._checked_at = now
+            return
+
+        rows = db.query(PromotionRow).order_by(PromotionRow.fecha_inicio.asc(), PromotionRow.id.asc()).all()
+        by_id = {row.id: promotion_to_dict(row) for row in rows}
+
+        with self._lock:
+            self._by_id = by_id
+            self._ordered = list(by_id.values())
+            self._active_day = None
+            self._version = version
+            self._checked_at = now
+
+    def get(self, db: Session, promotion_id: int) -> Optional[dict]:
+        self._refresh(db)
+        return self._by_id.get(promotion_id)
+
+    def all(self, db: Session) -> List[dict]:
+        self._refresh(db)
+        return self._ordered
+
+    def active_on(self, db: Session, day: date) -> List[dict]:
+        self._refresh(db)
+        with self._lock:
+            if self._active_day != day:
+                self._active = [
+                    promo for promo in self._ordered
+                    if promo["activa"] and promo["fecha_inicio"] <= day <= promo["fecha_fin"]
+                ]
+                self._active_day = day
+            return self._active
+
+
+promotion_cache = PromotionCache()
+
+
+def ensure_default_promotions() -> None:
+    """Inserta las promociones iniciales si la tabla está vacía"""
+    db = SessionLocal()
+    try:
+        if db.query(PromotionRow.id).first() is None:
+            db.add_all([PromotionRow(**promo) for promo in DEFAULT_PROMOTIONS])
+            db.commit()
+    finally:
+        db.close()
+
+
 @router.get("/", response_model=List[Promotion])
-async def get_promotions(activa: bool = True):
+def get_promotions(activa: bool = True, db: Session = Depends(get_db)):
     """
     Endpoint para obtener todas las promociones activas
-    
+
     - **activa**: Filtrar por promociones activas (default: True)
     """
     try:
         if activa:
-            # Filtrar solo promociones activas y vigentes
-            today = date.today()
-            promociones = [
-                Promotion(**promo) for promo in promotions_db
-                if promo["activa"] and promo["fecha_inicio"] <= today <= promo["fecha_fin"]
-            ]
+            # Solo promociones activas y vigentes hoy
+            promociones = promotion_cache.active_on(db, date.today())
         else:
-            promociones = [Promotion(**promo) for promo in promotions_db]
-        
-        return promociones
+            promociones = promotion_cache.all(db)
+
+        return [Promotion(**promo) for promo in promociones]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener promociones: {str(e)}")
 
 @router.get("/{promotion_id}", response_model=Promotion)
-async def get_promotion_by_id(promotion_id: int):
+def get_promotion_by_id(promotion_id: int, db: Session = Depends(get_db)):
     """
     Endpoint para obtener una promoción específica por ID
-    
+
     - **promotion_id**: ID de la promoción
     """
-    promo = next((p for p in promotions_db if p["id"] == promotion_id), None)
-    
+    promo = promotion_cache.get(db, promotion_id)
+
     if not promo:
         raise HTTPException(status_code=404, detail=f"Promoción con ID {promotion_id} no encontrada")
-    
+
     return Promotion(**promo)
+
+@router.post("/", response_model=Promotion, status_code=201)
+def create_promotion(
+    payload: PromotionCreate,
+    db: Session = Depends(get_db),
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para crear una nueva promoción (uso administrativo)
+    """
+    if payload.fecha_fin < payload.fecha_inicio:
+        raise HTTPException(status_code=400, detail="La fecha de fin debe ser posterior a la de inicio")
+
+    promotion = PromotionRow(**payload.model_dump())
+    db.add(promotion)
+    db.commit()
+    db.refresh(promotion)
+    promotion_cache.invalidate()
+    quote_cache.invalidate_promotions()
+
+    return Promotion(**promotion_to_dict(promotion))
+
+@router.patch("/{promotion_id}", response_model=Promotion)
+def update_promotion(
+    promotion_id: int,
+    payload: PromotionUpdate,
+    db: Session = Depends(get_db),
+    _: User = Depends(require_admin),
+):
+    """
+    Endpoint para actualizar una promoción (uso administrativo)
+    """
+    promotion = db.query(PromotionRow).filter(PromotionRow.id == promotion_id).first()
+    if not promotion:
+        raise HTTPException(status_code=404, detail=f"Promoción con ID {promotion_id} no encontrada")
+
+    for field, value in payload.model_dump(exclude_unset=True).items():
+        setattr(promotion, field, value)
+
+    if promotion.fecha_fin < promotion.fecha_inicio:
+        raise HTTPException(status_code=400, detail="La fecha de fin debe ser posterior a la de inicio")
+
+    db.commit()
+    db.refresh(promotion)
+    promotion_cache.invalidate()
+    quote_cache.invalidate_promotions()
+
+    return Promotion(**promotion_to_dict(promotion))
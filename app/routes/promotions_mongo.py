@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from app.models.schemas import Promotion
 from app.mongodb_models import Promotion as PromotionModel
+from app.quote_cache import quote_cache
 from datetime import datetime
 from typing import List
 
@@ -78,6 +79,7 @@ async def create_promotion(promotion_data: dict):
         )
         
         await new_promotion.insert()
+        quote_cache.invalidate_promotions()
         
         return Promotion(
             id=str(new_promotion.id),
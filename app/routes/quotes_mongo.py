@@ -0,0 +1,56 @@
+from fastapi import APIRouter
+
+from app.fast_json import fast_json_response
+from app.quote_cache import price_version, quote_cache
+from app.routes.reservations_mongo import get_active_promotion
+from app.schemas_reservations_mongo import QUOTE_MAX_VEHICLES, QuoteRequest
+from app.table_versions import get_collection_versions
+from app.vehicle_catalog import mongo_vehicle_catalog
+from app.vehicle_features import parse_feature_filter
+
+router = APIRouter(prefix="/api/quotes", tags=["Quotes"])
+
+
+def quote_response(payload: QuoteRequest, quotes: list, missing: list, promotion) -> dict:
+    return {
+        "start_date": payload.start_date,
+        "end_date": payload.end_date,
+        "promotion": promotion,
+        "quotes": quotes,
+        "missing": missing,
+    }
+
+
+@router.post("")
+async def create_quotes(payload: QuoteRequest):
+    """Cotiza varios vehículos para el mismo rango de fechas en una sola llamada"""
+
+    versions = await get_collection_versions(["vehicles", "promotions"])
+    version = price_version(versions["vehicles"], versions["promotions"])
+    catalog = await mongo_vehicle_catalog.get(versions["vehicles"])
+    missing = []
+    if payload.vehicle_ids:
+        vehicles = []
+        for vehicle_id in dict.fromkeys(payload.vehicle_ids):
+            vehicle = catalog.get(vehicle_id)
+            if vehicle and vehicle["is_active"]:
+                vehicles.append(vehicle)
+            else:
+                missing.append(vehicle_id)
+    else:
+        vehicles = catalog.query(
+            vehicle_type=payload.vehicle_type,
+            min_capacity=payload.min_capacity,
+            max_price=payload.max_price,
+            features=parse_feature_filter(payload.features),
+        )[:QUOTE_MAX_VEHICLES]
+
+    promotion = None
+    if payload.promotion_id:
+        promotion = quote_cache.get_promotion(payload.promotion_id, version)
+        if promotion is None:
+            promotion = await get_active_promotion(payload.promotion_id)
+            quote_cache.put_promotion(payload.promotion_id, version, promotion)
+
+    quotes = quote_cache.quote_many(vehicles, payload.start_date, payload.end_date, promotion, version)
+    return fast_json_response(quote_response(payload, quotes, missing, promotion))
@@ -1,20 +1,35 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from fastapi.responses import FileResponse, Response
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, exists, insert, literal, or_, select, union_all
 from datetime import date, datetime, timezone, timedelta
-from decimal import Decimal, ROUND_HALF_UP
-from typing import List, Optional
+from decimal import Decimal
+from typing import Dict, List, Optional, Set
 
 from app.db import get_db
 from app.db_models import Invoice, Payment, Reservation, User, Vehicle
-from app.routes.promotions import promotions_db
+from app.fast_json import fast_json_response
+from app.http_cache import etag_matches
+from app.invoicing import (
+    DOCUMENT_FAILED, DOCUMENT_MEDIA_TYPES, DOCUMENT_RENDERED, INVOICE_CACHE_MAX_AGE_SECONDS,
+    document_path, insert_invoice_rows, invoice_row, invoice_worker,
+)
+from app.pricing import pricing_engine
+from app.reservation_batch import BatchRequest, batch_failures, find_overlapping_requests, group_by_range, should_reject
+from app.routes.promotions import promotion_cache
 from app.schemas_reservations import (
-    ReservationCreate, ReservationUpdate, ReservationOut, ReservationListOut, ReservationStats
+    ReservationBatchCreate, ReservationCreate, ReservationUpdate, ReservationOut, ReservationListOut,
+    ReservationStats, reservation_out_dict,
 )
 from app.security import decode_access_token
+from app.sequences import build_reservation_folio, invoice_numbers, reservation_folios
+from app.table_versions import bump_table_versions
 
 router = APIRouter(prefix="/api/reservations", tags=["Reservations"])
 
+# Estados que ocupan el vehículo en sus fechas
+BLOCKING_STATUS = ('pending', 'confirmed', 'in_progress')
+
 
 def get_current_user_from_token(request: Request, db: Session = Depends(get_db)) -> User:
     """Obtiene el usuario actual desde el token JWT"""
@@ -61,7 +76,7 @@ def check_vehicle_availability(
     # Buscar reservaciones que se traslapen con las fechas solicitadas
     query = db.query(Reservation).filter(
         Reservation.vehicle_id == vehicle_id,
-        Reservation.status.in_(['pending', 'confirmed', 'in_progress']),
+        Reservation.status.in_(BLOCKING_STATUS),
         or_(
             # La reservación existente empieza durante el período solicitado
             and_(
@@ -90,23 +105,12 @@ def check_vehicle_availability(
     return conflicting_reservations == 0
 
 
-def calculate_reservation_price(vehicle: Vehicle, start_date: datetime, end_date: datetime) -> tuple:
-    """Calcula el precio total de la reservación"""
-    delta = end_date - start_date
-    total_days = max(1, delta.days)  # Mínimo 1 día
-    
-    price_per_day = vehicle.price_per_day
-    total_price = price_per_day * total_days
-    
-    return total_days, price_per_day, total_price
-
-
-def get_active_promotion(promotion_id: Optional[int]) -> Optional[dict]:
+def get_active_promotion(promotion_id: Optional[int], db: Session) -> Optional[dict]:
     if not promotion_id:
         return None
 
     today = date.today()
-    promotion = next((promo for promo in promotions_db if promo["id"] == promotion_id), None)
+    promotion = promotion_cache.get(db, promotion_id)
     if not promotion:
         raise HTTPException(status_code=404, detail="Promocion no encontrada")
 
@@ -119,12 +123,37 @@ def get_active_promotion(promotion_id: Optional[int]) -> Optional[dict]:
     return promotion
 
 
-def build_reservation_folio(reservation_id: int) -> str:
-    return f"VT-{reservation_id:04d}"
-
+def build_reservation_notes(notes: Optional[str], promotion: Optional[dict]) -> Optional[str]:
+    promotion_note = None
+    if promotion:
+        promotion_note = f"Promocion aplicada: {promotion['titulo']} ({promotion['descuento']}% OFF)"
 
-def build_invoice_number(reservation_id: int, issued_at: datetime) -> str:
-    return f"FAC-{issued_at.strftime('%Y%m%d')}-{reservation_id:06d}"
+    final_notes_parts = []
+    if notes:
+        final_notes_parts.append(notes.strip())
+    if promotion_note:
+        final_notes_parts.append(promotion_note)
+    return " | ".join([part for part in final_notes_parts if part]) or None
+
+
+def find_unavailable_requests(db: Session, requests: List[BatchRequest]) -> Set[int]:
+    """
+    Índices de las solicitudes (índice, vehicle_id, inicio, fin) que se traslapan con
+    una reservación vigente. Un solo SELECT: un EXISTS por solicitud unidos con UNION ALL.
+    """
+    checks = [
+        select(literal(index).label("position")).where(exists().where(
+            Reservation.vehicle_id == vehicle_id,
+            Reservation.status.in_(BLOCKING_STATUS),
+            Reservation.start_date < end_date,
+            Reservation.end_date > start_date,
+        ))
+        for index, vehicle_id, start_date, end_date in requests
+    ]
+    if not checks:
+        return set()
+    query = checks[0] if len(checks) == 1 else union_all(*checks)
+    return set(db.execute(query).scalars())
 
 
 @router.post("/", response_model=ReservationOut, status_code=status.HTTP_201_CREATED)
@@ -156,35 +185,23 @@ def create_reservation(
             detail="El vehículo no está disponible en las fechas seleccionadas"
         )
     
-    # Calcular precios
-    total_days, price_per_day, total_price = calculate_reservation_price(
-        vehicle, payload.start_date, payload.end_date
-    )
+    # Calcular precios (mismo motor que POST /api/quotes: tarifa por hora, duración, promoción)
+    promotion = get_active_promotion(payload.promotion_id, db)
+    quote = pricing_engine.quote(vehicle, payload.start_date, payload.end_date, promotion)
+    total_days, price_per_day, total_price = quote.total_days, quote.price_per_day, quote.total_price
 
-    promotion = get_active_promotion(payload.promotion_id)
-    promotion_note = None
-    if promotion:
-        discount_percent = Decimal(str(promotion.get("descuento", 0)))
-        discount_ratio = discount_percent / Decimal("100")
-        discount_amount = (total_price * discount_ratio).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-        total_price = (total_price - discount_amount).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-        if total_price < 0:
-            total_price = Decimal("0.00")
-        promotion_note = f"Promocion aplicada: {promotion['titulo']} ({promotion['descuento']}% OFF)"
-
-    final_notes_parts = []
-    if payload.notes:
-        final_notes_parts.append(payload.notes.strip())
-    if promotion_note:
-        final_notes_parts.append(promotion_note)
-    final_notes = " | ".join([part for part in final_notes_parts if part]) or None
+    final_notes = build_reservation_notes(payload.notes, promotion)
 
     payment_method = (payload.payment_method or "efectivo").strip().lower()
     payment_reference = (payload.payment_reference or "").strip() or None
     payment_notes = (payload.payment_notes or "").strip() or None
 
+    # El folio sale de la secuencia (antes de escribir): no hace falta el id de la reservación
+    folio = build_reservation_folio(reservation_folios.next())
+
     # Crear reservacion y pago en una sola transaccion
     reservation = Reservation(
+        folio=folio,
         user_id=current_user.id,
         vehicle_id=payload.vehicle_id,
         start_date=payload.start_date,
@@ -198,11 +215,8 @@ def create_reservation(
         notes=final_notes
     )
 
-    db.add(reservation)
-    db.flush()
-
     payment = Payment(
-        reservation_id=reservation.id,
+        reservation=reservation,
         user_id=current_user.id,
         method=payment_method,
         amount=total_price,
@@ -211,32 +225,165 @@ def create_reservation(
         details=payment_notes,
     )
 
+    db.add(reservation)
     db.add(payment)
-    issued_at = datetime.now(timezone.utc)
-    invoice = Invoice(
-        reservation_id=reservation.id,
-        folio=build_reservation_folio(reservation.id),
-        invoice_number=build_invoice_number(reservation.id, issued_at),
-        amount=total_price,
-        currency="MXN",
-        status="generated",
-        issued_at=issued_at,
-    )
-    db.add(invoice)
     db.commit()
     db.refresh(reservation)
+
+    # La factura y sus documentos se generan en segundo plano (app/invoicing.py)
+    invoice_worker.submit(reservation.id)
     
     # Agregar información del vehículo
     reservation.vehicle = vehicle
     reservation.user_name = current_user.full_name
-    reservation.invoice_folio = invoice.folio
-    reservation.invoice_number = invoice.invoice_number
-    reservation.invoice_status = invoice.status
-    reservation.invoice_issued_at = invoice.issued_at
+    reservation.invoice_folio = reservation.folio
+    reservation.invoice_status = "pending"
     
     return reservation
 
 
+@router.post("/batch", status_code=status.HTTP_201_CREATED)
+def create_reservations_batch(
+    payload: ReservationBatchCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """
+    Varias reservaciones en una sola transacción (p. ej. la flota de un evento).
+    all_or_nothing: si algún vehículo falla no se crea ninguna (409 con los errores);
+    best_effort: se crean las que se puedan y se reportan las demás.
+    """
+    items = payload.items
+    now = datetime.now(timezone.utc)
+    errors: Dict[int, str] = {}
+
+    vehicles = {
+        vehicle.id: vehicle
+        for vehicle in db.query(Vehicle).filter(
+            Vehicle.id.in_({item.vehicle_id for item in items}),
+            Vehicle.is_active == True
+        )
+    }
+    for index, item in enumerate(items):
+        if item.vehicle_id not in vehicles:
+            errors[index] = "Vehículo no encontrado o no disponible"
+        elif item.start_date < now:
+            errors[index] = "La fecha de inicio debe ser futura"
+
+    requests = [
+        (index, item.vehicle_id, item.start_date, item.end_date)
+        for index, item in enumerate(items)
+        if index not in errors
+    ]
+    for index, conflict in find_overlapping_requests(requests).items():
+        errors[index] = f"El vehículo ya está en la solicitud {conflict} del lote con fechas traslapadas"
+    requests = [request for request in requests if request[0] not in errors]
+    for index in find_unavailable_requests(db, requests):
+        errors[index] = "El vehículo no está disponible en las fechas seleccionadas"
+    requests = [request for request in requests if request[0] not in errors]
+
+    failed = batch_failures(errors, [item.vehicle_id for item in items])
+    accepted = [request[0] for request in requests]
+    if should_reject(payload.mode, accepted, errors):
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "No se pudo reservar el lote", "mode": payload.mode, "failed": failed},
+        )
+
+    # Precios: una cotización por rango de fechas para todos los vehículos de ese rango
+    promotion = get_active_promotion(payload.promotion_id, db)
+    quotes = {}
+    for (start_date, end_date), group in group_by_range(requests).items():
+        range_quotes = pricing_engine.quote_many(
+            [vehicles[vehicle_id] for _, vehicle_id, _, _ in group], start_date, end_date, promotion
+        )
+        quotes.update(zip((request[0] for request in group), range_quotes))
+
+    # Folios y números de factura antes de escribir (ver app/sequences.py)
+    folios = [build_reservation_folio(number) for number in reservation_folios.next_many(len(accepted))]
+    numbers = invoice_numbers.next_many(len(accepted))
+
+    payment_method = payload.payment_method or "efectivo"
+    payment_reference = (payload.payment_reference or "").strip() or None
+    payment_notes = (payload.payment_notes or "").strip() or None
+    default_pickup = payload.pickup_location
+
+    reservation_rows = []
+    for index, folio in zip(accepted, folios):
+        item, quote = items[index], quotes[index]
+        pickup_location = item.pickup_location or default_pickup
+        reservation_rows.append({
+            "folio": folio,
+            "user_id": current_user.id,
+            "vehicle_id": item.vehicle_id,
+            "start_date": item.start_date,
+            "end_date": item.end_date,
+            "pickup_location": pickup_location,
+            "return_location": item.return_location or payload.return_location or pickup_location,
+            "total_days": quote.total_days,
+            "price_per_day": quote.price_per_day,
+            "total_price": quote.total_price,
+            "status": "pending",
+            "notes": build_reservation_notes(item.notes or payload.notes, promotion),
+        })
+
+    # INSERTs de Core por lote: reservaciones, pagos y facturas en la misma transacción
+    conn = db.connection()
+    reservations_table = Reservation.__table__
+    ids_by_folio = dict(conn.execute(
+        insert(reservations_table).returning(reservations_table.c.folio, reservations_table.c.id),
+        reservation_rows,
+    ).all())
+    reservation_ids = [ids_by_folio[row["folio"]] for row in reservation_rows]
+
+    conn.execute(insert(Payment.__table__), [
+        {
+            "reservation_id": reservation_id,
+            "user_id": current_user.id,
+            "method": payment_method,
+            "amount": row["total_price"],
+            "status": "accepted",
+            "reference": payment_reference,
+            "details": payment_notes,
+        }
+        for reservation_id, row in zip(reservation_ids, reservation_rows)
+    ])
+    bump_table_versions(db, [Reservation.__tablename__, Payment.__tablename__])
+
+    # También recalcula los casos CRM de estas reservaciones
+    issued_at = datetime.now(timezone.utc)
+    invoice_rows = [
+        invoice_row(reservation_id, row["folio"], row["total_price"], number, issued_at)
+        for reservation_id, row, number in zip(reservation_ids, reservation_rows, numbers)
+    ]
+    insert_invoice_rows(db, invoice_rows)
+    db.commit()
+
+    # Solo los documentos (PDF/XML) quedan para el worker
+    invoice_worker.submit_many(reservation_ids)
+
+    created = [
+        {
+            "index": index,
+            "reservation_id": reservation_id,
+            "folio": row["folio"],
+            "vehicle_id": row["vehicle_id"],
+            "start_date": row["start_date"],
+            "end_date": row["end_date"],
+            "total_days": row["total_days"],
+            "total_price": row["total_price"],
+            "invoice_number": invoice["invoice_number"],
+        }
+        for index, reservation_id, row, invoice in zip(accepted, reservation_ids, reservation_rows, invoice_rows)
+    ]
+    return fast_json_response({
+        "mode": payload.mode,
+        "created": created,
+        "failed": failed,
+        "total_price": sum((row["total_price"] for row in reservation_rows), Decimal("0.00")),
+    }, status_code=status.HTTP_201_CREATED)
+
+
 @router.get("/{reservation_id}/invoice")
 def get_invoice_for_reservation(
     reservation_id: int,
@@ -249,20 +396,14 @@ def get_invoice_for_reservation(
 
     invoice = db.query(Invoice).filter(Invoice.reservation_id == reservation.id).first()
     if not invoice:
-        issued_at = datetime.now(timezone.utc)
-        invoice = Invoice(
-            reservation_id=reservation.id,
-            folio=build_reservation_folio(reservation.id),
-            invoice_number=build_invoice_number(reservation.id, issued_at),
-            amount=reservation.total_price,
-            currency="MXN",
-            status="generated",
-            issued_at=issued_at,
-        )
-        db.add(invoice)
-        db.commit()
-        db.refresh(invoice)
-
+        invoice_worker.submit(reservation.id)
+        return fast_json_response({
+            "reservation_id": reservation.id,
+            "folio": reservation.folio or build_reservation_folio(reservation.id),
+            "status": "pending",
+        }, status_code=status.HTTP_202_ACCEPTED)
+
+    rendered = invoice.document_status == DOCUMENT_RENDERED
     return {
         "reservation_id": reservation.id,
         "folio": invoice.folio,
@@ -271,9 +412,64 @@ def get_invoice_for_reservation(
         "issued_at": invoice.issued_at,
         "amount": invoice.amount,
         "currency": invoice.currency,
+        "document_status": invoice.document_status,
+        "pdf_url": f"/api/reservations/{reservation.id}/invoice.pdf" if rendered else None,
+        "xml_url": f"/api/reservations/{reservation.id}/invoice.xml" if rendered else None,
+        "render_error": invoice.render_error if invoice.document_status == DOCUMENT_FAILED else None,
     }
 
 
+@router.get("/{reservation_id}/invoice.{kind}")
+def download_invoice_document(
+    reservation_id: int,
+    kind: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """PDF o XML de la factura; 202 mientras el worker no lo ha generado, 409 si falló"""
+    media_type = DOCUMENT_MEDIA_TYPES.get(kind)
+    if media_type is None:
+        raise HTTPException(status_code=404, detail="Formato de factura no disponible")
+
+    invoice = (
+        db.query(Invoice)
+        .join(Reservation, Reservation.id == Invoice.reservation_id)
+        .filter(Invoice.reservation_id == reservation_id, Reservation.user_id == current_user.id)
+        .first()
+    )
+    if not invoice:
+        owns_reservation = db.query(Reservation.id).filter(
+            Reservation.id == reservation_id, Reservation.user_id == current_user.id
+        ).first()
+        if not owns_reservation:
+            raise HTTPException(status_code=404, detail="Reservación no encontrada")
+
+    if invoice and invoice.document_status == DOCUMENT_FAILED:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "No se pudo generar la factura", "render_error": invoice.render_error},
+        )
+
+    relative_path = None
+    if invoice and invoice.document_status == DOCUMENT_RENDERED:
+        relative_path = invoice.pdf_path if kind == "pdf" else invoice.xml_path
+    path = document_path(relative_path) if relative_path else None
+    if path is None or not path.is_file():
+        invoice_worker.submit(reservation_id)
+        return fast_json_response(
+            {"reservation_id": reservation_id, "status": "pending"},
+            status_code=status.HTTP_202_ACCEPTED,
+        )
+
+    # Cambia cuando se regenera el documento
+    etag = f'"{invoice.invoice_number}-{kind}-{invoice.rendered_at:%Y%m%d%H%M%S%f}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={INVOICE_CACHE_MAX_AGE_SECONDS}"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(str(path), media_type=media_type, filename=path.name, headers=headers)
+
+
 @router.get("/", response_model=ReservationListOut)
 def list_my_reservations(
     status_filter: Optional[str] = None,
@@ -290,22 +486,22 @@ def list_my_reservations(
         query = query.filter(Reservation.status == status_filter)
     
     total = query.count()
-    reservations = query.order_by(Reservation.created_at.desc()).offset(skip).limit(limit).all()
-    
-    # Agregar información del vehículo, usuario e invoice
-    for reservation in reservations:
-        reservation.vehicle = db.query(Vehicle).filter(Vehicle.id == reservation.vehicle_id).first()
-        reservation.user_name = current_user.full_name
-        
-        # Agregar información de la factura si existe
-        invoice = db.query(Invoice).filter(Invoice.reservation_id == reservation.id).first()
-        if invoice:
-            reservation.invoice_folio = invoice.folio
-            reservation.invoice_number = invoice.invoice_number
-            reservation.invoice_status = invoice.status
-            reservation.invoice_issued_at = invoice.issued_at
+    reservations = (
+        query.options(joinedload(Reservation.vehicle), joinedload(Reservation.invoice))
+        .order_by(Reservation.created_at.desc())
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
     
-    return ReservationListOut(reservations=reservations, total=total)
+    # Proyección directa a dict (vehículo e invoice ya vienen en el mismo query)
+    return fast_json_response({
+        "reservations": [
+            reservation_out_dict(reservation, user_name=current_user.full_name)
+            for reservation in reservations
+        ],
+        "total": total,
+    })
 
 
 @router.get("/stats", response_model=ReservationStats)
@@ -394,7 +590,8 @@ def update_reservation(
         
         # Recalcular precios
         vehicle = db.query(Vehicle).filter(Vehicle.id == reservation.vehicle_id).first()
-        total_days, price_per_day, total_price = calculate_reservation_price(vehicle, new_start, new_end)
+        quote = pricing_engine.quote(vehicle, new_start, new_end)
+        total_days, total_price = quote.total_days, quote.total_price
         
         reservation.start_date = new_start
         reservation.end_date = new_end
@@ -1,16 +1,26 @@
 from fastapi import APIRouter, HTTPException, status, Request, Query
 from datetime import datetime, timezone, timedelta
-from typing import List, Optional
+from typing import Dict, List, Optional
 from beanie import PydanticObjectId
 
-from app.mongodb_models import Reservation, Vehicle, User, ReservationStatus, Payment, PaymentStatus
+from app.mongodb_models import Reservation, Vehicle, User, ReservationStatus, Payment, PaymentStatus, Promotion
+from app.fast_json import fast_json_response
+from app.mongodb import run_transaction
+from app.pricing import pricing_engine
+from app.reservation_batch import batch_failures, find_overlapping_requests, group_by_range, overlaps, should_reject
 from app.schemas_reservations_mongo import (
-    ReservationCreate, ReservationUpdate, ReservationOut, ReservationListOut, ReservationStats, VehicleOut
+    ReservationBatchCreate, ReservationCreate, ReservationUpdate, ReservationOut, ReservationListOut,
+    ReservationStats, VehicleOut, reservation_out_dict,
 )
 from app.security import decode_access_token
+from app.sequences import build_reservation_folio, mongo_reservation_folios
+from app.table_versions import bump_collection_versions
 
 router = APIRouter(prefix="/api/reservations", tags=["Reservations"])
 
+# Estados que ocupan el vehículo en sus fechas
+BLOCKING_STATUS = ["pending", "confirmed", "in_progress"]
+
 
 async def get_current_user_from_token(request: Request) -> User:
     """Obtiene el usuario actual desde el token JWT"""
@@ -40,51 +50,98 @@ async def check_vehicle_availability(
     vehicle_id: str,
     start_date: datetime,
     end_date: datetime,
-    exclude_reservation_id: Optional[str] = None
+    exclude_reservation_id: Optional[str] = None,
+    session=None
 ) -> bool:
     """Verifica si un vehículo está disponible en las fechas especificadas"""
     
-    # Verificar que el vehículo existe y está activo
+    # Verificar que el vehículo existe y está activo (solo se trae el _id)
     try:
-        vehicle = await Vehicle.get(PydanticObjectId(vehicle_id))
+        vehicle_oid = PydanticObjectId(vehicle_id)
     except Exception:
         return False
     
-    if not vehicle or not vehicle.is_active:
+    vehicle = await Vehicle.get_motor_collection().find_one(
+        {"_id": vehicle_oid, "is_active": True}, {"_id": 1}, session=session
+    )
+    if not vehicle:
         return False
     
-    # Buscar reservaciones que se traslapen con las fechas solicitadas
+    # Hay traslape si la existente empieza antes del fin solicitado y termina después del inicio;
+    # el filtro recorre el índice vehicle_id_status_start_date_end_date
     filters = {
         "vehicle_id": vehicle_id,
-        "status": {"$in": ["pending", "confirmed", "in_progress"]},
-        "$or": [
-            # La reservación existente empieza durante el período solicitado
-            {"start_date": {"$gte": start_date, "$lt": end_date}},
-            # La reservación existente termina durante el período solicitado
-            {"end_date": {"$gt": start_date, "$lte": end_date}},
-            # La reservación existente engloba el período solicitado
-            {"start_date": {"$lte": start_date}, "end_date": {"$gte": end_date}}
-        ]
+        "status": {"$in": BLOCKING_STATUS},
+        "start_date": {"$lt": end_date},
+        "end_date": {"$gt": start_date},
     }
     
-    reservations = await Reservation.find(filters).to_list()
+    # Proyección solo con campos del índice: la consulta se resuelve sin leer documentos
+    projection = {"_id": 0, "vehicle_id": 1}
     
-    # Excluir una reservación específica (para actualizaciones)
+    # Excluir una reservación específica (para actualizaciones). _id no está en el índice,
+    # así que en este caso sí se lee cada documento que coincide
     if exclude_reservation_id:
-        reservations = [r for r in reservations if str(r.id) != exclude_reservation_id]
+        try:
+            filters["_id"] = {"$ne": PydanticObjectId(exclude_reservation_id)}
+        except Exception:
+            pass
     
-    return len(reservations) == 0
+    # Basta con saber si existe una
+    conflict = await Reservation.get_motor_collection().find_one(filters, projection, session=session)
+    return conflict is None
 
 
-def calculate_reservation_price(vehicle: Vehicle, start_date: datetime, end_date: datetime) -> tuple:
-    """Calcula el precio total de la reservación"""
-    delta = end_date - start_date
-    total_days = max(1, delta.days)  # Mínimo 1 día
-    
-    price_per_day = vehicle.price_per_day
-    total_price = price_per_day * total_days
-    
-    return total_days, price_per_day, total_price
+async def lock_vehicles(vehicle_ids: List[str], session) -> None:
+    """
+    Escribe en los vehículos dentro de la transacción. Dos transacciones que reservan
+    el mismo vehículo chocan aquí (WriteConflict) y with_transaction reintenta la
+    segunda, que ya ve la reservación de la primera: cierra la carrera entre la
+    verificación de disponibilidad y el insert.
+    """
+    if session is None:
+        return
+    await Vehicle.get_motor_collection().update_many(
+        {"_id": {"$in": [PydanticObjectId(vehicle_id) for vehicle_id in set(vehicle_ids)]}},
+        {"$inc": {"reservation_lock": 1}},
+        session=session,
+    )
+
+
+async def insert_reservations(reservations: List[Reservation], payments: List[Payment], session) -> None:
+    """
+    Inserta las reservaciones y sus pagos (payments[i] es de reservations[i]). Con
+    insert_many no corren los eventos de Beanie: quien llama incrementa las versiones
+    después del commit. Sin transacción, si fallan los pagos se borran las reservaciones.
+    """
+    result = await Reservation.insert_many(reservations, session=session)
+    for reservation, payment, inserted_id in zip(reservations, payments, result.inserted_ids):
+        reservation.id = inserted_id
+        payment.reservation_id = str(inserted_id)
+    try:
+        await Payment.insert_many(payments, session=session)
+    except Exception:
+        if session is None:
+            await Reservation.find({"_id": {"$in": result.inserted_ids}}).delete()
+        raise
+
+
+async def get_active_promotion(promotion_id: Optional[str]) -> Optional[dict]:
+    if not promotion_id:
+        return None
+
+    try:
+        promotion = await Promotion.get(PydanticObjectId(promotion_id))
+    except Exception:
+        raise HTTPException(status_code=400, detail="ID de promocion invalido")
+    if not promotion:
+        raise HTTPException(status_code=404, detail="Promocion no encontrada")
+
+    now = datetime.utcnow()
+    if not promotion.activa or not (promotion.fecha_inicio <= now <= promotion.fecha_fin + timedelta(days=1)):
+        raise HTTPException(status_code=400, detail="Promocion no vigente")
+
+    return {"id": str(promotion.id), "titulo": promotion.titulo, "descuento": promotion.descuento}
 
 
 @router.post("/", response_model=ReservationOut, status_code=status.HTTP_201_CREATED)
@@ -110,20 +167,20 @@ async def create_reservation(
     if payload.start_date < now:
         raise HTTPException(status_code=400, detail="La fecha de inicio debe ser futura")
     
-    # Verificar disponibilidad
+    # Verificar disponibilidad (se repite dentro de la transacción)
     if not await check_vehicle_availability(payload.vehicle_id, payload.start_date, payload.end_date):
         raise HTTPException(
             status_code=409,
             detail="El vehículo no está disponible en las fechas seleccionadas"
         )
     
-    # Calcular precios
-    total_days, price_per_day, total_price = calculate_reservation_price(
-        vehicle, payload.start_date, payload.end_date
-    )
+    # Calcular precios (mismo motor que POST /api/quotes)
+    quote = pricing_engine.quote(vehicle, payload.start_date, payload.end_date)
+    total_days, price_per_day, total_price = quote.total_days, float(quote.price_per_day), float(quote.total_price)
     
-    # Crear reservación
+    # Crear reservación (folio de la secuencia compartida en la colección "counters")
     reservation = Reservation(
+        folio=build_reservation_folio(await mongo_reservation_folios.next()),
         user_id=str(current_user.id),
         vehicle_id=payload.vehicle_id,
         start_date=payload.start_date,
@@ -137,12 +194,9 @@ async def create_reservation(
         notes=payload.notes
     )
     
-    await reservation.insert()
-    
-    # Crear registro de pago
+    # Registro de pago; su reservation_id se asigna al insertar la reservación
     payment_method = (payload.payment_method or "efectivo").strip().lower()
     payment = Payment(
-        reservation_id=str(reservation.id),
         user_id=str(current_user.id),
         amount=total_price,
         method=payment_method,
@@ -150,7 +204,23 @@ async def create_reservation(
         transaction_id=payload.payment_reference,
         notes=payload.payment_notes
     )
-    await payment.insert()
+    
+    # Reservación y pago en una sola transacción (o ninguno de los dos)
+    async def reserve(session) -> None:
+        await lock_vehicles([payload.vehicle_id], session)
+        if not await check_vehicle_availability(
+            payload.vehicle_id, payload.start_date, payload.end_date, session=session
+        ):
+            raise HTTPException(
+                status_code=409,
+                detail="El vehículo no está disponible en las fechas seleccionadas"
+            )
+        await insert_reservations([reservation], [payment], session)
+    
+    try:
+        await run_transaction(reserve)
+    finally:
+        await bump_collection_versions("reservations", "payments")
     
     # Construir respuesta
     vehicle_dict = vehicle.dict()
@@ -164,6 +234,161 @@ async def create_reservation(
     return ReservationOut(**reservation_dict)
 
 
+async def find_unavailable_requests(requests: list, session=None) -> set:
+    """Índices de las solicitudes que chocan con una reservación vigente; una sola consulta con $or"""
+    if not requests:
+        return set()
+    filters = {
+        "status": {"$in": BLOCKING_STATUS},
+        "$or": [
+            {"vehicle_id": vehicle_id, "start_date": {"$lt": end_date}, "end_date": {"$gt": start_date}}
+            for _, vehicle_id, start_date, end_date in requests
+        ],
+    }
+    existing = await Reservation.get_motor_collection().find(
+        filters, {"_id": 0, "vehicle_id": 1, "start_date": 1, "end_date": 1}, session=session
+    ).to_list(None)
+    return {
+        index
+        for index, vehicle_id, start_date, end_date in requests
+        if any(
+            doc["vehicle_id"] == vehicle_id and overlaps(doc["start_date"], doc["end_date"], start_date, end_date)
+            for doc in existing
+        )
+    }
+
+
+@router.post("/batch", status_code=status.HTTP_201_CREATED)
+async def create_reservations_batch(
+    payload: ReservationBatchCreate,
+    request: Request
+):
+    """
+    Varias reservaciones de un jalón (p. ej. la flota de un evento), con insert_many.
+    all_or_nothing: si algún vehículo falla no se crea ninguna (409 con los errores);
+    best_effort: se crean las que se puedan y se reportan las demás.
+    """
+    current_user = await get_current_user_from_token(request)
+    items = payload.items
+    now = datetime.now(timezone.utc)
+    errors: Dict[int, str] = {}
+
+    object_ids = set()
+    for index, item in enumerate(items):
+        try:
+            object_ids.add(PydanticObjectId(item.vehicle_id))
+        except Exception:
+            errors[index] = "ID de vehículo inválido"
+    vehicles = {
+        str(vehicle.id): vehicle
+        for vehicle in await Vehicle.find({"_id": {"$in": list(object_ids)}, "is_active": True}).to_list()
+    }
+    for index, item in enumerate(items):
+        if index in errors:
+            continue
+        if item.vehicle_id not in vehicles:
+            errors[index] = "Vehículo no encontrado o no disponible"
+        elif item.start_date < now:
+            errors[index] = "La fecha de inicio debe ser futura"
+
+    requests = [
+        (index, item.vehicle_id, item.start_date, item.end_date)
+        for index, item in enumerate(items)
+        if index not in errors
+    ]
+    for index, conflict in find_overlapping_requests(requests).items():
+        errors[index] = f"El vehículo ya está en la solicitud {conflict} del lote con fechas traslapadas"
+    requests = [entry for entry in requests if entry[0] not in errors]
+    for index in await find_unavailable_requests(requests):
+        errors[index] = "El vehículo no está disponible en las fechas seleccionadas"
+    requests = [entry for entry in requests if entry[0] not in errors]
+
+    failed = batch_failures(errors, [item.vehicle_id for item in items])
+    accepted = [entry[0] for entry in requests]
+    if should_reject(payload.mode, accepted, errors):
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "No se pudo reservar el lote", "mode": payload.mode, "failed": failed},
+        )
+
+    # Precios: una cotización por rango de fechas para todos los vehículos de ese rango
+    promotion = await get_active_promotion(payload.promotion_id)
+    quotes = {}
+    for (start_date, end_date), group in group_by_range(requests).items():
+        range_quotes = pricing_engine.quote_many(
+            [vehicles[vehicle_id] for _, vehicle_id, _, _ in group], start_date, end_date, promotion
+        )
+        quotes.update(zip((entry[0] for entry in group), range_quotes))
+
+    folios = [build_reservation_folio(number) for number in await mongo_reservation_folios.next_many(len(accepted))]
+    reservations = []
+    for index, folio in zip(accepted, folios):
+        item, quote = items[index], quotes[index]
+        pickup_location = item.pickup_location or payload.pickup_location
+        reservations.append(Reservation(
+            folio=folio,
+            user_id=str(current_user.id),
+            vehicle_id=item.vehicle_id,
+            start_date=item.start_date,
+            end_date=item.end_date,
+            pickup_location=pickup_location,
+            return_location=item.return_location or payload.return_location or pickup_location,
+            total_days=quote.total_days,
+            price_per_day=float(quote.price_per_day),
+            total_price=float(quote.total_price),
+            status=ReservationStatus.PENDING,
+            notes=item.notes or payload.notes,
+        ))
+
+    payment_method = (payload.payment_method or "efectivo").strip().lower()
+    payments = [
+        Payment(
+            user_id=str(current_user.id),
+            amount=reservation.total_price,
+            method=payment_method,
+            status=PaymentStatus.ACCEPTED,
+            transaction_id=payload.payment_reference,
+            notes=payload.payment_notes,
+        )
+        for reservation in reservations
+    ]
+
+    async def reserve(session) -> None:
+        await lock_vehicles([entry[1] for entry in requests], session)
+        # Otra reservación pudo entrar desde la verificación de arriba
+        if await find_unavailable_requests(requests, session=session):
+            raise HTTPException(
+                status_code=409,
+                detail="Uno o más vehículos dejaron de estar disponibles; intenta de nuevo",
+            )
+        await insert_reservations(reservations, payments, session)
+
+    try:
+        await run_transaction(reserve)
+    finally:
+        await bump_collection_versions("reservations", "payments")
+    reservation_ids = [str(reservation.id) for reservation in reservations]
+
+    return fast_json_response({
+        "mode": payload.mode,
+        "created": [
+            {
+                "index": index,
+                "reservation_id": reservation_id,
+                "folio": reservation.folio,
+                "vehicle_id": reservation.vehicle_id,
+                "start_date": reservation.start_date,
+                "end_date": reservation.end_date,
+                "total_days": reservation.total_days,
+                "total_price": reservation.total_price,
+            }
+            for index, reservation_id, reservation in zip(accepted, reservation_ids, reservations)
+        ],
+        "failed": failed,
+        "total_price": round(sum(reservation.total_price for reservation in reservations), 2),
+    }, status_code=status.HTTP_201_CREATED)
+
+
 @router.get("/", response_model=ReservationListOut)
 async def list_my_reservations(
     request: Request,
@@ -183,25 +408,27 @@ async def list_my_reservations(
     total = await Reservation.find(filters).count()
     reservations = await Reservation.find(filters).sort("-created_at").skip(skip).limit(limit).to_list()
     
-    # Agregar información del vehículo
-    reservations_out = []
+    # Agregar información del vehículo (un solo query para todos los vehículos)
+    vehicle_ids = []
     for reservation in reservations:
         try:
-            vehicle = await Vehicle.get(PydanticObjectId(reservation.vehicle_id))
-            vehicle_dict = vehicle.dict()
-            vehicle_dict["id"] = str(vehicle.id)
-            
-            reservation_dict = reservation.dict()
-            reservation_dict["id"] = str(reservation.id)
-            reservation_dict["vehicle"] = VehicleOut(**vehicle_dict)
-            reservation_dict["user_name"] = current_user.full_name
-            
-            reservations_out.append(ReservationOut(**reservation_dict))
+            vehicle_ids.append(PydanticObjectId(reservation.vehicle_id))
         except Exception:
+            continue
+    vehicles = await Vehicle.find({"_id": {"$in": vehicle_ids}}).to_list() if vehicle_ids else []
+    vehicles_by_id = {str(vehicle.id): vehicle for vehicle in vehicles}
+    
+    reservations_out = []
+    for reservation in reservations:
+        vehicle = vehicles_by_id.get(reservation.vehicle_id)
+        if not vehicle:
             # Si no se encuentra el vehículo, omitir esta reservación
             continue
+        reservations_out.append(
+            reservation_out_dict(reservation, vehicle=vehicle, user_name=current_user.full_name)
+        )
     
-    return ReservationListOut(reservations=reservations_out, total=total)
+    return fast_json_response({"reservations": reservations_out, "total": total})
 
 
 @router.get("/stats", response_model=ReservationStats)
@@ -297,7 +524,8 @@ async def update_reservation(
         
         # Recalcular precios
         vehicle = await Vehicle.get(PydanticObjectId(reservation.vehicle_id))
-        total_days, price_per_day, total_price = calculate_reservation_price(vehicle, new_start, new_end)
+        quote = pricing_engine.quote(vehicle, new_start, new_end)
+        total_days, total_price = quote.total_days, float(quote.total_price)
         
         reservation.start_date = new_start
         reservation.end_date = new_end
@@ -1,12 +1,69 @@
+import bisect
+import itertools
 from fastapi import APIRouter, HTTPException
 from app.models.schemas import Review, ReviewCreate, ReviewsResponse
 from datetime import date
 from typing import List
 
+
+class ReviewStore:
+    """
+    Reviews en memoria ordenadas por (fecha, id), con suma/conteo/histograma
+    incrementales e ids generados por contador.
+
+    - latest(limit): O(limit)
+    - stats(): O(1)
+    - add(): inserción con bisect (append cuando la fecha es la más reciente)
+    """
+
+    def __init__(self, reviews: List[dict]):
+        self._keys: List[tuple] = []
+        self._reviews: List[dict] = []
+        self._sum = 0
+        self._histogram = {str(value): 0 for value in range(1, 6)}
+        max_id = 0
+        for review in reviews:
+            self._insert(review)
+            max_id = max(max_id, review["id"])
+        self._ids = itertools.count(max_id + 1)
+
+    def _insert(self, review: dict) -> None:
+        key = (review["fecha"], review["id"])
+        index = bisect.bisect_right(self._keys, key)
+        self._keys.insert(index, key)
+        self._reviews.insert(index, review)
+        self._sum += review["calificacion"]
+        self._histogram[str(review["calificacion"])] += 1
+
+    def add(self, usuario: str, calificacion: int, comentario: str, fecha: date) -> dict:
+        review = {
+            "id": next(self._ids),
+            "usuario": usuario,
+            "calificacion": calificacion,
+            "comentario": comentario,
+            "fecha": fecha,
+        }
+        self._insert(review)
+        return review
+
+    def latest(self, limit: int) -> List[dict]:
+        if limit <= 0:
+            return []
+        return self._reviews[:-limit - 1:-1]
+
+    def stats(self) -> dict:
+        total = len(self._reviews)
+        return {
+            "promedio_calificacion": round(self._sum / total, 2) if total else 0,
+            "total_reviews": total,
+            "histograma": dict(self._histogram),
+        }
+
+
 router = APIRouter()
 
 # Base de datos simulada de reviews
-reviews_db = [
+review_store = ReviewStore([
     {
         "id": 1,
         "usuario": "Miguel Martinez",
@@ -28,7 +85,7 @@ reviews_db = [
         "comentario": "Buen servicio en general. Los asientos son cómodos y el precio es justo.",
         "fecha": date(2026, 1, 25)
     }
-]
+])
 
 @router.get("/", response_model=ReviewsResponse)
 async def get_reviews(limit: int = 10):
@@ -38,18 +95,10 @@ async def get_reviews(limit: int = 10):
     - **limit**: Número máximo de reviews a retornar (default: 10)
     """
     try:
-        # Ordenar por fecha más reciente
-        reviews_sorted = sorted(reviews_db, key=lambda x: x["fecha"], reverse=True)
-        reviews_limited = reviews_sorted[:limit]
-        
-        # Calcular promedio de calificación
-        total_calificaciones = sum(r["calificacion"] for r in reviews_db)
-        promedio = total_calificaciones / len(reviews_db) if reviews_db else 0
-        
+        # Las reviews ya están ordenadas por fecha; el promedio es incremental
         return ReviewsResponse(
-            reviews=[Review(**r) for r in reviews_limited],
-            promedio_calificacion=round(promedio, 2),
-            total_reviews=len(reviews_db)
+            reviews=[Review(**r) for r in review_store.latest(limit)],
+            **review_store.stats()
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener reviews: {str(e)}")
@@ -64,19 +113,13 @@ async def create_review(review: ReviewCreate):
     - **comentario**: Comentario del usuario
     """
     try:
-        # Generar nuevo ID
-        new_id = max([r["id"] for r in reviews_db]) + 1 if reviews_db else 1
-        
-        # Crear nueva review
-        new_review = {
-            "id": new_id,
-            "usuario": review.usuario,
-            "calificacion": review.calificacion,
-            "comentario": review.comentario,
-            "fecha": date.today()
-        }
-        
-        reviews_db.append(new_review)
+        # Crear nueva review (el id sale del contador del store)
+        new_review = review_store.add(
+            usuario=review.usuario,
+            calificacion=review.calificacion,
+            comentario=review.comentario,
+            fecha=date.today()
+        )
         
         return Review(**new_review)
     except Exception as e:
@@ -87,13 +130,4 @@ async def get_average_rating():
     """
     Endpoint para obtener el promedio de calificaciones
     """
-    if not reviews_db:
-        return {"promedio_calificacion": 0, "total_reviews": 0}
-    
-    total_calificaciones = sum(r["calificacion"] for r in reviews_db)
-    promedio = total_calificaciones / len(reviews_db)
-    
-    return {
-        "promedio_calificacion": round(promedio, 2),
-        "total_reviews": len(reviews_db)
-    }
+    return review_store.stats()
@@ -1,11 +1,115 @@
+import logging
+import os
 from fastapi import APIRouter, HTTPException
+from pymongo.errors import DuplicateKeyError
 from app.models.schemas import Review, ReviewCreate, ReviewsResponse
+from app.mongodb import get_database
 from app.mongodb_models import Review as ReviewModel
+from app.scheduler import AsyncLeasedJob
 from datetime import datetime
 from typing import List
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# Documento con los agregados de calificaciones, mantenido con $inc en cada review nueva
+REVIEW_STATS_COLLECTION = "review_stats"
+REVIEW_STATS_ID = "global"
+RATING_VALUES = range(1, 6)
+REVIEW_STATS_REPAIR_INTERVAL_SECONDS = float(os.getenv("REVIEW_STATS_REPAIR_INTERVAL_SECONDS", "3600"))
+
+
+def empty_histogram() -> dict:
+    return {str(value): 0 for value in RATING_VALUES}
+
+
+def format_review_stats(stats: dict) -> dict:
+    total = int(stats.get("count", 0))
+    rating_sum = int(stats.get("sum", 0))
+    histogram = empty_histogram()
+    histogram.update({str(k): int(v) for k, v in (stats.get("histogram") or {}).items()})
+    return {
+        "promedio_calificacion": round(rating_sum / total, 2) if total else 0,
+        "total_reviews": total,
+        "histograma": histogram,
+    }
+
+
+async def compute_review_stats() -> dict:
+    """Agregados calculados desde cero con $group sobre las reviews"""
+    pipeline = [{"$group": {"_id": "$calificacion", "count": {"$sum": 1}}}]
+    histogram = empty_histogram()
+    async for row in ReviewModel.get_motor_collection().aggregate(pipeline):
+        histogram[str(row["_id"])] = row["count"]
+
+    return {
+        "count": sum(histogram.values()),
+        "sum": sum(int(rating) * count for rating, count in histogram.items()),
+        "histogram": histogram,
+    }
+
+
+async def seed_review_stats() -> dict:
+    """
+    Crea el documento de agregados si no existe. Nunca sobrescribe uno existente:
+    si otro request ya lo creó (o un $inc con upsert), se usa ese.
+    """
+    collection = get_database()[REVIEW_STATS_COLLECTION]
+    stats = await compute_review_stats()
+    try:
+        await collection.insert_one({"_id": REVIEW_STATS_ID, **stats})
+    except DuplicateKeyError:
+        return await collection.find_one({"_id": REVIEW_STATS_ID})
+    return stats
+
+
+async def rebuild_review_stats() -> dict:
+    """
+    Repara los agregados (p. ej. si el proceso murió entre el insert de la review y el
+    $inc). Solo reemplaza el documento si nadie lo modificó mientras corría el $group;
+    si un $inc se adelantó, se deja para la siguiente corrida.
+    """
+    collection = get_database()[REVIEW_STATS_COLLECTION]
+    current = await collection.find_one({"_id": REVIEW_STATS_ID})
+    if current is None:
+        return await seed_review_stats()
+
+    stats = await compute_review_stats()
+    if stats["count"] != current.get("count") or stats["sum"] != current.get("sum"):
+        result = await collection.replace_one(
+            {"_id": REVIEW_STATS_ID, "count": current.get("count"), "sum": current.get("sum")},
+            stats,
+        )
+        if result.modified_count:
+            logger.warning(
+                "Agregados de reviews corregidos: %s reviews (antes %s)", stats["count"], current.get("count")
+            )
+    return stats
+
+
+async def get_review_stats() -> dict:
+    stats = await get_database()[REVIEW_STATS_COLLECTION].find_one({"_id": REVIEW_STATS_ID})
+    if stats is None:
+        stats = await seed_review_stats()
+    return stats
+
+
+async def record_review_rating(calificacion: int) -> None:
+    await get_database()[REVIEW_STATS_COLLECTION].update_one(
+        {"_id": REVIEW_STATS_ID},
+        {"$inc": {"count": 1, "sum": calificacion, f"histogram.{calificacion}": 1}},
+        upsert=True,
+    )
+
+
+# Concilia periódicamente los agregados con las reviews guardadas
+review_stats_repair_job = AsyncLeasedJob(
+    "review-stats-repair",
+    rebuild_review_stats,
+    REVIEW_STATS_REPAIR_INTERVAL_SECONDS,
+)
+
 
 @router.get("/", response_model=ReviewsResponse)
 async def get_reviews(limit: int = 10):
@@ -18,9 +122,8 @@ async def get_reviews(limit: int = 10):
         # Obtener reviews ordenadas por fecha
         reviews_list = await ReviewModel.find().sort("-fecha").limit(limit).to_list()
         
-        # Calcular promedio de calificación
-        all_reviews = await ReviewModel.find_all().to_list()
-        promedio = sum(r.calificacion for r in all_reviews) / len(all_reviews) if all_reviews else 0
+        # Agregados precalculados (O(1), no depende del número de reviews)
+        stats = format_review_stats(await get_review_stats())
         
         reviews_out = []
         for r in reviews_list:
@@ -32,11 +135,7 @@ async def get_reviews(limit: int = 10):
                 fecha=r.fecha.date() if isinstance(r.fecha, datetime) else r.fecha
             ))
         
-        return ReviewsResponse(
-            reviews=reviews_out,
-            promedio_calificacion=round(promedio, 2),
-            total_reviews=len(all_reviews)
-        )
+        return ReviewsResponse(reviews=reviews_out, **stats)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener reviews: {str(e)}")
 
@@ -51,6 +150,10 @@ async def create_review(review: ReviewCreate):
     - **comentario**: Comentario del usuario
     """
     try:
+        # Asegurar que el documento de agregados exista antes de insertar,
+        # para que el $inc no se aplique sobre un documento vacío
+        await get_review_stats()
+        
         # Crear nueva review
         new_review = ReviewModel(
             usuario=review.usuario,
@@ -60,6 +163,7 @@ async def create_review(review: ReviewCreate):
         )
         
         await new_review.insert()
+        await record_review_rating(new_review.calificacion)
         
         return Review(
             id=str(new_review.id),
@@ -78,12 +182,6 @@ async def get_average_rating():
     Endpoint para obtener la calificación promedio
     """
     try:
-        all_reviews = await ReviewModel.find_all().to_list()
-        promedio = sum(r.calificacion for r in all_reviews) / len(all_reviews) if all_reviews else 0
-        
-        return {
-            "promedio_calificacion": round(promedio, 2),
-            "total_reviews": len(all_reviews)
-        }
+        return format_review_stats(await get_review_stats())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al calcular promedio: {str(e)}")
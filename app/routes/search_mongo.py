@@ -1,83 +1,92 @@
-from fastapi import APIRouter, Query
-from app.mongodb_models import Vehicle
-from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from app.city_index import CITY_SEARCH_DEFAULT_LIMIT, get_city_index
+from app.fast_json import fast_json_response
+from app.http_cache import build_etag, conditional_response
+from app.quote_cache import price_version, with_quotes
+from app.table_versions import get_collection_versions
+from app.vehicle_catalog import mongo_vehicle_catalog
+from app.vehicle_features import parse_feature_filter
+from datetime import datetime
+from typing import List, Optional
 
 router = APIRouter()
 
-# Ciudades principales de México
-CIUDADES_MEXICO = [
-    "Aguascalientes", "Campeche", "Cancún", "Celaya", "Chetumal", "Chihuahua",
-    "Ciudad de México", "Ciudad Juárez", "Ciudad Victoria", "Colima", "Cuernavaca",
-    "Culiacán", "Durango", "Ensenada", "Guadalajara", "Guanajuato", "Hermosillo",
-    "Irapuato", "La Paz", "León", "Los Mochis", "Manzanillo", "Matamoros",
-    "Mazatlán", "Mérida", "Mexicali", "Monterrey", "Morelia", "Nogales",
-    "Nuevo Laredo", "Oaxaca", "Pachuca", "Playa del Carmen", "Puebla", "Puerto Vallarta",
-    "Querétaro", "Reynosa", "Saltillo", "San Luis Potosí", "San Miguel de Allende",
-    "Tampico", "Tapachula", "Tepic", "Tijuana", "Toluca", "Torreón", "Tuxtla Gutiérrez",
-    "Uruapan", "Veracruz", "Villahermosa", "Zacatecas"
-]
+# El catálogo y su índice viven en app/city_index.py; se carga una vez al arrancar
+CITIES_CACHE_CONTROL = "public, max-age=3600"
+
+SEARCH_VEHICLE_FIELDS = (
+    "id", "brand", "model", "year", "vehicle_type", "capacity", "plate", "color",
+    "price_per_day", "price_per_hour", "description", "features", "image_url", "status",
+)
 
 
 @router.get("/cities")
-async def get_cities(q: Optional[str] = None):
-    """Obtiene lista de ciudades de México, con filtro opcional"""
+async def get_cities(
+    response: Response,
+    q: Optional[str] = None,
+    limit: int = Query(CITY_SEARCH_DEFAULT_LIMIT, ge=1, le=50),
+):
+    """Obtiene lista de ciudades de México (hasta `limit`), con filtro opcional (sin distinguir acentos)"""
+    index = get_city_index()
     if q:
-        # Filtrar ciudades que contengan el query (case insensitive)
-        filtered_cities = [city for city in CIUDADES_MEXICO if q.lower() in city.lower()]
-        return {"cities": sorted(filtered_cities)}
-    
-    return {"cities": sorted(CIUDADES_MEXICO)}
+        cities = index.search(q, limit)
+    else:
+        cities = index.names[:limit]
+    response.headers["Cache-Control"] = CITIES_CACHE_CONTROL
+    return fast_json_response({"cities": cities}, response)
+
+
+def parse_search_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Fecha inválida: {value}")
 
 
 @router.get("/vehicles")
 async def search_vehicles(
+    request: Request,
+    response: Response,
     origin: Optional[str] = Query(None, description="Ciudad de origen"),
     destination: Optional[str] = Query(None, description="Ciudad de destino"),
     start_date: Optional[str] = Query(None, description="Fecha de inicio (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Fecha de fin (YYYY-MM-DD); con start_date agrega el total cotizado"),
     capacity: Optional[int] = Query(None, description="Capacidad mínima de pasajeros"),
-    vehicle_type: Optional[str] = Query(None, description="Tipo de vehículo")
+    vehicle_type: Optional[str] = Query(None, description="Tipo de vehículo"),
+    features: Optional[List[str]] = Query(None, description="Características requeridas (ac,gps)"),
 ):
     """Buscar vehículos disponibles con filtros en MongoDB"""
     
-    # Query base - solo vehículos activos y disponibles
-    filters = {
-        "is_active": True,
-        "status": "available"
-    }
-    
-    # Aplicar filtros
-    if capacity:
-        filters["capacity"] = {"$gte": capacity}
-    
-    if vehicle_type:
-        filters["vehicle_type"] = vehicle_type
+    versions = await get_collection_versions(["vehicles"])
+    etag = build_etag(request, versions)
+    not_modified = conditional_response(request, response, etag)
+    if not_modified:
+        return not_modified
     
-    vehicles = await Vehicle.find(filters).sort("+price_per_day").to_list()
+    # Solo vehículos activos y disponibles, desde el catálogo en memoria
+    catalog = await mongo_vehicle_catalog.get(versions["vehicles"])
+    filters = dict(
+        vehicle_type=vehicle_type,
+        min_capacity=capacity,
+        available_only=True,
+        features=parse_feature_filter(features),
+    )
+    vehicles = catalog.query(**filters)
     
-    # Formatear respuesta
-    results = []
-    for vehicle in vehicles:
-        results.append({
-            "id": str(vehicle.id),  # MongoDB usa string IDs
-            "brand": vehicle.brand,
-            "model": vehicle.model,
-            "year": vehicle.year,
-            "vehicle_type": vehicle.vehicle_type,
-            "capacity": vehicle.capacity,
-            "plate": vehicle.plate,
-            "color": vehicle.color,
-            "price_per_day": float(vehicle.price_per_day),
-            "price_per_hour": float(vehicle.price_per_hour) if vehicle.price_per_hour else None,
-            "description": vehicle.description,
-            "features": vehicle.features,
-            "image_url": vehicle.image_url,
-            "status": vehicle.status
-        })
+    # Formatear respuesta (con la cotización de todos los resultados en un solo cálculo)
+    results = [{field: vehicle[field] for field in SEARCH_VEHICLE_FIELDS} for vehicle in vehicles]
+    results = with_quotes(
+        results, parse_search_date(start_date), parse_search_date(end_date), price_version(versions["vehicles"], 0)
+    )
     
-    return {
+    return fast_json_response({
         "total": len(results),
         "origin": origin,
         "destination": destination,
         "start_date": start_date,
-        "vehicles": results
-    }
+        "end_date": end_date,
+        "vehicles": results,
+        "facets": catalog.facets(**filters),
+    }, response)
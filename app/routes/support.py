@@ -1,6 +1,5 @@
 import re
-from datetime import datetime, timezone
-from typing import Optional, Tuple
+from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
@@ -8,6 +7,8 @@ from sqlalchemy.orm import Session
 
 from app.db import get_db
 from app.db_models import Invoice, Reservation, SupportTicket
+from app.invoicing import invoice_worker
+from app.sequences import build_reservation_folio
 
 router = APIRouter(prefix="/api/support", tags=["Support"])
 
@@ -23,25 +24,20 @@ class SupportTicketCreate(BaseModel):
     contact_phone: Optional[str] = Field(default=None, max_length=30)
 
 
-def parse_folio(raw_folio: str) -> Tuple[int, str]:
+def parse_folio(raw_folio: str) -> str:
+    """'7', 'vt-7' y 'VT-0007' -> 'VT-0007'"""
     value = (raw_folio or "").strip().upper()
     if not value:
         raise HTTPException(status_code=400, detail="Folio requerido")
 
     if value.isdigit():
-        reservation_id = int(value)
-        return reservation_id, f"VT-{reservation_id:04d}"
+        return build_reservation_folio(int(value))
 
     match = FOLIO_REGEX.match(value)
     if not match:
         raise HTTPException(status_code=400, detail="Formato de folio invalido. Usa VT-0001")
 
-    reservation_id = int(match.group(1))
-    return reservation_id, f"VT-{reservation_id:04d}"
-
-
-def build_invoice_number(reservation_id: int, issued_at: datetime) -> str:
-    return f"FAC-{issued_at.strftime('%Y%m%d')}-{reservation_id:06d}"
+    return build_reservation_folio(int(match.group(1)))
 
 
 @router.post("/tickets")
@@ -49,9 +45,10 @@ def create_support_ticket(
     payload: SupportTicketCreate,
     db: Session = Depends(get_db),
 ):
-    reservation_id, normalized_folio = parse_folio(payload.folio)
+    normalized_folio = parse_folio(payload.folio)
 
-    reservation = db.query(Reservation).filter(Reservation.id == reservation_id).first()
+    # El folio ya no es el id: sale de la secuencia (app/sequences.py)
+    reservation = db.query(Reservation).filter(Reservation.folio == normalized_folio).first()
     if not reservation:
         raise HTTPException(status_code=404, detail="No se encontro la reservacion para ese folio")
 
@@ -72,23 +69,13 @@ def create_support_ticket(
     )
     db.add(ticket)
 
-    invoice = db.query(Invoice).filter(Invoice.reservation_id == reservation.id).first()
-    if not invoice:
-        issued_at = datetime.now(timezone.utc)
-        invoice = Invoice(
-            reservation_id=reservation.id,
-            folio=normalized_folio,
-            invoice_number=build_invoice_number(reservation.id, issued_at),
-            amount=reservation.total_price,
-            currency="MXN",
-            status="generated",
-            issued_at=issued_at,
-        )
-        db.add(invoice)
-
     db.commit()
     db.refresh(ticket)
-    db.refresh(invoice)
+
+    invoice = db.query(Invoice).filter(Invoice.reservation_id == reservation.id).first()
+    if not invoice:
+        # La genera el worker de facturas; el ticket no espera por ella
+        invoice_worker.submit(reservation.id)
 
     return {
         "message": "Ticket creado exitosamente",
@@ -96,7 +83,7 @@ def create_support_ticket(
         "folio": ticket.folio,
         "reservation_id": reservation.id,
         "status": "abierto",
-        "invoice_number": invoice.invoice_number,
-        "invoice_folio": invoice.folio,
+        "invoice_number": invoice.invoice_number if invoice else None,
+        "invoice_folio": invoice.folio if invoice else normalized_folio,
         "created_at": ticket.created_at,
     }
@@ -1,67 +1,82 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
 from datetime import datetime
 from typing import List, Optional
 
 from app.db import get_db
-from app.db_models import Vehicle
+from app.fast_json import fast_json_response
+from app.http_cache import build_etag, conditional_response
+from app.quote_cache import price_version, with_quotes
 from app.schemas_reservations import VehicleOut, VehicleListOut
+from app.table_versions import get_table_versions
+from app.vehicle_catalog import vehicle_catalog
+from app.vehicle_features import parse_feature_filter
 
 router = APIRouter(prefix="/api/vehicles", tags=["Vehicles"])
 
 
 @router.get("/", response_model=VehicleListOut)
 def list_vehicles(
+    request: Request,
+    response: Response,
     vehicle_type: Optional[str] = None,
     min_capacity: Optional[int] = None,
     max_price: Optional[float] = None,
     is_available: bool = True,
+    features: Optional[List[str]] = Query(None, description="Características requeridas (ac,gps)"),
+    start_date: Optional[datetime] = Query(None, description="Con end_date, agrega la cotización de cada vehículo"),
+    end_date: Optional[datetime] = None,
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db)
 ):
     """Listar vehículos disponibles con filtros"""
     
-    query = db.query(Vehicle)
+    versions = get_table_versions(db, ["vehicles"])
+    etag = build_etag(request, versions)
+    not_modified = conditional_response(request, response, etag)
+    if not_modified:
+        return not_modified
     
-    # Filtrar por activos
-    if is_available:
-        query = query.filter(Vehicle.is_active == True, Vehicle.status == 'available')
+    # Filtros sobre el catálogo en memoria (se recarga solo si cambió la versión de vehicles)
+    catalog = vehicle_catalog.get(db, versions["vehicles"])
+    filters = dict(
+        vehicle_type=vehicle_type,
+        min_capacity=min_capacity,
+        max_price=max_price,
+        available_only=is_available,
+        features=parse_feature_filter(features),
+    )
+    vehicles = catalog.query(**filters)
     
-    # Filtros opcionales
-    if vehicle_type:
-        query = query.filter(Vehicle.vehicle_type == vehicle_type)
-    
-    if min_capacity:
-        query = query.filter(Vehicle.capacity >= min_capacity)
-    
-    if max_price:
-        query = query.filter(Vehicle.price_per_day <= max_price)
-    
-    total = query.count()
-    vehicles = query.order_by(Vehicle.price_per_day.asc()).offset(skip).limit(limit).all()
-    
-    return VehicleListOut(vehicles=vehicles, total=total)
+    return fast_json_response(
+        {
+            "vehicles": with_quotes(
+                vehicles[skip:skip + limit], start_date, end_date, price_version(versions["vehicles"], 0)
+            ),
+            "total": len(vehicles),
+            "facets": catalog.facets(**filters),
+        },
+        response,
+    )
 
 
 @router.get("/types")
 def get_vehicle_types(db: Session = Depends(get_db)):
     """Obtener tipos de vehículos disponibles"""
-    types = db.query(Vehicle.vehicle_type).filter(Vehicle.is_active == True).distinct().all()
-    return {"vehicle_types": [t[0] for t in types]}
+    return {"vehicle_types": vehicle_catalog.get(db).vehicle_types}
 
 
 @router.get("/{vehicle_id}", response_model=VehicleOut)
 def get_vehicle(vehicle_id: int, db: Session = Depends(get_db)):
     """Obtener detalles de un vehículo específico"""
     
-    vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
+    vehicle = vehicle_catalog.get(db).get(vehicle_id)
     
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehículo no encontrado")
     
-    return vehicle
+    return fast_json_response(vehicle)
 
 
 @router.get("/{vehicle_id}/availability")
@@ -75,7 +90,7 @@ def check_vehicle_availability(
     
     from app.routes.reservations import check_vehicle_availability as check_availability
     
-    vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
+    vehicle = vehicle_catalog.get(db).get(vehicle_id)
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehículo no encontrado")
     
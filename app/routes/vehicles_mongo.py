@@ -1,65 +1,69 @@
-from fastapi import APIRouter, HTTPException, status, Query
+from fastapi import APIRouter, HTTPException, status, Query, Request, Response
 from datetime import datetime
 from typing import List, Optional
 from beanie import PydanticObjectId
 
-from app.mongodb_models import Vehicle
+from app.fast_json import fast_json_response
+from app.http_cache import build_etag, conditional_response
+from app.quote_cache import price_version, with_quotes
 from app.schemas_reservations_mongo import VehicleOut, VehicleListOut
+from app.table_versions import get_collection_versions
+from app.vehicle_catalog import mongo_vehicle_catalog
+from app.vehicle_features import parse_feature_filter
 
 router = APIRouter(prefix="/api/vehicles", tags=["Vehicles"])
 
 
 @router.get("/", response_model=VehicleListOut)
 async def list_vehicles(
+    request: Request,
+    response: Response,
     vehicle_type: Optional[str] = None,
     min_capacity: Optional[int] = None,
     max_price: Optional[float] = None,
     is_available: bool = True,
+    features: Optional[List[str]] = Query(None, description="Características requeridas (ac,gps)"),
+    start_date: Optional[datetime] = Query(None, description="Con end_date, agrega la cotización de cada vehículo"),
+    end_date: Optional[datetime] = None,
     skip: int = 0,
     limit: int = 100,
 ):
     """Listar vehículos disponibles con filtros"""
     
-    # Construir filtros dinámicos
-    filters = {}
-    
-    # Filtrar por activos y disponibles
-    if is_available:
-        filters["is_active"] = True
-        filters["status"] = "available"
-    
-    # Filtros opcionales
-    if vehicle_type:
-        filters["vehicle_type"] = vehicle_type
-    
-    if min_capacity:
-        filters["capacity"] = {"$gte": min_capacity}
-    
-    if max_price:
-        filters["price_per_day"] = {"$lte": max_price}
-    
-    # Contar total
-    total = await Vehicle.find(filters).count()
-    
-    # Obtener vehículos con paginación
-    vehicles = await Vehicle.find(filters).sort("+price_per_day").skip(skip).limit(limit).to_list()
-    
-    # Convertir a VehicleOut con id como string
-    vehicles_out = []
-    for v in vehicles:
-        vehicle_dict = v.dict()
-        vehicle_dict["id"] = str(v.id)
-        vehicles_out.append(VehicleOut(**vehicle_dict))
-    
-    return VehicleListOut(vehicles=vehicles_out, total=total)
+    versions = await get_collection_versions(["vehicles"])
+    etag = build_etag(request, versions)
+    not_modified = conditional_response(request, response, etag)
+    if not_modified:
+        return not_modified
+    
+    # Filtros sobre el catálogo en memoria (se recarga solo si cambió la versión de vehicles)
+    catalog = await mongo_vehicle_catalog.get(versions["vehicles"])
+    filters = dict(
+        vehicle_type=vehicle_type,
+        min_capacity=min_capacity,
+        max_price=max_price,
+        available_only=is_available,
+        features=parse_feature_filter(features),
+    )
+    vehicles = catalog.query(**filters)
+    
+    return fast_json_response(
+        {
+            "vehicles": with_quotes(
+                vehicles[skip:skip + limit], start_date, end_date, price_version(versions["vehicles"], 0)
+            ),
+            "total": len(vehicles),
+            "facets": catalog.facets(**filters),
+        },
+        response,
+    )
 
 
 @router.get("/types")
 async def get_vehicle_types():
     """Obtener tipos de vehículos disponibles"""
-    # Usar agregación para obtener tipos únicos
-    types = await Vehicle.find({"is_active": True}).distinct("vehicle_type")
-    return {"vehicle_types": types}
+    catalog = await mongo_vehicle_catalog.get()
+    return {"vehicle_types": catalog.vehicle_types}
 
 
 @router.get("/{vehicle_id}", response_model=VehicleOut)
@@ -67,16 +71,15 @@ async def get_vehicle(vehicle_id: str):
     """Obtener detalles de un vehículo específico"""
     
     try:
-        vehicle = await Vehicle.get(PydanticObjectId(vehicle_id))
+        PydanticObjectId(vehicle_id)
     except Exception:
         raise HTTPException(status_code=400, detail="ID de vehículo inválido")
     
+    vehicle = (await mongo_vehicle_catalog.get()).get(vehicle_id)
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehículo no encontrado")
     
-    vehicle_dict = vehicle.dict()
-    vehicle_dict["id"] = str(vehicle.id)
-    return VehicleOut(**vehicle_dict)
+    return fast_json_response(vehicle)
 
 
 @router.get("/{vehicle_id}/availability")
@@ -90,10 +93,11 @@ async def check_vehicle_availability_endpoint(
     from app.routes.reservations_mongo import check_vehicle_availability
     
     try:
-        vehicle = await Vehicle.get(PydanticObjectId(vehicle_id))
+        PydanticObjectId(vehicle_id)
     except Exception:
         raise HTTPException(status_code=400, detail="ID de vehículo inválido")
     
+    vehicle = (await mongo_vehicle_catalog.get()).get(vehicle_id)
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehículo no encontrado")
     
@@ -0,0 +1,164 @@
+"""
+Tareas periódicas dentro del proceso de la API.
+
+Cada worker de uvicorn arranca su propio scheduler, pero una tarea solo se ejecuta
+en el proceso que tiene su lease (fila en scheduler_leases / documento en la colección
+del mismo nombre). El dueño lo renueva en cada corrida; si el proceso muere, el
+lease expira y otro worker toma la tarea.
+"""
+import asyncio
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.db_models import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+LEASES_COLLECTION = "scheduler_leases"
+
+# Identificador de este proceso como dueño de leases
+PROCESS_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def acquire_lease(db: Session, name: str, owner: str, seconds: int) -> bool:
+    """Toma o renueva el lease si está libre, vencido o ya es nuestro"""
+    now = datetime.utcnow()
+    table = SchedulerLease.__table__
+    stmt = sqlite_insert(table).values(name=name, owner=owner, expires_at=now + timedelta(seconds=seconds))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={"owner": stmt.excluded.owner, "expires_at": stmt.excluded.expires_at},
+        where=or_(table.c.owner == owner, table.c.expires_at < now),
+    )
+    result = db.connection().execute(stmt)
+    db.commit()
+    return result.rowcount == 1
+
+
+class LeasedJob:
+    """Ejecuta `job(db)` cada `interval_seconds` en un hilo, solo si este proceso tiene el lease"""
+
+    def __init__(
+        self,
+        name: str,
+        job: Callable[[Session], None],
+        interval_seconds: float,
+        lease_seconds: Optional[int] = None,
+    ):
+        self.name = name
+        self.job = job
+        self.interval = interval_seconds
+        self.lease_seconds = lease_seconds or max(60, int(interval_seconds * 3))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"job-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self) -> bool:
+        """Corre la tarea si se obtiene el lease; devuelve si se ejecutó"""
+        db = SessionLocal()
+        try:
+            if not acquire_lease(db, self.name, PROCESS_OWNER, self.lease_seconds):
+                return False
+            self.job(db)
+            db.commit()
+            return True
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Error en la tarea programada %s", self.name)
+            self._stop.wait(self.interval)
+
+
+# --- MongoDB ---
+
+async def acquire_mongo_lease(name: str, owner: str, seconds: int) -> bool:
+    from pymongo.errors import DuplicateKeyError
+    from app.mongodb import get_database
+
+    now = datetime.utcnow()
+    try:
+        await get_database()[LEASES_COLLECTION].update_one(
+            {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # El lease existe, es de otro proceso y sigue vigente
+        return False
+    return True
+
+
+class AsyncLeasedJob:
+    """Equivalente de LeasedJob para el backend MongoDB: una tarea asyncio en el loop de la app"""
+
+    def __init__(
+        self,
+        name: str,
+        job: Callable[[], Awaitable[None]],
+        interval_seconds: float,
+        lease_seconds: Optional[int] = None,
+    ):
+        self.name = name
+        self.job = job
+        self.interval = interval_seconds
+        self.lease_seconds = lease_seconds or max(60, int(interval_seconds * 3))
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=f"job-{self.name}")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self) -> bool:
+        if not await acquire_mongo_lease(self.name, PROCESS_OWNER, self.lease_seconds):
+            return False
+        await self.job()
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error en la tarea programada %s", self.name)
+            await asyncio.sleep(self.interval)
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 from decimal import Decimal
 
 # ===== Vehicle Schemas =====
@@ -55,6 +55,8 @@ class VehicleOut(VehicleBase):
 class VehicleListOut(BaseModel):
     vehicles: List[VehicleOut]
     total: int
+    # Conteos por vehicle_type, capacity, price_per_day y features (ver app/vehicle_catalog.py)
+    facets: Optional[Dict[str, List[dict]]] = None
 
 
 # ===== Reservation Schemas =====
@@ -95,6 +97,7 @@ class ReservationUpdate(BaseModel):
 
 class ReservationOut(BaseModel):
     id: str  # MongoDB usa string IDs
+    folio: Optional[str] = None
     user_id: str
     vehicle_id: str
     start_date: datetime
@@ -132,3 +135,129 @@ class ReservationStats(BaseModel):
     completed_reservations: int
     cancelled_reservations: int
     total_spent: float
+
+
+# ===== Quote Schemas =====
+
+QUOTE_MAX_VEHICLES = 200
+
+
+class QuoteRequest(BaseModel):
+    start_date: datetime
+    end_date: datetime
+    # Vehículos a cotizar; sin lista se cotiza el resultado de los filtros
+    vehicle_ids: Optional[List[str]] = Field(None, max_length=QUOTE_MAX_VEHICLES)
+    promotion_id: Optional[str] = Field(None, description="ID de promocion activa")
+    vehicle_type: Optional[str] = None
+    min_capacity: Optional[int] = Field(None, ge=1)
+    max_price: Optional[float] = Field(None, gt=0)
+    features: Optional[List[str]] = None
+
+    @field_validator('end_date')
+    @classmethod
+    def validate_dates(cls, end_date, info):
+        if 'start_date' in info.data:
+            start_date = info.data['start_date']
+            if end_date <= start_date:
+                raise ValueError('La fecha de fin debe ser posterior a la fecha de inicio')
+        return end_date
+
+
+# ===== Batch Reservation Schemas =====
+
+RESERVATION_BATCH_MAX_ITEMS = 100
+BATCH_MODES = {"all_or_nothing", "best_effort"}
+
+
+class ReservationBatchItem(BaseModel):
+    vehicle_id: str  # MongoDB usa string IDs
+    start_date: datetime
+    end_date: datetime
+    # Sin valor se usan los del lote
+    pickup_location: Optional[str] = Field(None, min_length=3, max_length=200)
+    return_location: Optional[str] = Field(None, max_length=200)
+    notes: Optional[str] = None
+
+    @field_validator('end_date')
+    @classmethod
+    def validate_dates(cls, end_date, info):
+        if 'start_date' in info.data:
+            start_date = info.data['start_date']
+            if end_date <= start_date:
+                raise ValueError('La fecha de fin debe ser posterior a la fecha de inicio')
+        return end_date
+
+
+class ReservationBatchCreate(BaseModel):
+    items: List[ReservationBatchItem] = Field(..., min_length=1, max_length=RESERVATION_BATCH_MAX_ITEMS)
+    mode: str = Field("all_or_nothing", description="all_or_nothing o best_effort")
+    promotion_id: Optional[str] = Field(None, description="ID de promocion activa")
+    payment_method: Optional[str] = Field(None, description="efectivo, tarjeta, msi, cheque, deposito")
+    payment_reference: Optional[str] = Field(None, max_length=255)
+    payment_notes: Optional[str] = Field(None, max_length=1500)
+    pickup_location: Optional[str] = Field(None, min_length=3, max_length=200)
+    return_location: Optional[str] = Field(None, max_length=200)
+    notes: Optional[str] = None
+
+    @field_validator('mode')
+    @classmethod
+    def validate_mode(cls, value):
+        normalized = value.strip().lower()
+        if normalized not in BATCH_MODES:
+            raise ValueError("Modo invalido: all_or_nothing o best_effort")
+        return normalized
+
+    @model_validator(mode='after')
+    def validate_pickup_locations(self):
+        if not self.pickup_location and any(not item.pickup_location for item in self.items):
+            raise ValueError("Indica pickup_location en el lote o en cada vehiculo")
+        return self
+
+
+# ===== Proyecciones directas (endpoints de listas con FastJSONResponse) =====
+
+def vehicle_out_dict(vehicle) -> dict:
+    """Mismo contenido que VehicleOut, construido sin pasar por Pydantic"""
+    return {
+        "brand": vehicle.brand,
+        "model": vehicle.model,
+        "year": vehicle.year,
+        "vehicle_type": vehicle.vehicle_type,
+        "capacity": vehicle.capacity,
+        "plate": vehicle.plate,
+        "color": vehicle.color,
+        "price_per_day": float(vehicle.price_per_day),
+        "price_per_hour": float(vehicle.price_per_hour) if vehicle.price_per_hour is not None else None,
+        "description": vehicle.description,
+        "features": vehicle.features,
+        "image_url": vehicle.image_url,
+        "id": str(vehicle.id),
+        "status": vehicle.status,
+        "is_active": vehicle.is_active,
+        "created_at": vehicle.created_at,
+        "updated_at": vehicle.updated_at,
+    }
+
+
+def reservation_out_dict(reservation, vehicle=None, user_name: Optional[str] = None) -> dict:
+    """Mismo contenido que ReservationOut, construido sin pasar por Pydantic"""
+    return {
+        "id": str(reservation.id),
+        "folio": reservation.folio,
+        "user_id": reservation.user_id,
+        "vehicle_id": reservation.vehicle_id,
+        "start_date": reservation.start_date,
+        "end_date": reservation.end_date,
+        "pickup_location": reservation.pickup_location,
+        "return_location": reservation.return_location,
+        "total_days": reservation.total_days,
+        "price_per_day": float(reservation.price_per_day),
+        "total_price": float(reservation.total_price),
+        "status": reservation.status,
+        "notes": reservation.notes,
+        "created_at": reservation.created_at,
+        "updated_at": reservation.updated_at,
+        "cancelled_at": reservation.cancelled_at,
+        "vehicle": vehicle_out_dict(vehicle) if vehicle else None,
+        "user_name": user_name,
+    }
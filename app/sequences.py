@@ -0,0 +1,150 @@
+"""
+Secuencias numéricas compartidas por los workers (folios de reservación, números de factura).
+
+El contador vive en la tabla sequence_counters (SQL) o en la colección "counters"
+(MongoDB). Cada proceso no toma un número por reservación sino un bloque de
+SEQUENCE_BLOCK_SIZE con un solo incremento atómico, y lo reparte en memoria. Así no
+se depende del autoincremento (ni de un flush a media transacción para conocerlo) y
+dos workers nunca entregan el mismo número.
+
+Los números son únicos pero no consecutivos: al reiniciar un proceso se pierde lo
+que le quedaba del bloque, y una reservación que falla no devuelve su folio.
+
+El bloque se pide en una conexión propia que confirma de inmediato. Con SQLite hay
+que pedir los números antes de que la transacción del request escriba; si no, la
+conexión del contador espera el lock que tiene el propio request.
+"""
+import asyncio
+import os
+import threading
+from typing import List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.db import engine
+from app.db_models import Reservation, SequenceCounter
+
+SEQUENCE_BLOCK_SIZE = int(os.getenv("SEQUENCE_BLOCK_SIZE", "50"))
+COUNTERS_COLLECTION = "counters"
+
+RESERVATION_FOLIO = "reservation_folio"
+INVOICE_NUMBER = "invoice_number"
+
+
+def build_reservation_folio(number: int) -> str:
+    return f"VT-{number:04d}"
+
+
+class _Block:
+    """Rango [next, end] ya reservado en el contador"""
+
+    def __init__(self):
+        self.next = 1
+        self.end = 0
+
+    def take(self, count: int) -> List[int]:
+        taken = list(range(self.next, min(self.end, self.next + count - 1) + 1))
+        self.next += len(taken)
+        return taken
+
+    def refill(self, last: int, size: int) -> None:
+        self.next, self.end = last - size + 1, last
+
+
+class SequenceAllocator:
+    """Secuencia del backend SQL; compartida por los hilos del proceso"""
+
+    def __init__(self, name: str, block_size: int = SEQUENCE_BLOCK_SIZE):
+        self.name = name
+        self.block_size = block_size
+        self._block = _Block()
+        self._lock = threading.Lock()
+
+    def _reserve(self, size: int) -> int:
+        """Incrementa el contador en `size` y devuelve el último número del bloque"""
+        table = SequenceCounter.__table__
+        stmt = sqlite_insert(table).values(name=self.name, value=size)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={"value": table.c.value + size},
+        ).returning(table.c.value)
+        with engine.begin() as conn:
+            return conn.execute(stmt).scalar_one()
+
+    def next_many(self, count: int) -> List[int]:
+        numbers: List[int] = []
+        with self._lock:
+            while len(numbers) < count:
+                numbers.extend(self._block.take(count - len(numbers)))
+                if len(numbers) < count:
+                    # Un lote grande pide de una vez todo lo que falta
+                    size = max(self.block_size, count - len(numbers))
+                    self._block.refill(self._reserve(size), size)
+        return numbers
+
+    def next(self) -> int:
+        return self.next_many(1)[0]
+
+
+reservation_folios = SequenceAllocator(RESERVATION_FOLIO)
+invoice_numbers = SequenceAllocator(INVOICE_NUMBER)
+
+
+def ensure_sequences() -> None:
+    """
+    Los folios y números de factura anteriores salían del id de la reservación: las
+    secuencias arrancan después del id más alto para no repetirlos.
+    """
+    table = SequenceCounter.__table__
+    with engine.begin() as conn:
+        floor = conn.execute(select(func.coalesce(func.max(Reservation.__table__.c.id), 0))).scalar_one()
+        for name in (RESERVATION_FOLIO, INVOICE_NUMBER):
+            stmt = sqlite_insert(table).values(name=name, value=floor)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.name],
+                set_={"value": func.max(table.c.value, stmt.excluded.value)},
+            )
+            conn.execute(stmt)
+
+
+# --- MongoDB ---
+
+class MongoSequenceAllocator:
+    """Misma secuencia sobre la colección "counters" ($inc atómico con upsert)"""
+
+    def __init__(self, name: str, block_size: int = SEQUENCE_BLOCK_SIZE):
+        self.name = name
+        self.block_size = block_size
+        self._block = _Block()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def _reserve(self, size: int) -> int:
+        from pymongo import ReturnDocument
+        from app.mongodb import get_database
+
+        doc = await get_database()[COUNTERS_COLLECTION].find_one_and_update(
+            {"_id": self.name},
+            {"$inc": {"value": size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc["value"]
+
+    async def next_many(self, count: int) -> List[int]:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        numbers: List[int] = []
+        async with self._lock:
+            while len(numbers) < count:
+                numbers.extend(self._block.take(count - len(numbers)))
+                if len(numbers) < count:
+                    size = max(self.block_size, count - len(numbers))
+                    self._block.refill(await self._reserve(size), size)
+        return numbers
+
+    async def next(self) -> int:
+        return (await self.next_many(1))[0]
+
+
+mongo_reservation_folios = MongoSequenceAllocator(RESERVATION_FOLIO)
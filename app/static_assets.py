@@ -0,0 +1,123 @@
+"""
+Assets estáticos: manifest de archivos con fingerprint y servidor de variantes precomprimidas
+"""
+import json
+import os
+import re
+from functools import lru_cache
+from mimetypes import guess_type
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+APP_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = APP_DIR.parent
+STATIC_DIR = PROJECT_ROOT / "static"
+DIST_DIR = STATIC_DIR / "dist"
+MANIFEST_PATH = DIST_DIR / "manifest.json"
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+# nombre.<hash de 10 hex>.ext, generado por scripts/build_static.py
+FINGERPRINT_REGEX = re.compile(r"\.[0-9a-f]{10}\.[A-Za-z0-9]+$")
+
+# Orden de preferencia de las variantes precomprimidas
+ENCODING_SUFFIXES = (("br", ".br"), ("gzip", ".gz"))
+
+
+@lru_cache(maxsize=1)
+def load_manifest() -> Dict[str, str]:
+    """Lee el manifest generado por el build; vacío si no se ha corrido el build"""
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(name: str) -> str:
+    """URL pública de un asset, usando su versión con fingerprint si existe"""
+    return f"/static/{load_manifest().get(name, name)}"
+
+
+def page_path(name: str) -> Path:
+    """Ruta de una página HTML estática; prefiere la versión reescrita por el build"""
+    built = DIST_DIR / name
+    if name in load_manifest() and built.is_file():
+        return built
+    return STATIC_DIR / name
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    encodings = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[token.strip().lower()] = quality
+    return encodings
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles que sirve `archivo.br` / `archivo.gz` cuando el cliente los acepta,
+    con Cache-Control immutable para archivos con fingerprint y ETag/304 para todos.
+    """
+
+    def select_variant(self, full_path: str, accept_encoding: str) -> Tuple[Optional[str], str]:
+        if not accept_encoding:
+            return None, full_path
+
+        accepted = accepted_encodings(accept_encoding)
+        for encoding, suffix in ENCODING_SUFFIXES:
+            if accepted.get(encoding, accepted.get("*", 0)) <= 0:
+                continue
+            candidate = full_path + suffix
+            if os.path.isfile(candidate):
+                return encoding, candidate
+        return None, full_path
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+
+        encoding, served_path = self.select_variant(full_path, request_headers.get("accept-encoding", ""))
+        if served_path != full_path:
+            stat_result = os.stat(served_path)
+
+        headers = {
+            "Cache-Control": (
+                IMMUTABLE_CACHE_CONTROL if FINGERPRINT_REGEX.search(full_path) else REVALIDATE_CACHE_CONTROL
+            ),
+            "Vary": "Accept-Encoding",
+        }
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        response = FileResponse(
+            served_path,
+            status_code=status_code,
+            stat_result=stat_result,
+            media_type=guess_type(full_path)[0] or "text/plain",
+            headers=headers,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,80 @@
+"""
+Contadores de versión por tabla/colección.
+
+Cada escritura incrementa el contador de las tablas afectadas dentro de la misma
+transacción (SQL) o justo después de la escritura (MongoDB). Los endpoints de solo
+lectura los usan para calcular ETags sin volver a consultar ni serializar los datos,
+y los workers los comparan para saber si sus caches locales siguen vigentes.
+"""
+from typing import Dict, Iterable
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.db_models import TableVersion
+
+VERSIONS_COLLECTION = "table_versions"
+
+
+def _touched_tables(session: Session) -> set:
+    tables = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table and table != TableVersion.__tablename__:
+            tables.add(table)
+    return tables
+
+
+def bump_table_versions(session: Session, tables: Iterable[str]) -> None:
+    """Incrementa (o crea) el contador de cada tabla dentro de la transacción actual"""
+    for table in sorted(set(tables)):
+        stmt = sqlite_insert(TableVersion).values(name=table, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TableVersion.name],
+            set_={"version": TableVersion.version + 1},
+        )
+        session.connection().execute(stmt)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_touched_tables(session: Session, flush_context, instances) -> None:
+    session.info.setdefault("touched_tables", set()).update(_touched_tables(session))
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _bump_touched_tables(session: Session, flush_context) -> None:
+    tables = session.info.pop("touched_tables", None)
+    if tables:
+        bump_table_versions(session, tables)
+
+
+def get_table_versions(db: Session, tables: Iterable[str]) -> Dict[str, int]:
+    names = sorted(set(tables))
+    rows = db.execute(
+        select(TableVersion.name, TableVersion.version).where(TableVersion.name.in_(names))
+    ).all()
+    versions = {name: 0 for name in names}
+    versions.update({name: version for name, version in rows})
+    return versions
+
+
+# --- MongoDB ---
+
+async def bump_collection_versions(*collections: str) -> None:
+    from app.mongodb import get_database
+
+    versions = get_database()[VERSIONS_COLLECTION]
+    for collection in collections:
+        await versions.update_one({"_id": collection}, {"$inc": {"version": 1}}, upsert=True)
+
+
+async def get_collection_versions(collections: Iterable[str]) -> Dict[str, int]:
+    from app.mongodb import get_database
+
+    names = sorted(set(collections))
+    versions = {name: 0 for name in names}
+    cursor = get_database()[VERSIONS_COLLECTION].find({"_id": {"$in": names}})
+    async for doc in cursor:
+        versions[doc["_id"]] = int(doc.get("version", 0))
+    return versions
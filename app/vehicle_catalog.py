@@ -0,0 +1,265 @@
+"""
+Catálogo de vehículos en memoria.
+
+La flota solo cambia con ediciones del admin (y las transiciones automáticas de
+estado), pero las búsquedas son casi todo el tráfico. Cada worker guarda una
+instantánea inmutable de todos los vehículos, ya convertidos a dict de salida, con
+índices secundarios por tipo, capacidad, precio y características.
+
+La instantánea lleva la versión de "vehicles" (app/table_versions.py) con la que se
+construyó. Los endpoints ya leen ese contador para el ETag y lo pasan aquí: si otro
+worker escribió, el contador avanzó y la instantánea se reconstruye; si no, la
+consulta no toca la base de datos. Las escrituras del propio proceso llaman además
+a invalidate().
+"""
+import asyncio
+import bisect
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.db_models import Vehicle
+from app.schemas_reservations import vehicle_out_dict
+from app.table_versions import get_collection_versions, get_table_versions
+from app.vehicle_features import load_vehicle_features, parse_features
+
+BOOKABLE_STATUS = "available"
+
+# Rangos de las facetas numéricas (etiqueta, min, max): min <= valor < max, el último sin tope
+CAPACITY_BUCKETS = (("1-4", 1, 5), ("5-8", 5, 9), ("9-12", 9, 13), ("13+", 13, None))
+PRICE_BUCKETS = (
+    ("0-99", 0, 100), ("100-149", 100, 150), ("150-199", 150, 200),
+    ("200-299", 200, 300), ("300+", 300, None),
+)
+
+
+def _bucket_index(value: float, buckets: tuple) -> int:
+    for index, (_, _, high) in enumerate(buckets):
+        if high is None or value < high:
+            return index
+    return len(buckets) - 1
+
+
+class CatalogSnapshot:
+    """Vehículos ordenados por precio; las posiciones en esa lista son los ids internos"""
+
+    def __init__(self, version: int, entries: Iterable[Tuple[Any, float, List[str], dict]]):
+        rows = sorted(entries, key=lambda row: (row[1], str(row[0])))
+        self.version = version
+        self.vehicles: List[dict] = [row[3] for row in rows]
+        self._prices: List[float] = [row[1] for row in rows]
+        self._by_id: Dict[Any, int] = {row[0]: position for position, row in enumerate(rows)}
+
+        self._bookable: List[int] = [
+            position for position, vehicle in enumerate(self.vehicles)
+            if vehicle["is_active"] and vehicle["status"] == BOOKABLE_STATUS
+        ]
+        self._bookable_set = set(self._bookable)
+
+        self._by_type: Dict[str, List[int]] = {}
+        for position, vehicle in enumerate(self.vehicles):
+            self._by_type.setdefault(vehicle["vehicle_type"], []).append(position)
+
+        by_capacity = sorted((vehicle["capacity"] or 0, position) for position, vehicle in enumerate(self.vehicles))
+        self._capacities: List[int] = [item[0] for item in by_capacity]
+        self._capacity_positions: List[int] = [item[1] for item in by_capacity]
+
+        self._capacity_bucket = [_bucket_index(vehicle["capacity"] or 0, CAPACITY_BUCKETS) for vehicle in self.vehicles]
+        self._price_bucket = [_bucket_index(price, PRICE_BUCKETS) for price in self._prices]
+        self._features: List[List[str]] = [row[2] for row in rows]
+        self._by_feature: Dict[str, set] = {}
+        for position, features in enumerate(self._features):
+            for feature in features:
+                self._by_feature.setdefault(feature, set()).add(position)
+
+        self.vehicle_types: List[str] = sorted(
+            {vehicle["vehicle_type"] for vehicle in self.vehicles if vehicle["is_active"]}
+        )
+
+    def __len__(self) -> int:
+        return len(self.vehicles)
+
+    def get(self, vehicle_id) -> Optional[dict]:
+        position = self._by_id.get(vehicle_id)
+        return self.vehicles[position] if position is not None else None
+
+    def _positions(
+        self,
+        vehicle_type: Optional[str] = None,
+        min_capacity: Optional[int] = None,
+        max_price: Optional[float] = None,
+        available_only: bool = True,
+        features: Optional[List[str]] = None,
+    ):
+        if vehicle_type:
+            positions = self._by_type.get(vehicle_type, [])
+        elif available_only:
+            positions = self._bookable
+        else:
+            positions = range(len(self.vehicles))
+
+        # Las posiciones van en orden de precio: el tope es un corte con bisect
+        if max_price:
+            cut = bisect.bisect_right(self._prices, max_price)
+            positions = positions[:bisect.bisect_left(positions, cut)]
+
+        if vehicle_type and available_only:
+            positions = [position for position in positions if position in self._bookable_set]
+
+        if min_capacity:
+            start = bisect.bisect_left(self._capacities, min_capacity)
+            fits = set(self._capacity_positions[start:])
+            positions = [position for position in positions if position in fits]
+
+        # Todas las características pedidas (AND), empezando por la menos común
+        if features:
+            for feature in sorted(features, key=lambda key: len(self._by_feature.get(key, ()))):
+                having = self._by_feature.get(feature, set())
+                positions = [position for position in positions if position in having]
+
+        return positions
+
+    def query(
+        self,
+        vehicle_type: Optional[str] = None,
+        min_capacity: Optional[int] = None,
+        max_price: Optional[float] = None,
+        available_only: bool = True,
+        features: Optional[List[str]] = None,
+    ) -> List[dict]:
+        """Mismos filtros que la consulta original, resultado ordenado por precio por día"""
+        positions = self._positions(vehicle_type, min_capacity, max_price, available_only, features)
+        return [self.vehicles[position] for position in positions]
+
+    def facets(
+        self,
+        vehicle_type: Optional[str] = None,
+        min_capacity: Optional[int] = None,
+        max_price: Optional[float] = None,
+        available_only: bool = True,
+        features: Optional[List[str]] = None,
+    ) -> Dict[str, List[dict]]:
+        """
+        Conteos para armar los filtros de la página de resultados. Cada faceta se
+        cuenta con los demás filtros aplicados pero no el suyo, para que al elegir
+        un tipo sigan apareciendo los otros con su cantidad. Las características se
+        combinan con AND, así que su faceta sí cuenta sobre el resultado filtrado.
+        """
+        by_type = Counter(
+            self.vehicles[position]["vehicle_type"]
+            for position in self._positions(None, min_capacity, max_price, available_only, features)
+        )
+        by_capacity = Counter(
+            self._capacity_bucket[position]
+            for position in self._positions(vehicle_type, None, max_price, available_only, features)
+        )
+        by_price = Counter(
+            self._price_bucket[position]
+            for position in self._positions(vehicle_type, min_capacity, None, available_only, features)
+        )
+        by_feature = Counter(
+            feature
+            for position in self._positions(vehicle_type, min_capacity, max_price, available_only, features)
+            for feature in self._features[position]
+        )
+
+        def ranges(buckets, counts):
+            return [
+                {"value": label, "min": low, "max": high, "count": counts.get(index, 0)}
+                for index, (label, low, high) in enumerate(buckets)
+            ]
+
+        def values(counts):
+            return [
+                {"value": value, "count": count}
+                for value, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+            ]
+
+        return {
+            "vehicle_type": values(by_type),
+            "capacity": ranges(CAPACITY_BUCKETS, by_capacity),
+            "price_per_day": ranges(PRICE_BUCKETS, by_price),
+            "features": values(by_feature),
+        }
+
+
+def _load_sql_snapshot(db: Session, version: int) -> "CatalogSnapshot":
+    features = load_vehicle_features(db)
+    return CatalogSnapshot(version, (
+        (vehicle.id, float(vehicle.price_per_day or 0), features.get(vehicle.id, []), vehicle_out_dict(vehicle))
+        for vehicle in db.query(Vehicle).all()
+    ))
+
+
+class VehicleCatalog:
+    """Catálogo del backend SQL; compartido por los hilos del worker"""
+
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        self._snapshot = None
+
+    def get(self, db: Session, version: Optional[int] = None) -> CatalogSnapshot:
+        if version is None:
+            version = get_table_versions(db, ["vehicles"])["vehicles"]
+
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version >= version:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version < version:
+                snapshot = _load_sql_snapshot(db, version)
+                self._snapshot = snapshot
+        return snapshot
+
+
+vehicle_catalog = VehicleCatalog()
+
+
+# --- MongoDB ---
+
+def _mongo_entry(vehicle) -> Tuple[str, float, List[str], dict]:
+    from app.schemas_reservations_mongo import vehicle_out_dict as mongo_vehicle_out_dict
+
+    features = vehicle.feature_keys or parse_features(vehicle.features)
+    return str(vehicle.id), float(vehicle.price_per_day or 0), features, mongo_vehicle_out_dict(vehicle)
+
+
+class MongoVehicleCatalog:
+    """Catálogo del backend MongoDB; una sola recarga concurrente por worker"""
+
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def invalidate(self) -> None:
+        self._snapshot = None
+
+    async def get(self, version: Optional[int] = None) -> CatalogSnapshot:
+        from app.mongodb_models import Vehicle as VehicleDocument
+
+        if version is None:
+            version = (await get_collection_versions(["vehicles"]))["vehicles"]
+
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version >= version:
+            return snapshot
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version < version:
+                vehicles = await VehicleDocument.find_all().to_list()
+                snapshot = CatalogSnapshot(version, (_mongo_entry(vehicle) for vehicle in vehicles))
+                self._snapshot = snapshot
+        return snapshot
+
+
+mongo_vehicle_catalog = MongoVehicleCatalog()
@@ -0,0 +1,139 @@
+"""
+Características de los vehículos como datos estructurados.
+
+Vehicle.features sigue siendo el JSON que devuelve la API ('{"ac": true, "gps": true}'),
+pero cada clave activa también se guarda normalizada:
+  - SQL: tabla vehicle_features (vehicle_id, feature), sincronizada en el flush;
+  - MongoDB: arreglo feature_keys en el documento, con índice multikey.
+El catálogo en memoria (app/vehicle_catalog.py) arma su índice invertido a partir de
+esas filas, sin parsear el texto de cada vehículo.
+"""
+import json
+import re
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, event, inspect, insert, select
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.db_models import Vehicle, VehicleFeature
+
+FEATURE_SYNC_BATCH_SIZE = 500
+MAX_FEATURE_FILTERS = 10
+
+_NON_KEY_CHARS = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_feature(value) -> str:
+    """'Leather Seats' -> 'leather_seats'; las claves del seed ya vienen así"""
+    return _NON_KEY_CHARS.sub("_", str(value).strip().lower()).strip("_")
+
+
+def parse_features(raw: Optional[str]) -> List[str]:
+    """Claves activas del JSON de características ('{"ac": true, ...}'); tolera listas"""
+    if not raw:
+        return []
+    try:
+        data = json.loads(raw)
+    except (TypeError, ValueError):
+        return []
+    if isinstance(data, dict):
+        keys = (key for key, enabled in data.items() if enabled)
+    elif isinstance(data, list):
+        keys = (item for item in data if item)
+    else:
+        return []
+    return sorted({key for key in map(normalize_feature, keys) if key})
+
+
+def parse_feature_filter(values: Optional[List[str]]) -> List[str]:
+    """Acepta ?features=ac&features=gps y ?features=ac,gps"""
+    if not values:
+        return []
+    keys = {normalize_feature(part) for value in values for part in value.split(",")}
+    return sorted(key for key in keys if key)[:MAX_FEATURE_FILTERS]
+
+
+def sync_vehicle_features(session: Session, vehicle_ids: Iterable[int]) -> None:
+    """Reescribe las filas de vehicle_features de esos vehículos desde Vehicle.features"""
+    ids = sorted({vehicle_id for vehicle_id in vehicle_ids if vehicle_id is not None})
+    if not ids:
+        return
+
+    connection = session.connection()
+    vehicles = Vehicle.__table__
+    for start in range(0, len(ids), FEATURE_SYNC_BATCH_SIZE):
+        chunk = ids[start:start + FEATURE_SYNC_BATCH_SIZE]
+        connection.execute(delete(VehicleFeature.__table__).where(VehicleFeature.__table__.c.vehicle_id.in_(chunk)))
+        rows = [
+            {"vehicle_id": vehicle_id, "feature": feature}
+            for vehicle_id, raw in connection.execute(
+                select(vehicles.c.id, vehicles.c.features).where(vehicles.c.id.in_(chunk))
+            )
+            for feature in parse_features(raw)
+        ]
+        if rows:
+            connection.execute(insert(VehicleFeature.__table__), rows)
+
+
+def load_vehicle_features(db: Session) -> Dict[int, List[str]]:
+    features: Dict[int, List[str]] = {}
+    rows = db.execute(
+        select(VehicleFeature.vehicle_id, VehicleFeature.feature)
+        .order_by(VehicleFeature.vehicle_id, VehicleFeature.feature)
+    )
+    for vehicle_id, feature in rows:
+        features.setdefault(vehicle_id, []).append(feature)
+    return features
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_vehicle_features(session: Session, flush_context) -> None:
+    vehicle_ids = session.info.setdefault("feature_vehicle_ids", set())
+    for obj in session.new:
+        if isinstance(obj, Vehicle):
+            vehicle_ids.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Vehicle) and inspect(obj).attrs.features.history.has_changes():
+            vehicle_ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Vehicle):
+            vehicle_ids.add(obj.id)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _sync_vehicle_features(session: Session, flush_context) -> None:
+    vehicle_ids = session.info.pop("feature_vehicle_ids", None)
+    if vehicle_ids:
+        sync_vehicle_features(session, vehicle_ids)
+
+
+def ensure_vehicle_features() -> None:
+    """Llena vehicle_features desde el JSON existente si la tabla está vacía"""
+    db = SessionLocal()
+    try:
+        if db.query(VehicleFeature.vehicle_id).first() is not None:
+            return
+        sync_vehicle_features(db, db.execute(select(Vehicle.id)).scalars().all())
+        db.commit()
+    finally:
+        db.close()
+
+
+# --- MongoDB ---
+
+async def ensure_mongo_vehicle_features() -> None:
+    """Agrega feature_keys a los vehículos que aún no lo tienen (datos migrados o importados)"""
+    from app.mongodb_models import Vehicle as VehicleDocument
+    from app.table_versions import bump_collection_versions
+
+    collection = VehicleDocument.get_motor_collection()
+    updated = 0
+    async for doc in collection.find({"feature_keys": {"$exists": False}}, {"features": 1}):
+        await collection.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"feature_keys": parse_features(doc.get("features"))}},
+        )
+        updated += 1
+    if updated:
+        await bump_collection_versions("vehicles")
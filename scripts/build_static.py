@@ -0,0 +1,119 @@
+"""
+Build de assets estáticos: minifica JS/CSS, agrega fingerprint al nombre y genera
+variantes .gz y .br en static/dist, junto con un manifest.json y las páginas HTML
+reescritas para apuntar a los archivos con fingerprint.
+
+Uso: python -m scripts.build_static
+"""
+import gzip
+import hashlib
+import json
+import re
+import shutil
+
+from app.static_assets import DIST_DIR, MANIFEST_PATH, STATIC_DIR
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se generan variantes gzip
+    brotli = None
+
+ASSET_EXTENSIONS = {".js", ".css"}
+PAGE_EXTENSIONS = {".html"}
+MIN_COMPRESS_BYTES = 512
+
+# Referencias /static/<archivo>[?v=...] dentro del HTML
+STATIC_REF_REGEX = re.compile(r"/static/([\w./-]+\.(?:js|css))(?:\?v=[\w.-]*)?")
+
+
+def minify_css(source: str) -> str:
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"\s+", " ", source)
+    source = re.sub(r"\s*([{};,>])\s*", r"\1", source)
+    source = re.sub(r":\s+", ":", source)
+    return source.replace(";}", "}").strip()
+
+
+def minify_js(source: str) -> str:
+    """Minificación conservadora: quita indentación, líneas vacías y comentarios de línea completa"""
+    lines = []
+    in_block_comment = False
+    for raw_line in source.splitlines():
+        line = raw_line.strip()
+        if in_block_comment:
+            if "*/" in line:
+                in_block_comment = False
+            continue
+        if line.startswith("/*") and "*/" not in line:
+            in_block_comment = True
+            continue
+        if not line or line.startswith("//") or (line.startswith("/*") and line.find("*/") == len(line) - 2):
+            continue
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def fingerprint(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()[:10]
+
+
+def write_variants(path, content: bytes) -> None:
+    path.write_bytes(content)
+    if len(content) < MIN_COMPRESS_BYTES:
+        return
+    path.with_name(path.name + ".gz").write_bytes(gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        path.with_name(path.name + ".br").write_bytes(brotli.compress(content, quality=11))
+
+
+def build_assets() -> dict:
+    manifest = {}
+    for source_path in sorted(STATIC_DIR.iterdir()):
+        if not source_path.is_file() or source_path.suffix not in ASSET_EXTENSIONS:
+            continue
+
+        text = source_path.read_text(encoding="utf-8")
+        minified = minify_css(text) if source_path.suffix == ".css" else minify_js(text)
+        content = minified.encode("utf-8")
+
+        hashed_name = f"{source_path.stem}.{fingerprint(content)}{source_path.suffix}"
+        write_variants(DIST_DIR / hashed_name, content)
+        manifest[source_path.name] = f"dist/{hashed_name}"
+
+        print(f"  {source_path.name}: {len(text.encode('utf-8'))} -> {len(content)} bytes ({hashed_name})")
+    return manifest
+
+
+def build_pages(manifest: dict) -> dict:
+    pages = {}
+    for source_path in sorted(STATIC_DIR.iterdir()):
+        if not source_path.is_file() or source_path.suffix not in PAGE_EXTENSIONS:
+            continue
+
+        html = source_path.read_text(encoding="utf-8")
+        rewritten = STATIC_REF_REGEX.sub(
+            lambda match: f"/static/{manifest.get(match.group(1), match.group(1))}",
+            html,
+        )
+        write_variants(DIST_DIR / source_path.name, rewritten.encode("utf-8"))
+        pages[source_path.name] = f"dist/{source_path.name}"
+    return pages
+
+
+def main() -> None:
+    if DIST_DIR.exists():
+        shutil.rmtree(DIST_DIR)
+    DIST_DIR.mkdir(parents=True)
+
+    print("🔨 Generando assets estáticos...")
+    manifest = build_assets()
+    manifest.update(build_pages(manifest))
+
+    MANIFEST_PATH.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    if brotli is None:
+        print("⚠️  Paquete 'brotli' no instalado: solo se generaron variantes gzip.")
+    print(f"✅ {len(manifest)} archivos escritos en {DIST_DIR}")
+
+
+if __name__ == "__main__":
+    main()
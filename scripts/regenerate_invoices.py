@@ -0,0 +1,41 @@
+"""
+Regenera las facturas (PDF y XML) de un rango de fechas sin pasar por la API.
+
+Crea las facturas que falten de las reservaciones hechas en el rango y vuelve a
+generar los documentos de las facturas emitidas en él, con varios hilos.
+
+Uso:
+    python -m scripts.regenerate_invoices --from 2025-01-01 --to 2025-01-31 [--workers 4]
+"""
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from app.db import SessionLocal, ensure_invoice_document_columns
+from app.invoicing import INVOICE_STORAGE_DIR, process_reservation, regenerate_invoices
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from", dest="start_date", type=date.fromisoformat, required=True)
+    parser.add_argument("--to", dest="end_date", type=date.fromisoformat, required=True)
+    parser.add_argument("--workers", type=int, default=4)
+    options = parser.parse_args()
+    if options.end_date < options.start_date:
+        parser.error("--to debe ser igual o posterior a --from")
+
+    ensure_invoice_document_columns()
+    with SessionLocal() as db:
+        reservation_ids = regenerate_invoices(db, options.start_date, options.end_date)
+        db.commit()
+
+    print(f"🧾 {len(reservation_ids)} facturas a generar en {INVOICE_STORAGE_DIR.resolve()}")
+    with ThreadPoolExecutor(max_workers=max(1, options.workers)) as executor:
+        results = Counter(executor.map(process_reservation, reservation_ids))
+    for document_status, count in sorted(results.items(), key=lambda item: str(item[0])):
+        print(f"   {document_status}: {count}")
+
+
+if __name__ == "__main__":
+    main()
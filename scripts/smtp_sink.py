@@ -0,0 +1,132 @@
+"""
+Servidor SMTP local para probar el envío de campañas del newsletter.
+
+Acepta todos los mensajes y solo los cuenta (o los guarda como .eml con --save-dir).
+Con --reject-domain se responde 550 a esos destinatarios y con --tempfail-rate se
+responde 451 a una fracción de los RCPT, para probar fallos permanentes y reintentos.
+
+Uso:
+    python -m scripts.smtp_sink --port 1025 [--save-dir /tmp/newsletter] [--reject-domain example.org]
+"""
+import argparse
+import asyncio
+import random
+import time
+from pathlib import Path
+
+stats = {"connections": 0, "messages": 0, "rejected": 0, "tempfailed": 0}
+
+
+class SinkSession:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, options):
+        self.reader = reader
+        self.writer = writer
+        self.options = options
+        self.reset()
+
+    def reset(self) -> None:
+        self.mail_from = None
+        self.recipients = []
+
+    async def reply(self, line: str) -> None:
+        self.writer.write(f"{line}\r\n".encode("ascii"))
+        await self.writer.drain()
+
+    async def read_data(self) -> bytes:
+        lines = []
+        while True:
+            line = await self.reader.readline()
+            if not line or line in (b".\r\n", b".\n"):
+                break
+            if line.startswith(b".."):
+                line = line[1:]
+            lines.append(line)
+        return b"".join(lines)
+
+    def store(self, data: bytes) -> None:
+        stats["messages"] += 1
+        if self.options.save_dir:
+            name = f"{time.time_ns()}-{stats['messages']}.eml"
+            (Path(self.options.save_dir) / name).write_bytes(data)
+        if stats["messages"] % 1000 == 0:
+            print(f"📨 {stats}")
+
+    async def handle(self) -> None:
+        stats["connections"] += 1
+        await self.reply("220 smtp-sink ready")
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                return
+            command, _, argument = line.decode("utf-8", "replace").strip().partition(" ")
+            command = command.upper()
+
+            if command == "EHLO":
+                self.writer.write(b"250-smtp-sink\r\n250-8BITMIME\r\n250-SMTPUTF8\r\n250 SIZE 10485760\r\n")
+                await self.writer.drain()
+            elif command == "HELO":
+                await self.reply("250 smtp-sink")
+            elif command == "MAIL":
+                self.reset()
+                self.mail_from = argument
+                await self.reply("250 OK")
+            elif command == "RCPT":
+                address = argument.partition(":")[2].strip().strip("<>").split(" ")[0].strip("<>").lower()
+                if self.options.reject_domain and address.endswith("@" + self.options.reject_domain):
+                    stats["rejected"] += 1
+                    await self.reply("550 Mailbox unavailable")
+                elif random.random() < self.options.tempfail_rate:
+                    stats["tempfailed"] += 1
+                    await self.reply("451 Try again later")
+                else:
+                    self.recipients.append(address)
+                    await self.reply("250 OK")
+            elif command == "DATA":
+                if not self.recipients:
+                    await self.reply("503 No valid recipients")
+                    continue
+                await self.reply("354 End data with <CR><LF>.<CR><LF>")
+                self.store(await self.read_data())
+                self.reset()
+                await self.reply("250 OK queued")
+            elif command == "RSET":
+                self.reset()
+                await self.reply("250 OK")
+            elif command == "NOOP":
+                await self.reply("250 OK")
+            elif command == "QUIT":
+                await self.reply("221 Bye")
+                return
+            else:
+                await self.reply("502 Command not implemented")
+
+
+async def main(options) -> None:
+    if options.save_dir:
+        Path(options.save_dir).mkdir(parents=True, exist_ok=True)
+
+    async def on_connect(reader, writer):
+        try:
+            await SinkSession(reader, writer, options).handle()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(on_connect, options.host, options.port)
+    print(f"✅ SMTP sink escuchando en {options.host}:{options.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SMTP local que acepta y descarta correos")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--save-dir", default=None, help="Guardar cada mensaje como .eml")
+    parser.add_argument("--reject-domain", default=None, help="Responder 550 a este dominio")
+    parser.add_argument("--tempfail-rate", type=float, default=0.0, help="Fracción de RCPT con 451")
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        print(f"\n📊 {stats}")
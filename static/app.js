@@ -7,7 +7,10 @@ let reviewsData = [];
 let autoRotateInterval;
 
 // Variables para autocomplete
-let ciudades = [];
+// Ciudades que ya devolvió el servidor (para validar el formulario)
+const ciudadesConocidas = new Set();
+const CITY_SUGGESTIONS_LIMIT = 8;
+const CITY_DEBOUNCE_MS = 150;
 let selectedOrigin = '';
 let selectedDestination = '';
 
@@ -25,24 +28,26 @@ function showMessage(elementId, message, type = 'success') {
 
 // ===== AUTOCOMPLETE DE CIUDADES =====
 
-// Cargar ciudades al inicio
-async function loadCities() {
-    try {
-        const response = await fetch(`${API_BASE_URL}/search/cities`);
-        const data = await response.json();
-        ciudades = data.cities;
-    } catch (error) {
-        console.error('Error al cargar ciudades:', error);
-    }
+// Buscar ciudades en el servidor (sin distinguir acentos: "queretaro" -> "Querétaro")
+async function fetchCities(query, signal) {
+    const params = new URLSearchParams({ q: query, limit: CITY_SUGGESTIONS_LIMIT });
+    const response = await fetch(`${API_BASE_URL}/search/cities?${params}`, { signal });
+    const data = await response.json();
+    data.cities.forEach(city => ciudadesConocidas.add(city));
+    return data.cities;
 }
 
 // Configurar autocomplete para un input
 function setupAutocomplete(inputId, suggestionsId, onSelectCallback) {
     const input = document.getElementById(inputId);
     const suggestionsDiv = document.getElementById(suggestionsId);
+    let debounceTimer = null;
+    let pendingRequest = null;
 
-    input.addEventListener('input', async (e) => {
+    input.addEventListener('input', (e) => {
         const query = e.target.value.trim();
+        clearTimeout(debounceTimer);
+        if (pendingRequest) pendingRequest.abort();
 
         if (query.length < 2) {
             suggestionsDiv.innerHTML = '';
@@ -50,10 +55,23 @@ function setupAutocomplete(inputId, suggestionsId, onSelectCallback) {
             return;
         }
 
-        // Filtrar ciudades localmente
-        const filtered = ciudades.filter(city =>
-            city.toLowerCase().includes(query.toLowerCase())
-        ).slice(0, 8); // Limitar a 8 sugerencias
+        // Esperar a que el usuario deje de teclear; cancelar la petición anterior
+        debounceTimer = setTimeout(() => showSuggestions(query), CITY_DEBOUNCE_MS);
+    });
+
+    async function showSuggestions(query) {
+        const controller = new AbortController();
+        pendingRequest = controller;
+
+        let filtered;
+        try {
+            filtered = await fetchCities(query, controller.signal);
+        } catch (error) {
+            if (error.name !== 'AbortError') console.error('Error al buscar ciudades:', error);
+            return;
+        }
+        if (pendingRequest !== controller) return;
+        pendingRequest = null;
 
         if (filtered.length === 0) {
             suggestionsDiv.innerHTML = '<div class="suggestion-item">No se encontraron ciudades</div>';
@@ -78,7 +96,7 @@ function setupAutocomplete(inputId, suggestionsId, onSelectCallback) {
                 if (onSelectCallback) onSelectCallback(city);
             });
         });
-    });
+    }
 
     // Cerrar sugerencias al hacer clic fuera
     document.addEventListener('click', (e) => {
@@ -90,8 +108,6 @@ function setupAutocomplete(inputId, suggestionsId, onSelectCallback) {
 
 // Inicializar autocomplete cuando cargue la página
 document.addEventListener('DOMContentLoaded', async () => {
-    await loadCities();
-
     // Configurar autocomplete para origen
     setupAutocomplete('origen', 'origenSuggestions', (city) => {
         selectedOrigin = city;
@@ -119,13 +135,13 @@ document.addEventListener('DOMContentLoaded', async () => {
                 return;
             }
 
-            // Validar que sean ciudades válidas (solo si hay ciudades cargadas)
-            if (ciudades.length > 0 && !ciudades.includes(origen)) {
+            // Validar que sean ciudades sugeridas por el servidor (si ya se consultó alguna)
+            if (ciudadesConocidas.size > 0 && !ciudadesConocidas.has(origen)) {
                 alert('Por favor selecciona una ciudad válida de origen');
                 return;
             }
 
-            if (ciudades.length > 0 && !ciudades.includes(destino)) {
+            if (ciudadesConocidas.size > 0 && !ciudadesConocidas.has(destino)) {
                 alert('Por favor selecciona una ciudad válida de destino');
                 return;
             }
@@ -180,6 +196,7 @@ function displaySearchResults(data, origen, destino, fecha, pasajeros) {
             <p style="color: white; font-size: 1.05em;">
                 📍 ${origen} → ${destino} | 📅 ${fecha} | 👥 ${pasajeros} pasajero(s)
             </p>
+            ${renderFacets(data.facets)}
         </div>
     `;
 
@@ -220,6 +237,7 @@ function displaySearchResults(data, origen, destino, fecha, pasajeros) {
                         <div class="vehicle-pricing">
                             <div class="price-main">$${vehicle.price_per_day.toFixed(2)} <span class="price-unit">/ día</span></div>
                             ${vehicle.price_per_hour ? `<div class="price-secondary">$${vehicle.price_per_hour.toFixed(2)} / hora</div>` : ''}
+                            ${vehicle.quote ? `<div class="price-secondary">Total: $${vehicle.quote.total_price.toFixed(2)} (${vehicle.quote.total_days} día(s))</div>` : ''}
                         </div>
                         <button class="btn btn-primary" onclick="selectVehicle('${vehicle.id}', '${vehicle.brand} ${vehicle.model}', ${vehicle.price_per_day})">
                             Seleccionar
@@ -236,6 +254,26 @@ function displaySearchResults(data, origen, destino, fecha, pasajeros) {
     container.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
 }
 
+// Resumen de facetas (conteos que vienen en la misma respuesta de búsqueda)
+function renderFacets(facets) {
+    if (!facets) return '';
+
+    const chips = (items) => items
+        .filter(item => item.count > 0)
+        .map(item => `<span class="vehicle-type">${item.value} (${item.count})</span>`)
+        .join(' ');
+
+    const rows = [
+        ['Tipo', facets.vehicle_type],
+        ['Precio por día', facets.price_per_day],
+        ['Equipamiento', facets.features]
+    ].filter(([, items]) => items && items.some(item => item.count > 0));
+
+    return rows.map(([label, items]) =>
+        `<p style="color: white; font-size: 0.95em;">${label}: ${chips(items)}</p>`
+    ).join('');
+}
+
 // Seleccionar vehículo
 function selectVehicle(vehicleId, vehicleName, pricePerDay) {
     const token = localStorage.getItem('access_token');
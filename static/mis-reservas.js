@@ -141,6 +141,13 @@ class ReservationsManager {
                 this.cancelReservation(reservationId);
             });
         });
+
+        document.querySelectorAll('.invoice-btn').forEach(btn => {
+            btn.addEventListener('click', (e) => {
+                const reservationId = parseInt(e.target.dataset.id);
+                this.downloadInvoice(reservationId);
+            });
+        });
     }
 
     renderReservationCard(reservation) {
@@ -222,6 +229,11 @@ class ReservationsManager {
                         Creada el ${this.formatDate(new Date(reservation.created_at))}
                     </div>
                     <div class="reservation-actions">
+                        ${reservation.invoice_number ? `
+                            <button class="btn btn-secondary invoice-btn" data-id="${reservation.id}">
+                                Descargar Factura
+                            </button>
+                        ` : ''}
                         ${canCancel ? `
                             <button class="btn btn-danger cancel-btn" data-id="${reservation.id}">
                                 Cancelar Reservación
@@ -319,6 +331,50 @@ class ReservationsManager {
         }
     }
 
+    async downloadInvoice(reservationId) {
+        try {
+            const token = localStorage.getItem('access_token');
+            const response = await fetch(`/api/reservations/${reservationId}/invoice.pdf`, {
+                headers: {
+                    'Authorization': `Bearer ${token}`
+                }
+            });
+
+            if (response.status === 401) {
+                localStorage.removeItem('access_token');
+                window.location.href = '/login';
+                return;
+            }
+
+            // 202: el worker todavía está generando el documento
+            if (response.status === 202) {
+                this.showMessage('La factura se está generando, intenta en unos segundos', 'success');
+                return;
+            }
+
+            // 409: se agotaron los intentos; un administrador debe regenerarla
+            if (response.status === 409) {
+                throw new Error('No se pudo generar la factura, contacta a soporte');
+            }
+
+            if (!response.ok) {
+                throw new Error('Error al descargar la factura');
+            }
+
+            const url = URL.createObjectURL(await response.blob());
+            const link = document.createElement('a');
+            link.href = url;
+            link.download = `factura-${reservationId}.pdf`;
+            document.body.appendChild(link);
+            link.click();
+            link.remove();
+            URL.revokeObjectURL(url);
+        } catch (error) {
+            console.error('Error downloading invoice:', error);
+            this.showMessage(error.message || 'Error al descargar la factura', 'error');
+        }
+    }
+
     showMessage(message, type) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${type}`;